@@ -0,0 +1,6 @@
+"""tools/ — плоские скрипты, импортируются по имени модуля, как при запуске python tools/x.py."""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "tools"))
@@ -0,0 +1,21 @@
+"""Перцентили ближайшего ранга на выборках с известным ответом."""
+import pytest
+
+from load_runner import percentile
+
+
+@pytest.mark.parametrize("pct, expected", [(50, 50), (95, 95), (99, 99), (100, 100), (1, 1), (0, 1)])
+def test_percentile_of_1_to_100(pct, expected):
+    assert percentile(list(range(100, 0, -1)), pct) == expected
+
+
+def test_percentile_of_60_values():
+    values = list(range(1, 61))
+    assert percentile(values, 95) == 57  # ceil(0.95 * 60) = 57
+    assert percentile(values, 50) == 30
+    assert percentile(values, 99) == 60
+
+
+def test_percentile_of_empty_and_single():
+    assert percentile([], 95) == 0.0
+    assert percentile([7.5], 99) == 7.5
@@ -0,0 +1,23 @@
+"""Кеши форм названий: попадание по (список, version), новая version после изменения на месте."""
+from main import prefix_search
+from normalize import normalize_names
+
+
+def test_normalize_names_recomputes_on_new_version():
+    names = ["Молоко 3,2%", "Сыр Чеддер"]
+    assert normalize_names(names, version=1) == ["молоко 32", "сыр чеддер"]
+    names[1] = "Кефир 1%"
+    assert normalize_names(names, version=2) == ["молоко 32", "кефир 1"]
+
+
+def test_normalize_names_same_version_is_a_hit():
+    names = ["Молоко 3,2%"]
+    forms = normalize_names(names, version="v1")
+    assert normalize_names(names, version="v1") is forms
+
+
+def test_prefix_search_without_index_rebuilds_on_new_version():
+    names = ["Молоко ультрапастеризованное", "Сыр Чеддер"]
+    assert prefix_search(names, "сыр", version=1) == ["Сыр Чеддер"]
+    names[1] = "Кефир 1%"
+    assert prefix_search(names, "кеф", version=2) == ["Кефир 1%"]
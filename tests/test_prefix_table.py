@@ -0,0 +1,75 @@
+"""prefix_table: запись и чтение через mmap; PrefixCompleter: карта, затем индекс."""
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+from prefix_map import CATALOG_SITE, Completion, PrefixCompleter, table_key
+from prefix_table import PrefixTable, write_table
+
+
+def test_write_table_round_trip(tmp_path):
+    entries = {f"2056\tмол{i}": [(f"молоко {i}", float(100 - i)), ("кефир", 0.5)] for i in range(200)}
+    entries["2056\tёж"] = [("ёжик в тумане", 3.0)]
+    entries["пусто"] = []
+    path = tmp_path / "map.bin"
+    size = write_table(path, entries)
+    assert path.stat().st_size == size
+
+    table = PrefixTable(path)
+    try:
+        assert len(table) == len(entries)
+        for key, items in entries.items():
+            assert key in table
+            assert table.get(key) == items  # веса целые/половинки — точны во float32
+        assert table.get("2056\tмол200") is None
+        assert "2056\tмол" not in table
+        assert dict(table.items()) == entries
+    finally:
+        table.close()
+
+
+def test_write_table_is_deterministic(tmp_path):
+    entries = {"b": [("x", 1.0)], "a": [("y", 2.0)]}
+    write_table(tmp_path / "one.bin", entries)
+    write_table(tmp_path / "two.bin", dict(reversed(list(entries.items()))))
+    assert (tmp_path / "one.bin").read_bytes() == (tmp_path / "two.bin").read_bytes()
+
+
+def test_not_a_table(tmp_path):
+    path = tmp_path / "junk.bin"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        PrefixTable(path)
+
+
+def test_prefix_table_does_not_pull_numpy_or_clients():
+    code = "import sys, prefix_table; sys.exit(bool({'numpy', 'clients', 'embedding_cache'} & set(sys.modules)))"
+    assert subprocess.run([sys.executable, "-c", code], cwd=ROOT / "tools").returncode == 0
+
+
+@pytest.fixture
+def completer(tmp_path):
+    names = ["Молоко 3,2%", "Мороженое пломбир", "Сыр Чеддер"]
+    write_table(tmp_path / "map.bin", {
+        table_key("2056", "мор"): [("мороженое", 500.0)],
+        table_key(CATALOG_SITE, "мор"): [("мороженое пломбир", 1.0), ("мороженое", 1.0)],
+    })
+    table = PrefixTable(tmp_path / "map.bin")
+    yield PrefixCompleter(table, names)
+    table.close()
+
+
+def test_completer_merges_site_and_catalog(completer):
+    completions, source = completer.complete("2056", "Мор")
+    assert source == "map"
+    assert completions == [Completion("мороженое", "query"), Completion("мороженое пломбир", "query")]
+
+
+def test_completer_falls_back_to_index_on_miss(completer):
+    completions, source = completer.complete("2056", "сыр")
+    assert source == "index"
+    assert completions == [Completion("Сыр Чеддер", "product")]
+    assert completer.complete("2056", "  ") == ([], "empty")
+    assert completer.stats["index"] == 1 and completer.stats["map"] == 0
@@ -0,0 +1,75 @@
+"""Количества в запросе приводятся к базовым единицам; NumericIndex отбирает по ним документы."""
+import pytest
+
+from quantity import COUNT, MASS, VOLUME, NumericIndex, Quantity, parse_query_quantity, to_base
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("сахар 500г", Quantity(MASS, 500.0)),
+    ("сахар 500 гр", Quantity(MASS, 500.0)),
+    ("мука 2кг", Quantity(MASS, 2000.0)),
+    ("flour 5kg", Quantity(MASS, 5000.0)),
+    ("витамин 250 мг", Quantity(MASS, 0.25)),
+    ("молоко 10л", Quantity(VOLUME, 10000.0)),
+    ("milk 10l", Quantity(VOLUME, 10000.0)),
+    ("сок 330 мл", Quantity(VOLUME, 330.0)),
+    ("яйца 10 шт", Quantity(COUNT, 10.0)),
+    ("eggs 12pcs", Quantity(COUNT, 12.0)),
+])
+def test_units_convert_to_base(query, expected):
+    assert parse_query_quantity(query) == expected
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("молоко 1,5л", Quantity(VOLUME, 1500.0)),
+    ("молоко 1.5 л", Quantity(VOLUME, 1500.0)),
+    ("сыр 0,25 кг", Quantity(MASS, 250.0)),
+])
+def test_decimal_comma_and_point(query, expected):
+    assert parse_query_quantity(query) == expected
+
+
+@pytest.mark.parametrize("query", ["молоко", "молоко 3", "5 кгб", "гречка 1 пачка"])
+def test_no_quantity(query):
+    assert parse_query_quantity(query) is None
+
+
+def test_to_base_unknown_unit():
+    assert to_base(3.0, "ящик") is None
+    assert to_base(None, "кг") is None
+    assert to_base(2.0, " KG ") == Quantity(MASS, 2000.0)
+
+
+@pytest.fixture
+def index():
+    return NumericIndex([
+        ("молоко", Quantity(VOLUME, 500.0)),    # 0
+        ("молоко", Quantity(VOLUME, 1000.0)),   # 1
+        ("молоко", Quantity(VOLUME, 1500.0)),   # 2
+        ("молоко", None),                       # 3
+        ("сахар", Quantity(MASS, 1000.0)),      # 4
+        ("сок", Quantity(VOLUME, 2000.0)),      # 5
+        ("сок", Quantity(VOLUME, 200.0)),       # 6
+    ])
+
+
+def test_range_bounds_are_inclusive(index):
+    assert sorted(index.range(VOLUME, 500.0, 1500.0, ["молоко"])) == [0, 1, 2]
+    assert sorted(index.range(VOLUME, 501.0, 1499.0, ["молоко"])) == [1]
+    assert sorted(index.range(VOLUME, 1000.0)) == [1, 2, 5]
+    assert sorted(index.range(MASS, high=999.0)) == []
+    assert sorted(index.range(VOLUME, categories=["хлеб"])) == []
+
+
+def test_nearest_by_size_ratio(index):
+    # 700 мл: до 500 (x1.4) ближе, чем до 1000 (x1.43)
+    assert list(index.nearest(VOLUME, 700.0, k=1, categories=["молоко"])) == [0]
+    assert list(index.nearest(VOLUME, 1000.0, k=2, categories=["молоко"])) == [1, 2]
+    assert sorted(index.nearest(VOLUME, 5000.0, k=1)) == [2, 5]
+
+
+def test_at_least_falls_back_to_nearest(index):
+    assert sorted(index.at_least(VOLUME, 1000.0, categories=["молоко"])) == [1, 2]
+    # Больше 1.5л молока нет — самые крупные упаковки, а не пусто
+    assert list(index.at_least(VOLUME, 5000.0, k=1, categories=["молоко"])) == [2]
+    assert sorted(index.at_least(VOLUME, 1500.0)) == [2, 5]
@@ -0,0 +1,98 @@
+"""ResultCache: LRU-вытеснение, TinyLFU-допуск, TTL и сброс по версии каталога."""
+from result_cache import ResultCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Catalog:
+    """Версия каталога, как её видит кеш: цель алиаса, которую можно сменить."""
+
+    def __init__(self):
+        self.version = "products_v1"
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.version
+
+
+def test_lru_evicts_oldest():
+    cache = ResultCache(max_entries=2)
+    assert cache.put("a", 1) and cache.put("b", 2)
+    assert cache.get("a") == 1  # "a" свежее "b"
+    cache.get("c")  # частота "c" догоняет "b"
+    assert cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_tinylfu_rejects_rarer_newcomer():
+    cache = ResultCache(max_entries=1)
+    for _ in range(3):
+        cache.get("hot")
+    cache.put("hot", "ответ")
+    assert not cache.put("cold", "другой")  # "cold" не встречался ни разу
+    assert cache.get("hot") == "ответ"
+    assert cache.stats()["rejected"] == 1
+
+
+def test_ttl_expiry():
+    clock = Clock()
+    cache = ResultCache(ttl=10.0, clock=clock)
+    cache.put("q", 1)
+    clock.now = 9.9
+    assert cache.get("q") == 1
+    clock.now = 10.0
+    assert cache.get("q") is None
+    assert cache.stats()["expired"] == 1
+    assert len(cache) == 0
+
+
+def test_version_change_clears_after_check_interval():
+    clock, catalog = Clock(), Catalog()
+    cache = ResultCache(version=catalog, version_check_interval=5.0, clock=clock)
+    cache.put("q", 1)
+    catalog.version = "products_v2"
+    clock.now = 4.0
+    assert cache.get("q") == 1  # версия ещё не перепроверялась
+    clock.now = 5.0
+    assert cache.get("q") is None
+    assert cache.stats()["invalidations"] == 1
+    calls = catalog.calls
+    assert cache.get("q") is None
+    assert catalog.calls == calls  # в пределах интервала ES не спрашивают
+
+
+def test_get_or_compute_caches_and_reports_hit():
+    cache = ResultCache()
+    computed = []
+    assert cache.get_or_compute("q", lambda: computed.append(1) or "ответ") == ("ответ", False)
+    assert cache.get_or_compute("q", lambda: computed.append(1) or "ответ") == ("ответ", True)
+    assert computed == [1]
+
+
+def test_version_change_during_compute_is_not_cached():
+    clock, catalog = Clock(), Catalog()
+    cache = ResultCache(version=catalog, version_check_interval=1.0, clock=clock)
+
+    def compute():
+        # Пока считается ответ по старому каталогу, алиас переключили, и другой
+        # запрос уже увидел новую версию и сбросил кеш
+        catalog.version = "products_v2"
+        clock.now += 1.0
+        cache.get("другой запрос")
+        return "ответ по products_v1"
+
+    assert cache.get_or_compute("q", compute) == ("ответ по products_v1", False)
+    assert cache.stats()["invalidations"] == 1
+    assert cache.stats()["stale"] == 1
+    assert cache.get("q") is None
+    assert cache.get_or_compute("q", lambda: "ответ по products_v2") == ("ответ по products_v2", False)
+    assert cache.get("q") == "ответ по products_v2"
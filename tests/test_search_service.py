@@ -0,0 +1,62 @@
+"""/search отдаёт столько результатов, сколько просили в size (до MAX_SIZE), а не 10."""
+import asyncio
+
+import numpy as np
+from aiohttp.test_utils import TestClient, TestServer
+
+import search_service
+
+
+class FakeEncoder:
+    def encode(self, texts):
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+    def flush(self):
+        pass
+
+
+class FakeIndices:
+    async def exists_alias(self, name):
+        return True
+
+
+class FakeES:
+    def __init__(self):
+        self.bodies = []
+        self.indices = FakeIndices()
+
+    async def search(self, index, body):
+        self.bodies.append(body)
+        hits = [{"_id": str(i), "_score": 100.0 - i, "_source": {"name": f"сыр {i}"}} for i in range(body["size"])]
+        return {"hits": {"hits": hits}}
+
+    async def close(self):
+        pass
+
+
+def _search(monkeypatch, size):
+    es = FakeES()
+    monkeypatch.setattr(search_service, "make_async_es", lambda connections: es)
+    monkeypatch.setattr(search_service, "query_encoder", FakeEncoder)
+
+    async def run():
+        async with TestClient(TestServer(search_service.create_app())) as client:
+            await client.app["state"].loader
+            resp = await client.get("/search", params={"q": "сыр", "size": str(size)})
+            assert resp.status == 200
+            return await resp.json()
+
+    return asyncio.run(run()), es.bodies
+
+
+def test_size_above_ten_reaches_es_and_response(monkeypatch):
+    data, bodies = _search(monkeypatch, 30)
+    assert bodies[0]["size"] == 30
+    assert bodies[0]["knn"]["k"] >= 30
+    assert len(data["results"]) == 30
+
+
+def test_size_is_capped_at_max_size(monkeypatch):
+    data, bodies = _search(monkeypatch, 500)
+    assert bodies[0]["size"] == search_service.MAX_SIZE
+    assert len(data["results"]) == search_service.MAX_SIZE
@@ -0,0 +1,49 @@
+"""Сессия ввода должна давать ровно то же, что prefix_search() с нуля, на каждом нажатии."""
+import csv
+
+import pytest
+
+from conftest import ROOT
+from main import build_prefix_index, load_product_names, prefix_search
+from search_session import SearchSession, SessionManager, keystrokes
+
+# Точный шаг, за которым идёт fuzzy: раньше fuzzy сужался до точного набора и терял результаты
+EXACT_THEN_FUZZY = ["мука р", "пюре м", "сыр ча", "гель н", "молокн"]
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    names = load_product_names(str(ROOT / "data" / "catalog_products.xml"))
+    return names, build_prefix_index(names)
+
+
+def replay(catalog, typed_sequence):
+    names, index = catalog
+    session = SearchSession(names, index)
+    for typed in typed_sequence:
+        assert session.search(typed) == prefix_search(names, typed, index), typed
+
+
+@pytest.mark.parametrize("query", EXACT_THEN_FUZZY)
+def test_exact_then_fuzzy_matches_scratch(catalog, query):
+    replay(catalog, keystrokes(query))
+
+
+def test_backspace_and_retype(catalog):
+    replay(catalog, ["м", "мо", "мол", "молокн", "молок", "моло", "молоко", "мука", "мука р", "мука"])
+
+
+def test_query_set_keystrokes(catalog):
+    with (ROOT / "data" / "prefix_queries.csv").open(newline="", encoding="utf-8") as f:
+        queries = [row["query"] for row in csv.DictReader(f)]
+    for query in queries:
+        replay(catalog, keystrokes(query))
+
+
+def test_empty_fuzzy_fallback_not_counted_incremental(catalog):
+    names, index = catalog
+    manager = SessionManager(names, index)
+    for typed in keystrokes("мука р"):
+        manager.search("s", typed)
+    # "мука " — тот же ключ, что "мука"; "мука р" — точного нет, fuzzy после точного шага идёт полным
+    assert dict(manager.stats) == {"full": 2, "incremental": 3, "cached": 1, "fuzzy": 1}
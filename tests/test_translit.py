@@ -0,0 +1,41 @@
+"""Брендовые пары и согласованность вариантов индекса и запроса."""
+import json
+import re
+from collections import Counter, defaultdict
+
+from conftest import ROOT
+from catalog_reader import iter_products
+from normalize import normalize_text
+from translit import LAT_TO_RU_KEYMAP, TRANSLIT_PAIRS, normalized_variants
+
+_CYRILLIC = re.compile(r"^[а-яё]+$")
+_LATIN = re.compile(r"^[a-z]+$")
+_KEYMAP_PUNCT = {c for c in LAT_TO_RU_KEYMAP if not c.isalpha()}  # у запроса ';' '.' — клавиши, а не пунктуация
+
+
+def site_word_pairs(site: str = "5631"):
+    """русское слово -> Counter латинских написаний в той же позиции orig/search, по частоте."""
+    data = json.loads((ROOT / "data" / "PREFIX_EXPANSIONS_20251027.json").read_text(encoding="utf-8"))
+    pairs = defaultdict(Counter)
+    for section in ("expansions", "zero_expansions"):
+        for row in data[section].get(site, []):
+            for ru, lat in zip(row["orig"].lower().split(), row["search"].lower().split()):
+                if _CYRILLIC.match(ru) and _LATIN.match(lat):
+                    pairs[ru][lat] += int(row.get("freq") or row.get("zero_freq") or 0)
+    return pairs
+
+
+def test_pairs_come_from_expansions_with_most_frequent_spelling():
+    pairs = site_word_pairs()
+    for ru, lat in TRANSLIT_PAIRS.items():
+        assert ru in pairs, ru
+        assert pairs[ru].most_common(1)[0][0] == lat, (ru, pairs[ru])
+
+
+def test_variants_are_normalized_and_agree_for_index_and_query():
+    for product in list(iter_products(str(ROOT / "data" / "catalog_products.xml")))[:200]:
+        index_side = normalized_variants(product.norm_name)
+        assert all(v == normalize_text(v) and v for v in index_side)
+        if _KEYMAP_PUNCT.isdisjoint(product.name):
+            # Запрос, набранный как название (регистр, кавычки), даёт те же варианты, что хранит индекс
+            assert normalized_variants(product.name.lower()) == index_side, product.name
@@ -0,0 +1,96 @@
+"""vector_store: публикация через каталог версии и симлинк, abort(), recall int8-поиска."""
+import os
+
+import numpy as np
+import pytest
+
+from vector_store import VectorStore, VectorStoreWriter, recall_at_k
+
+MODEL = "test-model"
+DIMS = 32
+
+
+def _vectors(n, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, DIMS)).astype(np.float32)
+
+
+def _write(path, vectors, publish=True):
+    writer = VectorStoreWriter(path, dims=DIMS, model_name=MODEL)
+    for start in range(0, len(vectors), 100):
+        batch = vectors[start:start + 100]
+        writer.add([f"p{start + i}" for i in range(len(batch))], batch)
+    return writer, writer.close(publish=publish)
+
+
+def test_publish_swaps_symlink_and_keeps_previous_version(tmp_path):
+    path = tmp_path / "vectors"
+    first, store = _write(path, _vectors(150, seed=1))
+    assert path.is_symlink() and os.readlink(path) == first.version_path.name
+    assert len(store) == 150 and store.ids[0] == "p0"
+    reader = VectorStore(path, MODEL)  # открыт до переключения
+
+    second, _ = _write(path, _vectors(50, seed=2), publish=False)
+    assert os.readlink(path) == first.version_path.name  # без publish path не меняется
+    assert len(second.publish()) == 50
+    assert os.readlink(path) == second.version_path.name
+    assert first.version_path.is_dir()  # предыдущая версия остаётся читателям
+    assert len(reader) == 150 and reader.search(_vectors(1, seed=3)[0], k=3)[0].shape == (3,)
+
+    third, _ = _write(path, _vectors(10, seed=4))
+    assert not first.version_path.exists()  # более старые удаляются
+    assert second.version_path.is_dir() and os.readlink(path) == third.version_path.name
+    assert len(VectorStore(path, MODEL)) == 10
+
+
+def test_publish_replaces_legacy_plain_directory(tmp_path):
+    path = tmp_path / "vectors"
+    legacy = VectorStoreWriter(tmp_path / "legacy", dims=DIMS, model_name=MODEL)
+    legacy.add(["old"], _vectors(1))
+    legacy.close(publish=False)
+    os.replace(legacy.version_path, path)
+
+    writer, store = _write(path, _vectors(20))
+    assert path.is_symlink() and len(store) == 20
+    assert (tmp_path / "vectors.v0" / "ids.json").exists()
+
+
+def test_abort_removes_version_and_keeps_published(tmp_path):
+    path = tmp_path / "vectors"
+    published, _ = _write(path, _vectors(30))
+    writer = VectorStoreWriter(path, dims=DIMS, model_name=MODEL)
+    writer.add(["x"], _vectors(1))
+    writer.abort()
+    assert not writer.version_path.exists()
+    assert os.readlink(path) == published.version_path.name
+    assert len(VectorStore(path, MODEL)) == 30
+
+
+def test_model_mismatch(tmp_path):
+    _write(tmp_path / "vectors", _vectors(5))
+    with pytest.raises(ValueError):
+        VectorStore(tmp_path / "vectors", "other-model")
+
+
+def test_int8_with_rescore_recall(tmp_path):
+    vectors = _vectors(3000, seed=5)
+    _, store = _write(tmp_path / "vectors", vectors)
+    # Запросы — зашумлённые копии товаров: у каждого плотная окрестность, как у реальных эмбеддингов
+    rng = np.random.default_rng(6)
+    queries = vectors[rng.choice(len(vectors), 40, replace=False)] + 0.3 * _vectors(40, seed=7)
+
+    report = recall_at_k(store, queries, k=10, num_candidates=100)
+    assert report["recall_int8_rescored"] >= 0.95
+    assert report["recall_int8_rescored"] >= report["recall_int8"]
+    assert recall_at_k(store, queries, k=10, num_candidates=len(store))["recall_int8_rescored"] == 1.0
+
+    rows, scores = store.search(queries[0], k=10)
+    exact_rows, exact_scores = store.exact_search(queries[0], k=10)
+    assert np.all(np.diff(scores) <= 0)
+    assert np.allclose(scores, exact_scores, atol=1e-5)
+
+
+def test_search_within_rows(tmp_path):
+    _, store = _write(tmp_path / "vectors", _vectors(500, seed=8))
+    rows = np.arange(0, 500, 5)
+    found, _ = store.search(_vectors(1, seed=9)[0], k=7, rows=rows)
+    assert len(found) == 7 and set(found) <= set(rows)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""Пакетный поиск для офлайн-оценки больших наборов запросов.
+
+search_es() обрабатывает запрос целиком на одном ядре. BatchSearcher делает те
+же шаги для списка запросов:
+- prepare_query (нормализация, варианты транслита, вес) — в пуле процессов;
+- кодирование — один вызов encoder.encode на весь батч;
+- Elasticsearch — _msearch по msearch_size тел build_es_query за запрос
+  (локальный движок считает top_hits в процессе);
+- rerank — в основном процессе: 10 хитов туда и обратно через pickle стоят
+  ~57 мкс против ~13 мкс самого rerank; у prepare_query вход и выход — строка и
+  PreparedQuery (~11 мкс IPC на ~20 мкс работы), поэтому он остаётся в пуле.
+
+latency_ms результата — как у search_es: время ожидания стадии поиска по
+часам клиента (без prepare/encode/rerank). Запросы одного _msearch ждут его
+целиком, поэтому у них одно время — весь _msearch; took ES (время на
+сервере) не используется.
+
+Тела запросов и функции те же, что у одиночного пути, поэтому выдача совпадает
+с search_es() при тех же векторах запросов (кеш эмбеддингов общий для обоих
+путей); --check сверяет это на наборе запросов.
+
+python tools/batch_search.py --queries data/prefix_queries.csv --check
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from clients import ALIAS, get_es
+from evaluate import PreparedQuery, build_es_query, prepare_query, query_encoder, rerank
+import prefix_purity
+
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_MSEARCH_SIZE = 64  # тел в одном _msearch: больше — дольше ждать самый медленный поиск
+
+SearchResult = Tuple[List[dict], int, dict]  # как у search_es: (hits, latency_ms стадии поиска, тело запроса)
+
+
+class BatchSearcher:
+    """Пул процессов и один кодировщик на всё время оценки; search() принимает список запросов."""
+
+    def __init__(self, processes: Optional[int] = None, msearch_size: int = DEFAULT_MSEARCH_SIZE,
+                 encoder=None, engine=None, purity_table: str = ""):
+        """engine — LocalSearchEngine вместо Elasticsearch; processes=1 — без пула.
+
+        purity_table подключается и в процессах пула: prepare_query выбирает категории там.
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self.msearch_size = msearch_size
+        self.encoder = encoder
+        self.engine = engine
+        self.pool = None
+        if self.processes > 1:
+            self.pool = ProcessPoolExecutor(max_workers=self.processes, initializer=prefix_purity.activate,
+                                            initargs=(purity_table,))
+        self.timings: Counter = Counter()  # стадия -> суммарные наносекунды
+        self.queries = 0
+
+    def __enter__(self) -> "BatchSearcher":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def _map(self, fn, items: Sequence[Any]) -> List[Any]:
+        if self.pool is None or len(items) < 2:
+            return [fn(item) for item in items]
+        chunksize = max(1, len(items) // (4 * self.processes))
+        return list(self.pool.map(fn, items, chunksize=chunksize))
+
+    def _msearch(self, prepared: List[PreparedQuery], vectors) -> List[SearchResult]:
+        es = get_es()
+        results: List[SearchResult] = []
+        for start in range(0, len(prepared), self.msearch_size):
+            bodies = [build_es_query(p, v.tolist())
+                      for p, v in zip(prepared[start:start + self.msearch_size], vectors[start:start + self.msearch_size])]
+            searches: List[dict] = []
+            for body in bodies:
+                searches.extend(({"index": ALIAS}, body))
+            started = time.perf_counter_ns()
+            responses = es.msearch(searches=searches)["responses"]
+            latency_ms = (time.perf_counter_ns() - started) // 1_000_000
+            for body, response in zip(bodies, responses):
+                if "error" in response:
+                    raise RuntimeError(f"msearch item failed: {response['error']}")
+                results.append((response["hits"]["hits"], latency_ms, body))
+        return results
+
+    def _local(self, prepared: List[PreparedQuery], vectors) -> List[SearchResult]:
+        results: List[SearchResult] = []
+        for p, vector in zip(prepared, vectors):
+            started = time.perf_counter_ns()
+            hits, k = self.engine.top_hits(p, vector)
+            results.append((hits, (time.perf_counter_ns() - started) // 1_000_000, self.engine.describe(p, k)))
+        return results
+
+    def prepare(self, queries: Sequence[str]) -> List[PreparedQuery]:
+        """prepare_query для списка запросов в пуле процессов."""
+        started = time.perf_counter_ns()
+        prepared = self._map(prepare_query, list(queries))
+        self.timings["normalize"] += time.perf_counter_ns() - started
+        return prepared
+
+    def search(self, queries: Sequence[str], prepared: Optional[List[PreparedQuery]] = None) -> List[SearchResult]:
+        """Результаты в порядке queries, в том же формате, что search_es(); prepared — уже из prepare(queries)."""
+        if not queries:
+            return []
+        encoder = self.encoder or query_encoder()
+        if prepared is None:
+            prepared = self.prepare(queries)
+        t1 = time.perf_counter_ns()
+        vectors = encoder.encode([p.norm_query for p in prepared])
+        t2 = time.perf_counter_ns()
+        raw = self._local(prepared, vectors) if self.engine is not None else self._msearch(prepared, vectors)
+        t3 = time.perf_counter_ns()
+        reranked = [rerank(hits, p.norm_query) for (hits, _, _), p in zip(raw, prepared)]
+        t4 = time.perf_counter_ns()
+
+        self.timings.update({"encode": t2 - t1, "es" if self.engine is None else "score": t3 - t2,
+                             "rerank": t4 - t3})
+        self.queries += len(queries)
+        return [(hits, latency_ms, body) for hits, (_, latency_ms, body) in zip(reranked, raw)]
+
+    def report(self, seconds: float) -> Dict[str, Any]:
+        return {
+            "requests": self.queries,
+            "processes": self.processes,
+            "seconds": round(seconds, 3),
+            "throughput_qps": round(self.queries / seconds, 2) if seconds else 0.0,
+            "stage_ms_per_query": {stage: round(ns / 1e6 / max(self.queries, 1), 4)
+                                   for stage, ns in self.timings.items()},
+        }
+
+
+def search_in_batches(searcher: BatchSearcher, queries: Sequence[str], batch_size: int = DEFAULT_BATCH_SIZE) -> List[SearchResult]:
+    results: List[SearchResult] = []
+    for start in range(0, len(queries), batch_size):
+        results.extend(searcher.search(queries[start:start + batch_size]))
+    return results
+
+
+def same_results(a: List[dict], b: List[dict]) -> bool:
+    """Одинаковые id в том же порядке и те же score (до 1e-4, как в CSV отчёта)."""
+    return [h["_id"] for h in a] == [h["_id"] for h in b] and \
+        all(abs(x["_score"] - y["_score"]) < 1e-4 for x, y in zip(a, b))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the query set through the batch search API")
+    parser.add_argument("--queries", default="data/prefix_queries.csv", help="CSV with a 'query' column")
+    parser.add_argument("--backend", choices=["es", "local"], default="es", help="Elasticsearch or the in-process NumPy engine")
+    parser.add_argument("--catalog", default="data/catalog_products.xml", help="Catalog for --backend local")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Queries per batch")
+    parser.add_argument("--msearch-size", type=int, default=DEFAULT_MSEARCH_SIZE, help="Searches per _msearch request")
+    parser.add_argument("--processes", type=int, default=0, help="Query preprocessing processes (0 = all cores)")
+    parser.add_argument("--repeat", type=int, default=1, help="Passes over the query set")
+    parser.add_argument("--check", action="store_true", help="Compare every result with the single-query path")
+    parser.add_argument("--purity-table", default="", help="Restrict retrieval to plausible categories (prefix_purity.py table)")
+    args = parser.parse_args()
+    prefix_purity.activate(args.purity_table)
+
+    with Path(args.queries).open(newline="", encoding="utf-8") as f:
+        queries = [row["query"] for row in csv.DictReader(f)] * args.repeat
+
+    engine = None
+    if args.backend == "local":
+        from local_search import LocalSearchEngine
+        engine = LocalSearchEngine(args.catalog)
+    with BatchSearcher(args.processes or None, args.msearch_size, engine=engine,
+                       purity_table=args.purity_table) as searcher:
+        started = time.perf_counter()
+        results = search_in_batches(searcher, queries, args.batch_size)
+        report = searcher.report(time.perf_counter() - started)
+    print(f"{report['requests']} queries in {report['seconds']:.2f}s ({report['throughput_qps']:.1f} qps, "
+          f"{report['processes']} processes)")
+    for stage, ms in report["stage_ms_per_query"].items():
+        print(f"  {stage:<9} {ms:8.4f} ms/query")
+
+    if args.check:
+        from evaluate import search_es
+        single = engine.search if engine is not None else search_es
+        mismatches = [q for q, (hits, _, _) in zip(queries, results) if not same_results(hits, single(q)[0])]
+        print(f"Single-query check: {len(queries) - len(mismatches)}/{len(queries)} identical")
+        for query in mismatches[:10]:
+            print(f"  mismatch: {query!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Benchmark local prefix search: linear difflib scan vs prefix index + fuzzy automaton."""
+from __future__ import annotations
+
+import argparse
+import csv
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from load_runner import percentile
+from main import build_prefix_index, load_product_names, prefix_search, prefix_search_linear
+
+
+def time_queries(search: Callable[[str], List[str]], queries: List[str], repeat: int) -> tuple[List[float], List[List[str]]]:
+    """Время каждого запроса в мс (минимум из repeat прогонов) и результаты."""
+    latencies, results = [], []
+    for query in queries:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            found = search(query)
+            best = min(best, (time.perf_counter() - start) * 1000)
+        latencies.append(best)
+        results.append(found)
+    return latencies, results
+
+
+def report(label: str, latencies: List[float]) -> None:
+    total = sum(latencies)
+    print(
+        f"{label:<8} total {total:9.2f} ms | mean {total / len(latencies):7.3f} ms | "
+        f"p50 {percentile(latencies, 50):7.3f} ms | p95 {percentile(latencies, 95):7.3f} ms | "
+        f"max {max(latencies):7.3f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare difflib scan and prefix index on the query set")
+    parser.add_argument("--catalog", default="data/catalog_products.xml", help="Path to the XML catalog")
+    parser.add_argument("--queries", default="data/prefix_queries.csv", help="CSV with queries")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per query, the fastest one is reported")
+    args = parser.parse_args()
+
+    product_names = load_product_names(args.catalog)
+    with Path(args.queries).open(newline="", encoding="utf-8") as src:
+        queries = [row["query"] for row in csv.DictReader(src)]
+
+    start = time.perf_counter()
+    index = build_prefix_index(product_names)
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"{len(product_names)} products, {len(index)} index keys, build {build_ms:.1f} ms, {len(queries)} queries")
+
+    linear_lat, linear_res = time_queries(lambda q: prefix_search_linear(product_names, q), queries, args.repeat)
+    index_lat, index_res = time_queries(lambda q: prefix_search(product_names, q, index), queries, args.repeat)
+
+    report("difflib", linear_lat)
+    report("index", index_lat)
+    print(f"Speedup (total): {sum(linear_lat) / max(sum(index_lat), 1e-9):.1f}x")
+
+    covered = [sum(1 for res in results if res) for results in (linear_res, index_res)]
+    print(f"Queries with hits: difflib {covered[0]}/{len(queries)}, index {covered[1]}/{len(queries)}")
+    for query, old, new in zip(queries, linear_res, index_res):
+        if set(old) != set(new):
+            print(f"  '{query}': difflib {len(old)} hits, index {len(new)} hits")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""Регрессионный бенчмарк: латентность, память и качество выдачи против сохранённого baseline.
+
+Кейсы на синтетических каталогах generate_catalog.py (NDJSON, seed 42, по
+умолчанию 1k/100k/1M товаров; файлы кешируются в .cache/bench):
+- catalog_load   — потоковое чтение каталога (catalog_reader.iter_products);
+- index_build    — load_product_names + build_prefix_index;
+- prefix_search  — main.prefix_search по набору запросов: throughput, p95,
+  precision@3 и coverage по разметке data/prefix_judgements.csv;
+- search         — путь evaluate.py (Elasticsearch за алиасом или --search-backend
+  local) на уже загруженном индексе; пропускается, если бэкенд недоступен.
+
+Каждый кейс идёт в отдельном чистом процессе (spawn), поэтому peak RSS —
+ru_maxrss этого процесса, а не максимум за весь прогон.
+
+Разметка: у запроса список базовых названий товаров ("Масло сливочное|Масло
+оливковое"); результат релевантен, если его название с них начинается, — так
+одна разметка подходит каталогу любого размера. precision@3 считается, как в
+evaluate.py, делением на 3.
+
+Результат сравнивается с reports/bench_baseline.json: время, p95 и память —
+относительный допуск --tolerance, качество — абсолютный --quality-tolerance.
+Код выхода 1, если есть регрессии. Baseline привязан к машине и коммиту, на
+которых снят (поля machine и commit; пропущенные кейсы с причиной — в skipped):
+после смены железа или намеренного изменения производительности его нужно
+переснять с --update-baseline. Последний прогон (reports/logs/bench_latest.json)
+в git не хранится.
+
+python tools/bench_regression.py --sizes 1000,100000 --update-baseline
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_SIZES = (1000, 100_000, 1_000_000)
+DEFAULT_QUERIES = "data/prefix_queries.csv"
+DEFAULT_JUDGEMENTS = "data/prefix_judgements.csv"
+DEFAULT_BASELINE = "reports/bench_baseline.json"
+DEFAULT_OUTPUT = "reports/logs/bench_latest.json"
+CATALOG_DIR = ".cache/bench"
+SEED = 42
+
+QUALITY_METRICS = ("precision_at_3", "coverage")
+LOWER_IS_BETTER = ("seconds", "p95_ms", "peak_rss_mb")
+COMPARED = ("throughput",) + LOWER_IS_BETTER + QUALITY_METRICS
+# Разница меньше этого не считается регрессией ни при каком относительном допуске
+NOISE_FLOOR = {"seconds": 0.05, "p95_ms": 0.05, "peak_rss_mb": 5.0}
+
+Metrics = Dict[str, float]
+Judgements = Dict[str, List[str]]
+
+
+def read_queries(path: str) -> List[str]:
+    with Path(path).open(newline="", encoding="utf-8") as f:
+        return [row["query"] for row in csv.DictReader(f)]
+
+
+def read_judgements(path: str) -> Judgements:
+    """{запрос: нормализованные базовые названия релевантных товаров}."""
+    from normalize import normalize_text
+    with Path(path).open(newline="", encoding="utf-8") as f:
+        return {row["query"]: [normalize_text(name) for name in row["relevant"].split("|") if name.strip()]
+                for row in csv.DictReader(f)}
+
+
+def quality(queries: Sequence[str], results: Sequence[List[str]], judgements: Judgements) -> Metrics:
+    """precision@3 по размеченным запросам и coverage (есть хоть один результат) по всем."""
+    from normalize import normalize_text
+    judged = precision = 0.0
+    for query, names in zip(queries, results):
+        relevant = judgements.get(query)
+        if not relevant:
+            continue
+        judged += 1
+        top = [normalize_text(name) for name in names[:3]]
+        precision += sum(1 for name in top if name.startswith(tuple(relevant))) / 3
+    covered = sum(1 for names in results if names)
+    return {
+        "precision_at_3": round(precision / judged, 4) if judged else 0.0,
+        "coverage": round(covered / len(results), 4) if results else 0.0,
+    }
+
+
+def _latency_metrics(latencies: List[float], seconds: float) -> Metrics:
+    from load_runner import percentile
+    return {"seconds": round(seconds, 4), "throughput": round(len(latencies) / seconds, 2) if seconds else 0.0,
+            "p95_ms": round(percentile(latencies, 95), 4)}
+
+
+def case_catalog_load(catalog: str) -> Metrics:
+    from catalog_reader import iter_products
+    started = time.perf_counter()
+    items = sum(1 for _ in iter_products(catalog))
+    seconds = time.perf_counter() - started
+    return {"items": items, "seconds": round(seconds, 4), "throughput": round(items / seconds, 2)}
+
+
+def case_index_build(catalog: str) -> Metrics:
+    from main import build_prefix_index, load_product_names
+    started = time.perf_counter()
+    names = load_product_names(catalog)
+    loaded = time.perf_counter()
+    index = build_prefix_index(names)
+    seconds = time.perf_counter() - loaded
+    return {"names": len(names), "keys": len(index), "load_seconds": round(loaded - started, 4),
+            "seconds": round(seconds, 4), "throughput": round(len(names) / seconds, 2)}
+
+
+def _timed(search: Callable[[str], List[str]], queries: Sequence[str], repeat: int) -> Tuple[List[float], List[List[str]], float]:
+    """Латентности всех прогонов в мс, результаты первого прогона и общее время."""
+    latencies: List[float] = []
+    results: List[List[str]] = []
+    started = time.perf_counter()
+    for run in range(repeat):
+        for query in queries:
+            t0 = time.perf_counter()
+            found = search(query)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if run == 0:
+                results.append(found)
+    return latencies, results, time.perf_counter() - started
+
+
+def case_prefix_search(catalog: str, queries: List[str], judgements: Judgements, repeat: int) -> Metrics:
+    from main import build_prefix_index, load_product_names, prefix_search
+    names = load_product_names(catalog)
+    index = build_prefix_index(names)
+    latencies, results, seconds = _timed(lambda q: prefix_search(names, q, index), queries, repeat)
+    return {**_latency_metrics(latencies, seconds), **quality(queries, results, judgements)}
+
+
+def case_search(backend: str, catalog: str, queries: List[str], judgements: Judgements, repeat: int) -> Metrics:
+    import evaluate
+    search = evaluate.make_backend(backend, catalog)
+    names_of = lambda q: [hit["_source"]["name"] for hit in search(q)[0]]
+    names_of(queries[0])  # модель и соединения — до замера
+    latencies, results, seconds = _timed(names_of, queries, repeat)
+    return {**_latency_metrics(latencies, seconds), **quality(queries, results, judgements)}
+
+
+CASES: Dict[str, Callable[..., Metrics]] = {
+    "catalog_load": case_catalog_load,
+    "index_build": case_index_build,
+    "prefix_search": case_prefix_search,
+    "search": case_search,
+}
+
+
+def _measure(case: str, args: tuple) -> Metrics:
+    """Выполняется в дочернем процессе: метрики кейса и пиковый RSS процесса."""
+    metrics = CASES[case](*args)
+    metrics["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)  # Linux: КБ
+    return metrics
+
+
+def run_case(case: str, *args) -> Metrics:
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_measure, case, args).result()
+
+
+def ensure_catalog(size: int, directory: str = CATALOG_DIR, workers: int = 1) -> str:
+    """Синтетический NDJSON-каталог на size товаров; генерируется один раз и переиспользуется."""
+    from generate_catalog import build_catalog
+    path = Path(directory) / f"catalog_{size}_seed{SEED}.ndjson"
+    if not path.exists():
+        started = time.perf_counter()
+        tmp = path.with_name(path.name + ".tmp")
+        build_catalog(size, tmp, SEED, fmt="ndjson", workers=workers)
+        os.replace(tmp, path)
+        print(f"Generated {size} products into {path} in {time.perf_counter() - started:.1f}s")
+    return str(path)
+
+
+def search_unavailable(backend: str) -> Optional[str]:
+    """Причина, по которой кейс search нельзя выполнить, или None."""
+    if backend == "none":
+        return "disabled"
+    from importlib.util import find_spec
+    if find_spec("sentence_transformers") is None:
+        return "sentence_transformers is not installed"
+    if backend == "es":
+        from clients import ALIAS, get_es
+        try:
+            if not get_es().indices.exists_alias(name=ALIAS):
+                return f"alias {ALIAS!r} does not exist"
+        except Exception as exc:
+            return f"Elasticsearch is unreachable ({type(exc).__name__})"
+    return None
+
+
+def compare(baseline: Dict[str, Metrics], current: Dict[str, Metrics],
+            tolerance: float, quality_tolerance: float) -> List[Tuple[str, str, float, float, str]]:
+    """(кейс, метрика, baseline, сейчас, статус) для кейсов, которые есть в обоих прогонах."""
+    rows = []
+    for case in sorted(set(baseline) & set(current)):
+        for metric in COMPARED:
+            if metric not in baseline[case] or metric not in current[case]:
+                continue
+            base, now = baseline[case][metric], current[case][metric]
+            sign = -1 if metric in LOWER_IS_BETTER else 1
+            delta = (now - base) * sign  # > 0 — стало лучше
+            if metric in QUALITY_METRICS:
+                limit = quality_tolerance
+            else:
+                limit = max(abs(base) * tolerance, NOISE_FLOOR.get(metric, 0.0))
+            status = "regression" if delta < -limit else "improved" if delta > limit else "ok"
+            rows.append((case, metric, base, now, status))
+    return rows
+
+
+def machine_info() -> Dict[str, object]:
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def git_commit() -> Optional[str]:
+    """Короткий хеш HEAD (с '+dirty' при незакоммиченных изменениях в tools/) или None вне git."""
+    try:
+        head = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--", "tools"], capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return head + ("+dirty" if dirty else "")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Latency, memory and ranking regression benchmark")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Synthetic catalog sizes, comma-separated")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES, help="CSV with a 'query' column")
+    parser.add_argument("--judgements", default=DEFAULT_JUDGEMENTS, help="CSV with query,relevant (base names separated by |)")
+    parser.add_argument("--repeat", type=int, default=5, help="Passes over the query set per search case")
+    parser.add_argument("--search-backend", choices=["es", "local", "none"], default="es",
+                        help="Backend for the evaluate.py search case (runs against the live index / --search-catalog)")
+    parser.add_argument("--search-catalog", default="data/catalog_products.xml", help="Catalog for --search-backend local")
+    parser.add_argument("--catalog-dir", default=CATALOG_DIR, help="Where generated catalogs are cached")
+    parser.add_argument("--workers", type=int, default=1, help="Processes for catalog generation")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare with")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Where this run is written")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown / memory growth")
+    parser.add_argument("--quality-tolerance", type=float, default=0.01, help="Allowed absolute drop of precision@3 and coverage")
+    parser.add_argument("--update-baseline", action="store_true", help="Write this run as the new baseline")
+    args = parser.parse_args()
+
+    queries = read_queries(args.queries)
+    judgements = read_judgements(args.judgements)
+    cases: Dict[str, Metrics] = {}
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        catalog = ensure_catalog(size, args.catalog_dir, args.workers)
+        cases[f"catalog_load/{size}"] = run_case("catalog_load", catalog)
+        cases[f"index_build/{size}"] = run_case("index_build", catalog)
+        cases[f"prefix_search/{size}"] = run_case("prefix_search", catalog, queries, judgements, args.repeat)
+    skipped: Dict[str, str] = {}
+    reason = search_unavailable(args.search_backend)
+    if reason is None:
+        cases[f"search/{args.search_backend}"] = run_case("search", args.search_backend, args.search_catalog,
+                                                          queries, judgements, args.repeat)
+    else:
+        skipped[f"search/{args.search_backend}"] = reason
+        print(f"search/{args.search_backend}: skipped, {reason}")
+
+    run = {"created": datetime.now(timezone.utc).isoformat(timespec="seconds"), "commit": git_commit(),
+           "machine": machine_info(), "repeat": args.repeat, "cases": cases, "skipped": skipped}
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(run, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+
+    columns = (("throughput", 12, ".1f"), ("p95_ms", 9, ".3f"), ("seconds", 9, ".3f"), ("peak_rss_mb", 11, ".1f"),
+               ("precision_at_3", 14, ".3f"), ("coverage", 8, ".3f"))
+    print(f"{'case':<24}" + "".join(f" {key:>{width}}" for key, width, _ in columns))
+    for name, m in cases.items():
+        print(f"{name:<24}" + "".join(f" {format(m[key], fmt) if key in m else '-':>{width}}" for key, width, fmt in columns))
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(output.read_text(encoding="utf-8"), encoding="utf-8")
+        print(f"Baseline written to {baseline_path}")
+        return
+    if not baseline_path.exists():
+        print(f"No baseline at {baseline_path}; run with --update-baseline to create one")
+        return
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    print(f"Baseline from commit {baseline.get('commit') or 'unknown'}, recorded {baseline.get('created')}")
+    if baseline.get("machine") != run["machine"]:
+        print(f"Note: baseline was recorded on {baseline.get('machine')}, timings may not be comparable")
+    rows = compare(baseline["cases"], cases, args.tolerance, args.quality_tolerance)
+    regressions = [row for row in rows if row[4] == "regression"]
+    for case, metric, base, now, status in rows:
+        if status != "ok":
+            print(f"{status.upper():<10} {case:<24} {metric:<15} {base:>12g} -> {now:g}")
+    print(f"{len(rows)} metrics compared with {baseline_path}: {len(regressions)} regressions")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Startup cost of the CLI tools: `-X importtime` breakdown and wall time of a summary-only run."""
+from __future__ import annotations
+
+import argparse
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+TOOLS_DIR = Path(__file__).resolve().parent
+
+
+def import_times(module: str) -> List[Tuple[str, int, int]]:
+    """(модуль, собственное время, кумулятивное время) в микросекундах для module и всего, что он импортировал.
+
+    Модули, загруженные ещё при старте интерпретатора (site, .pth), не учитываются.
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=TOOLS_DIR, capture_output=True, text=True, check=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = len(name) - len(name.lstrip()) - 1  # вложенность — по два пробела на уровень
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    # Дети печатаются перед родителем: идём назад от строки module, пока вложенность глубже
+    end = max(i for i, row in enumerate(rows) if row[0] == module and row[3] == 0)
+    start = end
+    while start > 0 and rows[start - 1][3] > 0:
+        start -= 1
+    return [row[:3] for row in rows[start:end + 1]]
+
+
+def wall_time(args: List[str], repeat: int) -> float:
+    """Лучшее из repeat время запуска `python <args>` в секундах."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, *args], capture_output=True, check=True)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure import and startup time of the tools")
+    parser.add_argument("--modules", nargs="+", default=["load_catalog", "evaluate"], help="Modules to import")
+    parser.add_argument("--catalog", default="data/catalog_products.xml", help="Catalog for the summary run")
+    parser.add_argument("--top", type=int, default=8, help="Slowest imports to list per module")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per wall-time measurement")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        rows = import_times(module)
+        total = rows[-1][2]
+        print(f"import {module}: {total / 1000:.1f} ms")
+        for name, _, cumulative in sorted(rows[:-1], key=lambda r: -r[2])[:args.top]:
+            print(f"  {cumulative / 1000:8.1f} ms  {name}")
+        heavy = [name for name, _, _ in rows if name.split(".")[0] in ("torch", "sentence_transformers", "elasticsearch")]
+        if heavy:
+            print(f"  WARNING: {module} eagerly imports {len(heavy)} heavy modules")
+
+    baseline = wall_time(["-c", "pass"], args.repeat)
+    summary = wall_time([str(TOOLS_DIR / "load_catalog.py"), args.catalog], args.repeat)
+    print(f"interpreter startup: {baseline * 1000:.0f} ms")
+    print(f"load_catalog.py summary run: {summary * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""Micro-benchmark: per-character dict lookups vs precompiled str.translate tables."""
+from __future__ import annotations
+
+import argparse
+import csv
+import timeit
+from pathlib import Path
+
+from main import load_product_names
+from normalize import normalize_names
+from translit import LAT_TO_RU_KEYMAP, RU_TO_LAT_KEYMAP, lat_to_ru_keymap, ru_to_lat_keymap
+
+
+def legacy_variants(text: str) -> list:
+    """Прежняя реализация: генератор с dict.get на каждый символ."""
+    return [
+        text,
+        ''.join(RU_TO_LAT_KEYMAP.get(c, c) for c in text),
+        ''.join(LAT_TO_RU_KEYMAP.get(c, c) for c in text),
+    ]
+
+
+def table_variants(text: str) -> list:
+    return [text, ru_to_lat_keymap(text), lat_to_ru_keymap(text)]
+
+
+def bench(label: str, texts: list, number: int) -> None:
+    assert all(legacy_variants(t) == table_variants(t) for t in texts)
+    legacy = min(timeit.repeat(lambda: [legacy_variants(t) for t in texts], number=number, repeat=5))
+    table = min(timeit.repeat(lambda: [table_variants(t) for t in texts], number=number, repeat=5))
+    per_call = 1e6 / (number * len(texts))
+    print(f"{label:<8} {len(texts):5d} texts | dict.get join {legacy * per_call:7.3f} us | "
+          f"str.translate {table * per_call:7.3f} us | speedup {legacy / table:5.1f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare keyboard-layout variant generation strategies")
+    parser.add_argument("--catalog", default="data/catalog_products.xml", help="Path to the XML catalog")
+    parser.add_argument("--queries", default="data/prefix_queries.csv", help="CSV with queries")
+    parser.add_argument("--number", type=int, default=20, help="Passes over the texts per timing run")
+    args = parser.parse_args()
+
+    with Path(args.queries).open(newline="", encoding="utf-8") as src:
+        queries = [row["query"].lower() for row in csv.DictReader(src)]
+    names = normalize_names(load_product_names(args.catalog))
+
+    bench("queries", queries, args.number * 10)
+    bench("products", names, args.number)
+
+
+if __name__ == "__main__":
+    main()
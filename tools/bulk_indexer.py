@@ -0,0 +1,207 @@
+"""Потоковая загрузка документов в Elasticsearch.
+
+Эмбеддинги считаются батчами (сотни текстов на один model.encode), документы
+сериализуются один раз и режутся на bulk-чанки по числу документов и байтам,
+чанки уходят параллельно из пула потоков, пока основной поток кодирует
+следующие. Элементы, отклонённые с 429, и весь чанк при 429/503 или таймауте
+самого bulk-запроса переотправляются с экспоненциальной задержкой; остальные
+ошибки считаются и печатаются.
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+DEFAULT_ENCODE_BATCH = 256
+DEFAULT_CHUNK_DOCS = 500
+DEFAULT_CHUNK_BYTES = 10 * 1024 * 1024  # с запасом ниже http.max_content_length (100mb)
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_RETRIES = 5
+RETRY_STATUSES = {429}  # статусы элементов в ответе bulk
+REQUEST_RETRY_STATUSES = {429, 503}  # статусы всего запроса: очередь bulk полна, узел недоступен
+MAX_ERRORS_KEPT = 10
+
+# NDJSON-строки одного элемента: (action, source) для index, (action,) для delete
+BulkItem = Tuple[bytes, ...]
+
+
+def batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def embed_documents(
+    items: Iterable[Tuple[Optional[str], dict, str]],
+    model,
+    batch_size: int = DEFAULT_ENCODE_BATCH,
+) -> Iterator[Tuple[Optional[str], dict]]:
+    """(id, документ, текст) -> (id, документ с doc["vector"]), по batch_size текстов на model.encode."""
+    for batch in batched(items, batch_size):
+        vectors = model.encode([text for _, _, text in batch], batch_size=batch_size, show_progress_bar=False)
+        for (doc_id, doc, _), vector in zip(batch, vectors):
+            doc["vector"] = vector.tolist()
+            yield doc_id, doc
+
+
+def _dumps(obj: dict) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+class Progress:
+    """Потокобезопасные счётчики и периодический вывод docs/s и MB/s."""
+
+    def __init__(self, interval: float = 5.0):
+        self.interval = interval
+        self.started = time.perf_counter()
+        self._last_report = self.started
+        self._lock = threading.Lock()
+        self.docs = self.bytes = self.failed = self.retried = self.chunks = 0
+
+    def add(self, docs: int = 0, nbytes: int = 0, failed: int = 0, retried: int = 0, chunks: int = 0) -> None:
+        with self._lock:
+            self.docs += docs
+            self.bytes += nbytes
+            self.failed += failed
+            self.retried += retried
+            self.chunks += chunks
+
+    def snapshot(self) -> Dict[str, float]:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            "docs": self.docs,
+            "failed": self.failed,
+            "retried": self.retried,
+            "chunks": self.chunks,
+            "mb": self.bytes / 1e6,
+            "seconds": elapsed,
+            "docs_per_s": self.docs / elapsed,
+            "mb_per_s": self.bytes / 1e6 / elapsed,
+        }
+
+    def maybe_report(self, force: bool = False) -> None:
+        now = time.perf_counter()
+        if not force and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        s = self.snapshot()
+        print(f"  indexed {s['docs']:,} docs in {s['seconds']:.1f}s "
+              f"({s['docs_per_s']:,.0f} docs/s, {s['mb_per_s']:.2f} MB/s), "
+              f"failed {s['failed']}, retried {s['retried']}")
+
+
+class BulkIndexer:
+    """Режет поток документов на bulk-чанки и отправляет их параллельно с повторами."""
+
+    def __init__(
+        self,
+        es,
+        index: str,
+        chunk_docs: int = DEFAULT_CHUNK_DOCS,
+        chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+        workers: int = DEFAULT_WORKERS,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        initial_backoff: float = 1.0,
+        progress: Optional[Progress] = None,
+    ):
+        self.es = es
+        self.index = index
+        self.chunk_docs = chunk_docs
+        self.chunk_bytes = chunk_bytes
+        self.workers = workers
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.progress = progress or Progress()
+        self.errors: List[dict] = []  # первые неретраебельные ошибки для диагностики
+        self._errors_lock = threading.Lock()  # send() идёт из потоков пула
+
+    def chunks(self, docs: Iterable[Tuple[Optional[str], Optional[dict]]]) -> Iterator[List[BulkItem]]:
+        """Чанки не длиннее chunk_docs элементов и chunk_bytes байт (один большой документ — отдельный чанк).
+
+        Документ None означает удаление doc_id.
+        """
+        chunk: List[BulkItem] = []
+        size = 0
+        for doc_id, doc in docs:
+            meta = {"_index": self.index}
+            if doc_id is not None:
+                meta["_id"] = doc_id
+            if doc is None:
+                item: BulkItem = (_dumps({"delete": meta}),)
+            else:
+                item = (_dumps({"index": meta}), _dumps(doc))
+            item_size = sum(len(line) for line in item)
+            if chunk and (len(chunk) >= self.chunk_docs or size + item_size > self.chunk_bytes):
+                yield chunk
+                chunk, size = [], 0
+            chunk.append(item)
+            size += item_size
+        if chunk:
+            yield chunk
+
+    def send(self, chunk: List[BulkItem]) -> None:
+        """Отправляет чанк; элементы с 429 и весь запрос при 429/503/таймауте переотправляет, пока есть попытки.
+
+        Повтор всего чанка безопасен: у документов есть _id, index перезаписывает,
+        delete уже удалённого даёт 404, который не считается ошибкой.
+        """
+        from elasticsearch import ApiError, ConnectionTimeout
+        pending = chunk
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(min(self.initial_backoff * 2 ** (attempt - 1), 60.0))
+            lines = [line for item in pending for line in item]
+            try:
+                response = self.es.bulk(operations=lines)
+            except (ApiError, ConnectionTimeout) as exc:
+                retryable = isinstance(exc, ConnectionTimeout) or exc.status_code in REQUEST_RETRY_STATUSES
+                if not retryable or attempt == self.max_retries:
+                    raise
+                self.progress.add(retried=len(pending))
+                continue
+            sent_bytes = sum(len(line) for line in lines)
+            if not response.get("errors"):
+                self.progress.add(docs=len(pending), nbytes=sent_bytes, chunks=1)
+                return
+
+            retry: List[BulkItem] = []
+            failed = 0
+            for item, result in zip(pending, response["items"]):
+                outcome = next(iter(result.values()))
+                status = outcome.get("status", 500)
+                if status < 300 or ("delete" in result and status == 404):  # уже удалён
+                    continue
+                if status in RETRY_STATUSES and attempt < self.max_retries:
+                    retry.append(item)
+                else:
+                    failed += 1
+                    with self._errors_lock:
+                        if len(self.errors) < MAX_ERRORS_KEPT:
+                            self.errors.append({"_id": outcome.get("_id"), "status": status, "error": outcome.get("error")})
+            self.progress.add(docs=len(pending) - len(retry) - failed, nbytes=sent_bytes,
+                              failed=failed, retried=len(retry), chunks=1)
+            if not retry:
+                return
+            pending = retry
+
+    def run(self, docs: Iterable[Tuple[Optional[str], Optional[dict]]]) -> Dict[str, float]:
+        """Индексирует поток (id, документ или None для удаления); в полёте не больше 2 * workers чанков."""
+        in_flight: Set[Future] = set()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for chunk in self.chunks(docs):
+                if len(in_flight) >= 2 * self.workers:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                in_flight.add(pool.submit(self.send, chunk))
+                self.progress.maybe_report()
+            for future in in_flight:
+                future.result()
+        self.progress.maybe_report(force=True)
+        for error in self.errors:
+            print(f"  bulk error: {error}")
+        return self.progress.snapshot()
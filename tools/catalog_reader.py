@@ -0,0 +1,132 @@
+"""Потоковое чтение XML-каталога.
+
+ET.parse строит всё дерево в памяти; iterparse отдаёт товары по одному и
+очищает разобранные элементы, так что пиковая память не зависит от размера
+фида, а время чтения растёт линейно.
+
+Так же читаются NDJSON-каталоги (.ndjson/.jsonl, по товару на строку) и
+каталог-директория с шардами из generate_catalog.py --shards.
+"""
+from __future__ import annotations
+
+import json
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+from normalize import normalize_text
+from quantity import Quantity, to_base
+
+
+@dataclass
+class Product:
+    """Товар из каталога с уже разобранными числовыми полями."""
+    id: str
+    name: str
+    category: str
+    brand: str
+    weight: str  # исходный текст веса, например "500"
+    weight_unit: str  # атрибут unit: g, kg, ml, l, pcs, ...
+    weight_num: Optional[float]
+    quantity: Optional[Quantity]  # вес в базовых единицах по unit: 5 kg -> (mass, 5000.0)
+    package_size: int
+    keywords: str
+    description: str
+    price: float
+    currency: str
+    image_url: str
+    norm_name: str = field(init=False, repr=False, compare=False)  # normalize_text(name), считается один раз
+
+    def __post_init__(self):
+        self.norm_name = normalize_text(self.name)
+
+
+def parse_weight(weight_str: str) -> float | None:
+    """Выделяет число из строки веса, возвращает float или None."""
+    if not weight_str:
+        return None
+    match = re.search(r'[\d\.]+', weight_str)
+    return float(match.group()) if match else None
+
+
+def _text(elem: ET.Element, tag: str) -> str:
+    return (elem.findtext(tag) or '').strip()
+
+
+def _to_product(elem: ET.Element) -> Product:
+    weight_elem = elem.find('weight')
+    price_elem = elem.find('price')
+    weight = _text(elem, 'weight')
+    weight_unit = weight_elem.get('unit', '') if weight_elem is not None else ''
+    weight_num = parse_weight(weight)
+    package_size = _text(elem, 'package_size')
+    price = _text(elem, 'price')
+    return Product(
+        id=elem.get('id', ''),
+        name=_text(elem, 'name'),
+        category=_text(elem, 'category'),
+        brand=_text(elem, 'brand'),
+        weight=weight,
+        weight_unit=weight_unit,
+        weight_num=weight_num,
+        quantity=to_base(weight_num, weight_unit),
+        package_size=int(package_size) if package_size.isdigit() else 1,
+        keywords=_text(elem, 'keywords'),
+        description=_text(elem, 'description'),
+        price=float(price) if price else 0.0,
+        currency=price_elem.get('currency', '') if price_elem is not None else '',
+        image_url=_text(elem, 'image_url'),
+    )
+
+
+def _from_json(row: dict) -> Product:
+    weight = str(row.get('weight') or '').strip()
+    weight_unit = row.get('unit') or ''
+    weight_num = parse_weight(weight)
+    package_size = str(row.get('package_size') or '')
+    price = str(row.get('price') or '')
+    return Product(
+        id=row.get('id', ''),
+        name=(row.get('name') or '').strip(),
+        category=(row.get('category') or '').strip(),
+        brand=(row.get('brand') or '').strip(),
+        weight=weight,
+        weight_unit=weight_unit,
+        weight_num=weight_num,
+        quantity=to_base(weight_num, weight_unit),
+        package_size=int(package_size) if package_size.isdigit() else 1,
+        keywords=(row.get('keywords') or '').strip(),
+        description=(row.get('description') or '').strip(),
+        price=float(price) if price else 0.0,
+        currency=row.get('currency') or '',
+        image_url=(row.get('image_url') or '').strip(),
+    )
+
+
+def iter_products(path: Union[str, Path]) -> Iterator[Product]:
+    """Товары каталога по одному; обработанные элементы сразу освобождаются.
+
+    path — XML, NDJSON или директория с шардами (читаются по порядку имён).
+    """
+    path = Path(path)
+    if path.is_dir():
+        for shard in sorted(path.iterdir()):
+            if shard.suffix in ('.xml', '.ndjson', '.jsonl'):
+                yield from iter_products(shard)
+        return
+    if path.suffix in ('.ndjson', '.jsonl'):
+        with path.open(encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield _from_json(json.loads(line))
+        return
+    context = ET.iterparse(str(path), events=('start', 'end'))
+    _, root = next(context)  # <catalog>
+    for event, elem in context:
+        if event == 'end' and elem.tag == 'product':
+            yield _to_product(elem)
+            # Без root.clear() корень продолжает держать ссылки на пустые <product>
+            elem.clear()
+            root.clear()
@@ -0,0 +1,51 @@
+"""Общая ленивая фабрика клиента Elasticsearch и модели эмбеддингов.
+
+Тяжёлые зависимости (elasticsearch, sentence_transformers/torch) импортируются
+при первом вызове get_es()/get_model(), а не при импорте модуля, поэтому
+сводка каталога и прочие офлайн-команды не платят за загрузку torch.
+Модель одна для индекса (load_catalog.py) и запроса (evaluate.py), иначе
+векторы документов и запросов лежат в разных пространствах.
+"""
+from __future__ import annotations
+
+import os
+from functools import lru_cache
+
+ES_URL = os.environ.get("ES_URL", "http://localhost:9200")
+ALIAS = "products"  # поиск всегда идёт через алиас, за ним версионированные products_v*
+# Каталог и запросы русские, поэтому мультиязычная модель; размерность берётся у неё (embedding_dims)
+MODEL_NAME = os.environ.get("EMBEDDING_MODEL", "paraphrase-multilingual-MiniLM-L12-v2")
+EMBEDDING_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR", ".cache/embeddings")
+
+
+@lru_cache(maxsize=None)
+def get_es():
+    """Единственный на процесс клиент Elasticsearch (внутри пул keep-alive соединений)."""
+    from elasticsearch import Elasticsearch
+    return Elasticsearch(ES_URL)
+
+
+@lru_cache(maxsize=None)
+def get_model():
+    """Модель MODEL_NAME, загружается один раз при первом обращении."""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(MODEL_NAME)
+
+
+@lru_cache(maxsize=None)
+def embedding_dims() -> int:
+    """Размерность векторов MODEL_NAME; маппинг vector и хранилища строятся по ней, а не по константе."""
+    return get_model().get_sentence_embedding_dimension()
+
+
+@lru_cache(maxsize=None)
+def get_encoder(cache_dir: str, lru_size: int = 0):
+    """get_model() за кешем эмбеддингов (см. embedding_cache.py); один экземпляр на (cache_dir, lru_size)."""
+    from embedding_cache import cached_encoder
+    return cached_encoder(get_model(), MODEL_NAME, cache_dir=cache_dir, lru_size=lru_size)
+
+
+def make_async_es(connections_per_node: int = 32):
+    """Новый AsyncElasticsearch с пулом keep-alive соединений; закрывать через await client.close()."""
+    from elasticsearch import AsyncElasticsearch
+    return AsyncElasticsearch(ES_URL, connections_per_node=connections_per_node)
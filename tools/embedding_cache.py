@@ -0,0 +1,298 @@
+"""Постоянный кеш эмбеддингов по (модель, хеш нормализованного текста).
+
+На диске для каждой модели лежит каталог с поколениями g000001, g000002, ...
+и симлинком current на действующее. В поколении:
+- vectors.f32 — float32-строки размерности dim, только дописываются;
+- index.npy — отсортированные пары (64-битный хеш текста, номер строки).
+
+Оба файла открываются через memory map, поэтому несколько процессов могут
+читать один кеш без копий в памяти. Индекс переписывается атомарно (os.replace)
+при flush(). Когда записей больше max_entries, последние дописанные векторы
+переносятся в новое поколение и current переключается одной заменой симлинка.
+Для запросов перед диском стоит ограниченный LRU в памяти.
+"""
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+from clients import EMBEDDING_CACHE_DIR as DEFAULT_CACHE_DIR
+from text_hash import text_key
+
+INDEX_DTYPE = np.dtype([("key", "<u8"), ("row", "<i8")])
+DEFAULT_MAX_ENTRIES = 500_000  # ~770 MB float32 при dim=384; сверх — уплотнение до половины
+
+
+class EmbeddingStore:
+    """Дисковое хранилище векторов одной модели (memory map + отсортированный индекс смещений).
+
+    Писать могут несколько процессов: дозапись векторов, слияние индекса и
+    уплотнение идут под файловой блокировкой (flock на .lock).
+    """
+
+    def __init__(self, cache_dir: Union[str, Path], model_name: str, dim: int, readonly: bool = False,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = Path(cache_dir) / re.sub(r"[^\w.-]+", "_", model_name)
+        self.model_name = model_name
+        self.dim = dim
+        self.readonly = readonly
+        self.max_entries = max_entries
+        self._pending: Dict[int, int] = {}  # ключи, дописанные после последнего flush()
+        self._vectors: Optional[np.memmap] = None
+
+        meta_path = self.path / "meta.json"
+        if meta_path.exists():
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            if meta["dim"] != dim or meta["model"] != model_name:
+                raise ValueError(f"Embedding cache {self.path} was built for {meta}, not {model_name}/{dim}")
+        elif not readonly:
+            self.path.mkdir(parents=True, exist_ok=True)
+            meta_path.write_text(json.dumps({"model": model_name, "dim": dim}), encoding="utf-8")
+        self._load()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with open(self.path / ".lock", "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _current(self) -> Optional[str]:
+        try:
+            return os.readlink(self.path / "current")
+        except FileNotFoundError:
+            return None
+
+    def _load(self) -> None:
+        """Открывает индекс поколения, на которое сейчас указывает current."""
+        self._generation = self._current()
+        self._vectors = None
+        index_path = self.path / str(self._generation) / "index.npy"
+        index = np.load(index_path, mmap_mode="r") if self._generation and index_path.exists() \
+            else np.empty(0, dtype=INDEX_DTYPE)
+        self._keys, self._rows = index["key"], index["row"]
+
+    def _generation_path(self) -> Path:
+        return self.path / str(self._generation)
+
+    def _file_rows(self) -> int:
+        vectors_path = self._generation_path() / "vectors.f32"
+        return vectors_path.stat().st_size // (4 * self.dim) if vectors_path.exists() else 0
+
+    def __len__(self) -> int:
+        return len(self._keys) + len(self._pending)
+
+    def _row(self, key: int) -> Optional[int]:
+        row = self._pending.get(key)
+        if row is not None:
+            return row
+        pos = int(np.searchsorted(self._keys, np.uint64(key)))
+        if pos < len(self._keys) and int(self._keys[pos]) == key:
+            return int(self._rows[pos])
+        return None
+
+    def _vector(self, row: int) -> np.ndarray:
+        if self._vectors is None or row >= len(self._vectors):
+            self._vectors = np.memmap(self._generation_path() / "vectors.f32", dtype=np.float32, mode="r",
+                                      shape=(self._file_rows(), self.dim))
+        return np.array(self._vectors[row])
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        row = self._row(text_key(text))
+        return None if row is None else self._vector(row)
+
+    def _switch(self, generation: str) -> None:
+        """Переводит current на поколение одной атомарной заменой симлинка."""
+        tmp = self.path / "current.tmp"
+        tmp.unlink(missing_ok=True)
+        os.symlink(generation, tmp)
+        os.replace(tmp, self.path / "current")
+
+    def _next_generation(self) -> str:
+        number = int(self._generation[1:]) + 1 if self._generation else 1
+        generation = f"g{number:06d}"
+        (self.path / generation).mkdir()
+        (self.path / generation / "vectors.f32").touch()
+        return generation
+
+    def _append(self, vectors: np.ndarray) -> int:
+        """Дописывает строки в vectors.f32 текущего поколения; номер первой строки."""
+        row_bytes = 4 * self.dim
+        with open(self._generation_path() / "vectors.f32", "ab") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size % row_bytes:  # недописанная строка упавшего писателя
+                f.truncate(size - size % row_bytes)
+            f.write(np.asarray(vectors, dtype=np.float32).tobytes())
+        return size // row_bytes
+
+    def _sync(self) -> None:
+        """Под блокировкой: догоняет поколение, сменённое другим писателем, вместе со своими pending."""
+        current = self._current()
+        if current is None:
+            self._generation = None
+            current = self._next_generation()
+            self._switch(current)
+        if current == self._generation:
+            return
+        moved = [(key, self._vector(row)) for key, row in self._pending.items()] if self._pending else []
+        self._pending.clear()
+        self._load()
+        moved = [(key, vector) for key, vector in moved if self._row(key) is None]
+        if moved:
+            first = self._append(np.stack([vector for _, vector in moved]))
+            self._pending.update((key, first + i) for i, (key, _) in enumerate(moved))
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray) -> None:
+        if self.readonly:
+            return
+        with self._locked():
+            self._sync()
+            fresh_by_key: Dict[int, np.ndarray] = {}
+            for text, vector in zip(texts, vectors):
+                key = text_key(text)
+                if key not in fresh_by_key and self._row(key) is None:
+                    fresh_by_key[key] = vector
+            if not fresh_by_key:
+                return
+            first = self._append(np.stack(list(fresh_by_key.values())))
+            self._pending.update((key, first + i) for i, key in enumerate(fresh_by_key))
+
+    def flush(self) -> None:
+        """Сливает новые ключи с индексом на диске и публикует его одним os.replace.
+
+        Ключи и строки лежат в одном index.npy, поэтому читатель не увидит новые
+        строки со старыми ключами. Индекс перечитывается под блокировкой: другие
+        писатели могли сбросить свои ключи после нашего открытия. Если записей
+        больше max_entries, поколение уплотняется (compact).
+        """
+        if self.readonly or not self._pending:
+            return
+        with self._locked():
+            self._sync()
+            index_path = self._generation_path() / "index.npy"
+            on_disk = np.load(index_path) if index_path.exists() else np.empty(0, dtype=INDEX_DTYPE)
+            fresh = np.empty(len(self._pending), dtype=INDEX_DTYPE)
+            fresh["key"] = np.fromiter(self._pending.keys(), dtype=np.uint64, count=len(self._pending))
+            fresh["row"] = np.fromiter(self._pending.values(), dtype=np.int64, count=len(self._pending))
+            fresh = fresh[~np.isin(fresh["key"], on_disk["key"])]  # тот же текст уже сбросил другой писатель
+            index = np.concatenate([on_disk, fresh])
+            index = index[np.argsort(index["key"], kind="stable")]
+            self._pending.clear()
+            if len(index) > self.max_entries:
+                self._compact(index)
+            else:
+                tmp = self._generation_path() / "index.tmp.npy"
+                np.save(tmp, index)
+                os.replace(tmp, index_path)
+            self._load()
+
+    def _compact(self, index: np.ndarray) -> None:
+        """Новое поколение с max_entries // 2 последними дописанными векторами.
+
+        Предыдущее поколение остаётся для читателей, открывших его до
+        переключения; более старые удаляются.
+        """
+        kept = index[np.argsort(index["row"])[-(self.max_entries // 2):]]  # строки идут в порядке дозаписи
+        source = np.memmap(self._generation_path() / "vectors.f32", dtype=np.float32, mode="r",
+                           shape=(self._file_rows(), self.dim))
+        previous = self._generation
+        self._generation = self._next_generation()
+        self._append(source[kept["row"]])
+        del source
+        kept["row"] = np.arange(len(kept))
+        np.save(self._generation_path() / "index.npy", kept[np.argsort(kept["key"], kind="stable")])
+        self._switch(self._generation)
+        for stale in self.path.glob("g*"):
+            if stale.name not in (previous, self._generation):
+                shutil.rmtree(stale, ignore_errors=True)
+
+
+class CachedEncoder:
+    """Обёртка над моделью с тем же encode(): сначала LRU в памяти, потом диск, промахи — одним батчем в модель."""
+
+    def __init__(self, model, store: Optional[EmbeddingStore] = None, lru_size: int = 0):
+        self.model = model
+        self.store = store
+        self.lru_size = lru_size
+        self._lru: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()  # LRU и дозапись на диск из нескольких потоков; сама модель вне блокировки
+        self.hits_memory = self.hits_disk = self.misses = 0
+
+    def _lookup(self, text: str) -> Optional[np.ndarray]:
+        vector = self._lru.get(text)
+        if vector is not None:
+            self._lru.move_to_end(text)
+            self.hits_memory += 1
+            return vector
+        vector = self.store.get(text) if self.store is not None else None
+        if vector is not None:
+            self.hits_disk += 1
+            self._remember(text, vector)
+        return vector
+
+    def _remember(self, text: str, vector: np.ndarray) -> None:
+        if self.lru_size <= 0:
+            return
+        self._lru[text] = vector
+        self._lru.move_to_end(text)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def encode(self, texts: Union[str, List[str]], **kwargs) -> np.ndarray:
+        """Как model.encode: строка -> вектор, список -> матрица."""
+        single = isinstance(texts, str)
+        batch = [texts] if single else list(texts)
+        with self._lock:
+            found = [self._lookup(text) for text in batch]
+            missing = [i for i, vector in enumerate(found) if vector is None]
+            self.misses += len(missing)
+        if missing:
+            missing_texts = list(dict.fromkeys(batch[i] for i in missing))  # повторы в батче кодируем один раз
+            encoded = np.asarray(self.model.encode(missing_texts, **kwargs), dtype=np.float32)
+            by_text = dict(zip(missing_texts, encoded))
+            for i in missing:
+                found[i] = by_text[batch[i]]
+            with self._lock:
+                for text, vector in by_text.items():
+                    self._remember(text, vector)
+                if self.store is not None:
+                    self.store.put_many(missing_texts, encoded)
+        result = np.stack(found) if found else np.empty((0, 0), dtype=np.float32)
+        return result[0] if single else result
+
+    def flush(self) -> None:
+        if self.store is not None:
+            with self._lock:
+                self.store.flush()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_ratio": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+            "lru_entries": len(self._lru),
+            "disk_entries": len(self.store) if self.store is not None else 0,
+        }
+
+
+def cached_encoder(model, model_name: str, cache_dir: str = DEFAULT_CACHE_DIR,
+                   lru_size: int = 0, readonly: bool = False) -> CachedEncoder:
+    """CachedEncoder с дисковым кешем в cache_dir; пустой cache_dir — только LRU."""
+    store = None
+    if cache_dir:
+        store = EmbeddingStore(cache_dir, model_name, model.get_sentence_embedding_dimension(), readonly=readonly)
+    return CachedEncoder(model, store, lru_size=lru_size)
@@ -10,11 +10,17 @@ import argparse
 import csv
 from pathlib import Path
 import time
-import re
 import json
-from typing import List, Dict
-from elasticsearch import Elasticsearch
-from sentence_transformers import SentenceTransformer
+from typing import Callable, List, Dict, NamedTuple, Optional, Tuple
+
+from clients import ALIAS, EMBEDDING_CACHE_DIR, get_encoder, get_es
+from load_runner import DEFAULT_WORKERS, StageTimings, print_report, run_load
+from normalize import normalize_query
+import prefix_purity
+from quantity import Quantity, parse_query_quantity
+from query_log import DEFAULT_LOG_PATH, QueryLogger
+from result_cache import DEFAULT_EXPANSIONS, DEFAULT_MAX_ENTRIES, DEFAULT_TTL, ResultCache, prewarm_queries
+from translit import normalized_variants
 
 TEMPLATE_COLUMNS = [
     "query",
@@ -31,72 +37,73 @@ TEMPLATE_COLUMNS = [
     "judgement",
 ]
 
-es = Elasticsearch("http://localhost:9200")
-model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-
-LAT_TO_RU_KEYMAP = {
-    'a': 'ф', 'b': 'и', 'c': 'с', 'd': 'в', 'e': 'у', 'f': 'а', 'g': 'п', 'h': 'р', 'i': 'ш', 'j': 'о',
-    'k': 'л', 'l': 'д', 'm': 'ь', 'n': 'т', 'o': 'щ', 'p': 'з', 'q': 'й', 'r': 'к', 's': 'ы', 't': 'е',
-    'u': 'г', 'v': 'м', 'w': 'ц', 'x': 'ч', 'y': 'н', 'z': 'я', ';': 'ж', "'": 'э', ',': 'б', '.': 'ю',
-    '/': '.', '[': 'х', ']': 'ъ',
-}
-RU_TO_LAT_KEYMAP = {v: k for k, v in LAT_TO_RU_KEYMAP.items() if v != k}
-
-def normalize_text(text: str) -> str:
-    text = text.lower().replace('ё', 'е').strip()
-    text = re.sub(r'[^\w\s]', '', text)
-    text = re.sub(r'\s+', ' ', text)
-    return text
-
-def lat_to_ru_keymap(text: str) -> str:
-    return ''.join(LAT_TO_RU_KEYMAP.get(c, c) for c in text)
-
-def ru_to_lat_keymap(text: str) -> str:
-    return ''.join(RU_TO_LAT_KEYMAP.get(c, c) for c in text)
+QUERY_LRU_SIZE = 10000
+embedding_cache_dir = EMBEDDING_CACHE_DIR  # main() переопределяет из --embedding-cache
 
-def generate_translit_variants(text: str) -> List[str]:
-    return list(set([text, ru_to_lat_keymap(text), lat_to_ru_keymap(text)]))
+def query_encoder():
+    """Модель запросов за LRU и дисковым кешем; создаётся при первом запросе."""
+    return get_encoder(embedding_cache_dir, QUERY_LRU_SIZE)
 
-def parse_weight(weight_str: str) -> float | None:
-    """Выделяет число из строки типа '10л' или '3 кг'"""
-    if not weight_str:
+def numeric_filter_for(quantity: Optional[Quantity]) -> dict | None:
+    """Фильтр по весу в базовых единицах: "5л" -> quantity_base >= 5000 среди объёмов."""
+    if quantity is None:
         return None
-    match = re.search(r"[\d\.]+", weight_str)
-    if match:
-        return float(match.group())
-    return None
+    # range в must даёт +1 к score, как раньше; измерение — только фильтр
+    return {"bool": {
+        "must": [{"range": {"quantity_base": {"gte": quantity.amount}}}],
+        "filter": [{"term": {"quantity_dim": quantity.dimension}}],
+    }}
 
 def extract_numeric_filter(query: str) -> dict | None:
-    """Если в запросе есть вес, возвращаем фильтр по числовому полю"""
-    match = re.search(r'(\d+)(л|кг|г|мл|шт)', query.lower())
-    if match:
-        num = float(match.group(1))
-        return {"range": {"weight_num": {"gte": num}}}
-    return None
-
-def search_es(original_query: str) -> tuple[List[dict], int, dict]:
-    norm_query = normalize_text(original_query)
-    variants = ' '.join(generate_translit_variants(norm_query))
-    query_vector = model.encode(norm_query).tolist()
-    numeric_filter = extract_numeric_filter(original_query)
-
+    """Если в запросе есть вес ('10л', '500 г', '5kg'), возвращаем фильтр по числовому полю"""
+    return numeric_filter_for(parse_query_quantity(query))
+
+class PreparedQuery(NamedTuple):
+    norm_query: str
+    variants: str
+    numeric_filter: Optional[dict]
+    quantity: Optional[Quantity] = None
+    categories: Optional[Tuple[str, ...]] = None  # правдоподобные категории по prefix_purity; None — все
+
+def prepare_query(original_query: str) -> PreparedQuery:
+    """Всё, что нужно запросу до кодирования: нормализованный текст, варианты транслита, числовой фильтр, категории."""
+    # Варианты строим от сырого запроса: клавиши ';', '[' и т.п. исчезают после normalize_text
+    variants = ' '.join(normalized_variants(original_query.lower()))
+    quantity = parse_query_quantity(original_query)
+    norm_query = normalize_query(original_query)
+    return PreparedQuery(norm_query, variants, numeric_filter_for(quantity), quantity,
+                         prefix_purity.plausible_categories(norm_query))
+
+def build_es_query(prepared: PreparedQuery, query_vector: List[float], size: int = 10) -> dict:
+    """Гибридный запрос на size хитов; kNN берёт не меньше size соседей, чтобы было из чего выбрать."""
     bool_query = {
-        "must": [numeric_filter] if numeric_filter else [],
+        "must": [prepared.numeric_filter] if prepared.numeric_filter else [],
         "should": [
             {"multi_match": {
-                "query": norm_query,
+                "query": prepared.norm_query,
                 "fields": ["name^3", "name_variants^2", "description"],
                 "type": "bool_prefix",
                 "fuzziness": "AUTO"
             }},
             {"multi_match": {
-                "query": variants,
+                "query": prepared.variants,
                 "fields": ["name_variants"],
                 "fuzziness": "AUTO"
             }},
         ],
         "minimum_should_match": 1
     }
+    knn = {
+        "field": "vector",
+        "query_vector": query_vector,
+        "k": max(20, size),
+        "num_candidates": max(100, size)
+    }
+    if prepared.categories:
+        # Фильтр, а не should: неправдоподобные категории отсекаются до скоринга и в kNN
+        category_filter = {"terms": {"category": list(prepared.categories)}}
+        bool_query["filter"] = [category_filter]
+        knn["filter"] = category_filter
 
     query_body = {
         "function_score": {
@@ -105,49 +112,179 @@ def search_es(original_query: str) -> tuple[List[dict], int, dict]:
         }
     }
 
-    es_query = {
+    return {
         "query": query_body,
-        "knn": {
-            "field": "vector",
-            "query_vector": query_vector,
-            "k": 20,
-            "num_candidates": 100
-        },
-        "size": 10,
+        "knn": knn,
+        "size": size,
         "min_score": 0.0,
         "_source": ["name", "category", "price", "weight"]
     }
 
-    start_time = time.time()
-    res = es.search(index="products", body=es_query)
-    latency_ms = int((time.time() - start_time) * 1000)
-    hits = res['hits']['hits']
-
+def rerank(hits: List[dict], norm_query: str) -> List[dict]:
+    """+1 к score товарам, чьё название начинается с запроса."""
     for hit in hits:
-        name = normalize_text(hit['_source']['name'])
+        name = normalize_query(hit['_source']['name'])  # названия в выдаче повторяются — из того же LRU
         hit['_score'] += 1.0 if name.startswith(norm_query) else 0.0
-
-    reranked = sorted(hits, key=lambda h: -h['_score'])
-    return reranked, latency_ms, es_query
+    return sorted(hits, key=lambda h: -h['_score'])
+
+def search_es(original_query: str, timings: Optional[StageTimings] = None,
+              prepared: Optional[PreparedQuery] = None) -> tuple[List[dict], int, dict]:
+    """Гибридный поиск; в timings (если передан) пишутся наносекунды стадий normalize, encode, es, rerank.
+
+    prepared — уже подготовленный запрос (его же пишет лог); тогда normalize меряет вызывающий.
+    """
+    timings = {} if timings is None else timings
+    t0 = time.perf_counter_ns()
+    if prepared is None:
+        prepared = prepare_query(original_query)
+        timings["normalize"] = time.perf_counter_ns() - t0
+    t1 = time.perf_counter_ns()
+    query_vector = query_encoder().encode(prepared.norm_query).tolist()
+    t2 = time.perf_counter_ns()
+    es_query = build_es_query(prepared, query_vector)
+    res = get_es().search(index=ALIAS, body=es_query)
+    t3 = time.perf_counter_ns()
+    reranked = rerank(res['hits']['hits'], prepared.norm_query)
+    timings["encode"] = t2 - t1
+    timings["es"] = t3 - t2
+    timings["rerank"] = time.perf_counter_ns() - t3
+    return reranked, (t3 - t2) // 1_000_000, es_query
+
+# Общий интерфейс бэкендов: (запрос, timings, prepared) -> (hits в формате ES, latency_ms, тело запроса)
+SearchBackend = Callable[[str, Optional[StageTimings], Optional[PreparedQuery]], Tuple[List[dict], int, dict]]
+search_backend: SearchBackend = search_es  # main() может переключить на LocalSearchEngine.search
+
+def make_backend(name: str, catalog: str = "data/catalog_products.xml", vector_store: str = "") -> SearchBackend:
+    """'es' — Elasticsearch за алиасом products, 'local' — тот же запрос в памяти процесса (local_search.py).
+
+    vector_store — каталог int8-хранилища (vector_store.py) для kNN локального движка.
+    """
+    if name == "es":
+        return search_es
+    if name == "local":
+        from local_search import LocalSearchEngine
+        return LocalSearchEngine(catalog, vector_store=vector_store or None).search
+    raise ValueError(f"Unknown backend: {name}")
+
+def catalog_version() -> Tuple[str, int]:
+    """Версия каталога: физический индекс за алиасом и число операций записи в него (меняется и при --delta)."""
+    from elasticsearch import NotFoundError
+    es = get_es()
+    try:
+        targets = ",".join(sorted(es.indices.get_alias(name=ALIAS).keys()))
+    except NotFoundError:  # products — обычный индекс (старая схема без алиаса)
+        targets = ALIAS
+    indexing = es.indices.stats(index=ALIAS, metric="indexing")["_all"]["primaries"]["indexing"]
+    return targets, indexing["index_total"] + indexing["delete_total"]
+
+result_cache: Optional[ResultCache] = None  # включается в main(); None — каждый запрос идёт в ES
+query_log: Optional[QueryLogger] = None  # --query-log: NDJSON-лог запросов и метрики Prometheus
+
+def log_search(original_query: str, site: str, results: List[dict], es_query: dict,
+               timings: Optional[StageTimings], prepared: Optional[PreparedQuery] = None) -> None:
+    """prepared — запрос, с которым шёл поиск; None при попадании в кеш результатов."""
+    if query_log is not None:
+        query_log.log_search(original_query, site, results, es_query, timings, backend=es_query.get("backend", "es"),
+                             prepared=prepared)
+
+def timed_prepare(original_query: str, timings: Optional[StageTimings]) -> PreparedQuery:
+    started = time.perf_counter_ns()
+    prepared = prepare_query(original_query)
+    if timings is not None:
+        timings["normalize"] = time.perf_counter_ns() - started
+    return prepared
+
+def cached_search(original_query: str, site: str = "",
+                  timings: Optional[StageTimings] = None) -> tuple[List[dict], int, dict]:
+    """search_es через result_cache; при попадании latency_ms — время ответа из кеша, стадий в timings нет.
+
+    site только пишется в лог: выдача от него не зависит, поэтому в ключ кеша не входит. Возвращаются
+    копии хитов — rerank и вызывающий код меняют _score на месте, а список в кеше общий.
+    """
+    if result_cache is None:
+        prepared = timed_prepare(original_query, timings)
+        results, latency_ms, es_query = search_backend(original_query, timings, prepared)
+        log_search(original_query, site, results, es_query, timings, prepared)
+        return results, latency_ms, es_query
+    # Пунктуацию не выбрасываем: ';' или '[' в раскладочной опечатке дают другие варианты
+    key = (" ".join(original_query.lower().split()), json.dumps(extract_numeric_filter(original_query), sort_keys=True))
+    start_time = time.perf_counter()
+    used: List[PreparedQuery] = []
+
+    def compute() -> Tuple[List[dict], int, dict]:
+        used.append(timed_prepare(original_query, timings))
+        return search_backend(original_query, timings, used[0])
+
+    (results, latency_ms, es_query), hit = result_cache.get_or_compute(key, compute)
+    if hit:
+        latency_ms = int((time.perf_counter() - start_time) * 1000)
+    results = [dict(result) for result in results]
+    log_search(original_query, site, results, es_query, timings, used[0] if used else None)
+    return results, latency_ms, es_query
+
+def prewarm(path: Path, top_n: int) -> int:
+    """Заполняет result_cache самыми частыми запросами каждого сайта из PREFIX_EXPANSIONS."""
+    pairs = prewarm_queries(path, top_n)
+    for query, site in pairs:
+        cached_search(query, site)
+    return len(pairs)
 
 def get_judgement(score: float) -> str:
     if score > 0.7: return "good"
     elif score >= 0.5: return "fair"
     else: return "bad"
 
-def evaluate_and_fill(queries_path: Path, output_path: Path) -> None:
+def run_batches(requests: List[Tuple[str, str]], searcher, batch_size: int) -> Tuple[List[Tuple], Dict]:
+    """Тот же прогон через batch_search.BatchSearcher.
+
+    latency_ms строки, как и при одиночных запросах, — сколько вызывающий ждал её результат: запрос
+    в батче ждёт весь батч, поэтому это время батча, а не среднее на запрос (пропускная способность — в отчёте).
+    """
+    outcomes = []
+    started = time.perf_counter()
+    for start in range(0, len(requests), batch_size):
+        batch = requests[start:start + batch_size]
+        batch_started = time.perf_counter_ns()
+        prepared = searcher.prepare([query for query, _ in batch])
+        results = searcher.search([query for query, _ in batch], prepared)
+        waited = time.perf_counter_ns() - batch_started
+        for (query, site), result, p in zip(batch, results, prepared):
+            log_search(query, site, result[0], result[2], {"service": waited}, p)
+            outcomes.append((result, {"service": waited}))
+    report = {"batch_size": batch_size, **searcher.report(time.perf_counter() - started)}
+    print(f"{report['requests']} requests in {report['seconds']:.2f}s ({report['throughput_qps']:.1f} qps, "
+          f"batches of {batch_size}, {report['processes']} processes)")
+    return outcomes, report
+
+def evaluate_and_fill(queries_path: Path, output_path: Path, workers: int = 1, qps: float = 0.0, repeat: int = 1,
+                      batch_searcher=None, batch_size: int = 0) -> None:
+    """Прогоняет запросы (repeat раз, в workers потоков, при qps > 0 — с заданной частотой) и пишет CSV и метрики.
+
+    В CSV попадает первый проход; latency_ms в строке — полное время запроса, включая кодирование.
+    С batch_searcher запросы идут батчами по batch_size мимо кеша результатов.
+    """
     total = success = precision_at_3 = 0
     logs = []
 
-    with queries_path.open(newline="", encoding="utf-8") as src, output_path.open("w", newline="", encoding="utf-8") as dst:
-        reader = csv.DictReader(src)
+    with queries_path.open(newline="", encoding="utf-8") as src:
+        rows = list(csv.DictReader(src))
+    requests = [(row.get("query", ""), row.get("site") or "") for row in rows] * repeat
+    if batch_searcher is not None:
+        outcomes, load_report = run_batches(requests, batch_searcher, batch_size)
+    else:
+        outcomes, load_report = run_load(requests, lambda query, site, timings: cached_search(query, site, timings),
+                                         workers=workers, qps=qps)
+        print_report(load_report)
+
+    with output_path.open("w", newline="", encoding="utf-8") as dst:
         writer = csv.DictWriter(dst, fieldnames=TEMPLATE_COLUMNS)
         writer.writeheader()
 
-        for row in reader:
+        for row, (outcome, timings) in zip(rows, outcomes):
             total += 1
             query = row.get("query", "")
-            results, latency_ms, es_q = search_es(query)
+            results = outcome[0] if outcome is not None else []
+            latency_ms = timings["service"] // 1_000_000
             top_results = results[:3]
 
             top_1 = top_results[0]['_source']['name'] if len(top_results) > 0 else ""
@@ -181,15 +318,29 @@ def evaluate_and_fill(queries_path: Path, output_path: Path) -> None:
 
     coverage = (success / total) * 100 if total > 0 else 0
     avg_precision_at_3 = (precision_at_3 / total) * 100 if total > 0 else 0
+    encoder = query_encoder()
+    encoder.flush()
+    cache_stats = encoder.stats()
     print(f"Coverage: {coverage:.2f}%")
     print(f"Avg Precision@3: {avg_precision_at_3:.2f}%")
+    print(f"Embedding cache hit ratio: {cache_stats['hit_ratio']:.1%}")
+    result_stats = result_cache.stats() if result_cache is not None else {}
+    if result_stats:
+        print(f"Result cache hit ratio: {result_stats['hit_ratio']:.1%}, "
+              f"latency saved: {result_stats['latency_saved_ms']:.0f} ms")
 
     logs_dir = output_path.parent / "logs"
     logs_dir.mkdir(parents=True, exist_ok=True)
     with open(logs_dir / "evaluation_logs.txt", 'w', encoding='utf-8') as f:
         f.write('\n'.join(logs))
     with open(logs_dir / "metrics.json", 'w', encoding='utf-8') as f:
-        json.dump({'coverage': coverage, 'total': total, 'success': success, 'avg_precision_at_3': avg_precision_at_3}, f, ensure_ascii=False)
+        json.dump({'coverage': coverage, 'total': total, 'success': success, 'avg_precision_at_3': avg_precision_at_3,
+                   'embedding_cache': cache_stats, 'result_cache': result_stats, 'load': load_report},
+                  f, ensure_ascii=False, indent=2)
+    if query_log is not None:
+        query_log.close()
+        (logs_dir / "metrics.prom").write_text(query_log.metrics.render(), encoding="utf-8")
+        print(f"Query log written to {query_log.path}")
 
     print(f"Evaluation saved to {output_path}")
 
@@ -197,15 +348,54 @@ def main() -> None:
     parser = argparse.ArgumentParser(description="Evaluate prefix queries on Elasticsearch catalog")
     parser.add_argument("--queries", default="data/prefix_queries.csv", help="CSV with queries")
     parser.add_argument("--output", default="reports/evaluation_template.csv", help="Output CSV")
+    parser.add_argument("--backend", choices=["es", "local"], default="es", help="Elasticsearch or the in-process NumPy engine")
+    parser.add_argument("--catalog", default="data/catalog_products.xml", help="Catalog for --backend local")
+    parser.add_argument("--vector-store", default="", help="int8 vector store for --backend local kNN (vector_store.py)")
+    parser.add_argument("--embedding-cache", default=EMBEDDING_CACHE_DIR, help="Embedding cache directory ('' disables it)")
+    parser.add_argument("--result-cache", type=int, default=DEFAULT_MAX_ENTRIES, help="Max cached search results (0 disables)")
+    parser.add_argument("--result-ttl", type=float, default=DEFAULT_TTL, help="Seconds a cached result stays valid")
+    parser.add_argument("--prewarm-top", type=int, default=0, help="Prewarm the result cache with top-N queries per site")
+    parser.add_argument("--expansions", default=DEFAULT_EXPANSIONS, help="PREFIX_EXPANSIONS JSON used for prewarming")
+    parser.add_argument("--workers", type=int, default=1, help=f"Concurrent searches (e.g. {DEFAULT_WORKERS} for a load test)")
+    parser.add_argument("--qps", type=float, default=0.0, help="Target request rate; 0 sends as fast as workers allow")
+    parser.add_argument("--repeat", type=int, default=1, help="Passes over the query set (only the first is written to CSV)")
+    parser.add_argument("--query-log", nargs="?", const=DEFAULT_LOG_PATH, default="",
+                        help=f"Write a structured NDJSON query log (default path {DEFAULT_LOG_PATH})")
+    parser.add_argument("--log-sample", type=float, default=1.0, help="Share of non-zero-hit queries written to --query-log")
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help="Search in batches (process-pool preprocessing, one encode, _msearch); 0 = one query at a time")
+    parser.add_argument("--processes", type=int, default=0, help="Processes for --batch-size preprocessing and rerank (0 = all cores)")
+    parser.add_argument("--purity-table", default="", help="Restrict retrieval to plausible categories (prefix_purity.py table)")
     args = parser.parse_args()
 
+    global embedding_cache_dir, result_cache, search_backend, query_log
+    embedding_cache_dir = args.embedding_cache
+    prefix_purity.activate(args.purity_table)
+    if args.query_log:
+        query_log = QueryLogger(args.query_log, sample_rate=args.log_sample)
+    search_backend = make_backend(args.backend, args.catalog, args.vector_store)
+    if args.result_cache > 0 and not args.batch_size:  # батчи идут мимо кеша результатов
+        # Локальный каталог не меняется за время процесса, версия нужна только для ES
+        version = catalog_version if args.backend == "es" else None
+        result_cache = ResultCache(args.result_cache, ttl=args.result_ttl, version=version)
+        if args.prewarm_top:
+            print(f"Prewarmed result cache with {prewarm(Path(args.expansions), args.prewarm_top)} queries")
+
     queries_path = Path(args.queries)
     if not queries_path.exists():
         raise SystemExit(f"Queries file not found: {queries_path}")
 
     output_path = Path(args.output)
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    evaluate_and_fill(queries_path, output_path)
+    if args.batch_size > 0:
+        from batch_search import BatchSearcher
+        engine = search_backend.__self__ if args.backend == "local" else None  # LocalSearchEngine
+        with BatchSearcher(args.processes or None, encoder=query_encoder(), engine=engine,
+                           purity_table=args.purity_table) as searcher:
+            evaluate_and_fill(queries_path, output_path, repeat=args.repeat,
+                              batch_searcher=searcher, batch_size=args.batch_size)
+        return
+    evaluate_and_fill(queries_path, output_path, workers=args.workers, qps=args.qps, repeat=args.repeat)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
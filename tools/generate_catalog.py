@@ -1,12 +1,22 @@
 #!/usr/bin/env python3
-"""Generate a synthetic catalog for the prefix-search assignment."""
+"""Generate a synthetic catalog for the prefix-search assignment.
+
+Товары пишутся потоково, по чанкам из CHUNK_SIZE штук; у каждого чанка свой
+генератор случайных чисел от (seed, номер чанка), поэтому чанки можно считать в
+нескольких процессах, а результат зависит только от seed. Первый чанк засеян
+как раньше, так что каталоги до CHUNK_SIZE товаров совпадают побайтно с прежним
+выводом minidom. Кроме XML есть NDJSON и разбиение на шарды.
+"""
 from __future__ import annotations
 
 import argparse
+import json
 import random
-import xml.etree.ElementTree as ET
-import xml.dom.minidom as minidom
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Iterator, List
 
 UNITS_DISPLAY = {
     "g": "г",
@@ -77,18 +87,26 @@ BASE_PRODUCTS = [
 ]
 
 
-def build_catalog(total: int, output_path: Path, seed: int) -> None:
-    random.seed(seed)
-    root = ET.Element("catalog")
+CHUNK_SIZE = 10_000  # товаров на один независимый поток random; граница работы процессов и шардов
+FORMATS = ("xml", "ndjson")
+
+
+class _ProductGenerator:
+    """Товары одного чанка: свой random.Random, поэтому чанки считаются в любом порядке и в любом процессе."""
 
-    for idx in range(1, total + 1):
-        base = random.choice(BASE_PRODUCTS)
-        brand = random.choice(base["brands"])
-        descriptor = random.choice(base["descriptors"]).strip()
-        unit, weights = random.choice(base["units"])
-        weight = random.choice(weights)
-        package_size = random.choice(base.get("package_sizes", [1]))
-        price = round(random.uniform(*base["price"]), 2)
+    def __init__(self, seed: int, chunk: int):
+        # Чанк 0 засеян ровно как старый random.seed(seed): первые CHUNK_SIZE товаров не изменились
+        self.rng = random.Random(seed if chunk == 0 else f"{seed}-{chunk}")
+
+    def product(self, idx: int) -> dict:
+        rng = self.rng
+        base = rng.choice(BASE_PRODUCTS)
+        brand = rng.choice(base["brands"])
+        descriptor = rng.choice(base["descriptors"]).strip()
+        unit, weights = rng.choice(base["units"])
+        weight = rng.choice(weights)
+        package_size = rng.choice(base.get("package_sizes", [1]))
+        price = round(rng.uniform(*base["price"]), 2)
 
         keywords_source = base["keywords"] + [brand.lower(), descriptor.replace(" ", "").lower()]
         keywords_unique: list[str] = []
@@ -108,35 +126,134 @@ def build_catalog(total: int, output_path: Path, seed: int) -> None:
             f"{descriptor.capitalize()} {base['base_name'].lower()} бренда {brand} в категории {base['category'].lower()}."
         ).replace("  ", " ")
 
-        product = ET.SubElement(root, "product", id=f"P{idx:04d}")
-        ET.SubElement(product, "name").text = name
-        ET.SubElement(product, "category").text = base["category"]
-        ET.SubElement(product, "brand").text = brand
-        weight_node = ET.SubElement(product, "weight", unit=unit)
-        weight_node.text = str(weight)
-        ET.SubElement(product, "package_size").text = str(package_size)
-        ET.SubElement(product, "keywords").text = keywords
-        ET.SubElement(product, "description").text = description
-        price_node = ET.SubElement(product, "price", currency="RUB")
-        price_node.text = f"{price:.2f}"
-        ET.SubElement(product, "image_url").text = f"https://example.com/p/P{idx:04d}.jpg"
+        return {
+            "id": f"P{idx:04d}",
+            "name": name,
+            "category": base["category"],
+            "brand": brand,
+            "weight": str(weight),
+            "unit": unit,
+            "package_size": str(package_size),
+            "keywords": keywords,
+            "description": description,
+            "price": f"{price:.2f}",
+            "currency": "RUB",
+            "image_url": f"https://example.com/p/P{idx:04d}.jpg",
+        }
+
+
+def _escape(data: str) -> str:
+    """Экранирование как у minidom (текст и атрибуты одинаково)."""
+    return data.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+
+
+def _element(tag: str, text: str, attrs: str = "") -> str:
+    if not text:
+        return f"    <{tag}{attrs}/>\n"
+    return f"    <{tag}{attrs}>{_escape(text)}</{tag}>\n"
+
+
+def product_xml(p: dict) -> str:
+    """<product> в том же виде, что давал minidom.toprettyxml(indent="  ")."""
+    return "".join((
+        f'  <product id="{_escape(p["id"])}">\n',
+        _element("name", p["name"]),
+        _element("category", p["category"]),
+        _element("brand", p["brand"]),
+        _element("weight", p["weight"], f' unit="{_escape(p["unit"])}"'),
+        _element("package_size", p["package_size"]),
+        _element("keywords", p["keywords"]),
+        _element("description", p["description"]),
+        _element("price", p["price"], f' currency="{_escape(p["currency"])}"'),
+        _element("image_url", p["image_url"]),
+        "  </product>\n",
+    ))
+
+
+def product_json(p: dict) -> str:
+    return json.dumps(p, ensure_ascii=False) + "\n"
+
+
+XML_HEADER = '<?xml version="1.0" ?>\n<catalog>\n'
+XML_FOOTER = "</catalog>\n"
+
+
+def render_chunk(seed: int, chunk: int, total: int, fmt: str = "xml") -> str:
+    """Текст товаров чанка chunk (номера chunk * CHUNK_SIZE + 1 ... не больше total)."""
+    generator = _ProductGenerator(seed, chunk)
+    render = product_xml if fmt == "xml" else product_json
+    first = chunk * CHUNK_SIZE + 1
+    last = min(total, first + CHUNK_SIZE - 1)
+    return "".join(render(generator.product(idx)) for idx in range(first, last + 1))
+
+
+def _chunks_in_order(total: int, seed: int, fmt: str, workers: int) -> Iterator[str]:
+    """Тексты чанков по порядку; с workers > 1 считаются параллельно, в полёте не больше 2 * workers."""
+    n_chunks = (total + CHUNK_SIZE - 1) // CHUNK_SIZE
+    if workers <= 1:
+        for chunk in range(n_chunks):
+            yield render_chunk(seed, chunk, total, fmt)
+        return
+    pending: deque = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk in range(n_chunks):
+            pending.append(pool.submit(render_chunk, seed, chunk, total, fmt))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def shard_paths(output_path: Path, shards: int, fmt: str) -> List[Path]:
+    """Один файл или output_path/part-NNNNN.<fmt> для shards > 1."""
+    if shards <= 1:
+        return [output_path]
+    return [output_path / f"part-{i:05d}.{fmt}" for i in range(shards)]
+
+
+def build_catalog(total: int, output_path: Path, seed: int, fmt: str = "xml",
+                  shards: int = 1, workers: int = 1) -> List[Path]:
+    """Пишет каталог потоково: в памяти не больше нескольких чанков независимо от total.
+
+    Результат зависит только от (total, seed, fmt, shards): число процессов на
+    него не влияет. Шарды режутся по границам чанков, у каждого XML-шарда свой
+    <catalog>, так что любой шард — валидный каталог.
+    """
+    paths = shard_paths(output_path, shards, fmt)
+    n_chunks = (total + CHUNK_SIZE - 1) // CHUNK_SIZE
+    per_shard = max(1, -(-n_chunks // len(paths)))
+    header, footer = (XML_HEADER, XML_FOOTER) if fmt == "xml" else ("", "")
+    for path in paths:
+        path.parent.mkdir(parents=True, exist_ok=True)
 
-    rough = ET.tostring(root, encoding="utf-8")
-    pretty = minidom.parseString(rough).toprettyxml(indent="  ")
-    output_path.write_text(pretty, encoding="utf-8")
+    chunks = _chunks_in_order(total, seed, fmt, workers)
+    for shard, path in enumerate(paths):
+        with path.open("w", encoding="utf-8", newline="\n") as f:
+            if fmt == "xml" and total <= 0:
+                f.write('<?xml version="1.0" ?>\n<catalog/>\n')  # как minidom для пустого корня
+                continue
+            f.write(header)
+            for _ in range(min(per_shard, max(0, n_chunks - shard * per_shard))):
+                f.write(next(chunks))
+            f.write(footer)
+    return paths
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Generate synthetic catalog data")
-    parser.add_argument("--output", default="data/catalog_products.xml", help="Where to write the XML file")
+    parser.add_argument("--output", default="data/catalog_products.xml",
+                        help="Where to write the catalog (a directory when --shards > 1)")
     parser.add_argument("--total", type=int, default=1000, help="How many products to generate")
     parser.add_argument("--seed", type=int, default=42, help="Random seed for reproducibility")
+    parser.add_argument("--format", choices=FORMATS, default="xml", help="XML catalog or one JSON product per line")
+    parser.add_argument("--shards", type=int, default=1, help="Split the output into this many files")
+    parser.add_argument("--workers", type=int, default=1, help="Processes generating chunks in parallel")
     args = parser.parse_args()
 
-    output_path = Path(args.output)
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    build_catalog(args.total, output_path, args.seed)
-    print(f"Catalog with {args.total} products written to {output_path}")
+    started = time.perf_counter()
+    paths = build_catalog(args.total, Path(args.output), args.seed, args.format, args.shards, args.workers)
+    target = paths[0] if len(paths) == 1 else f"{len(paths)} shards in {args.output}"
+    print(f"Catalog with {args.total} products written to {target} in {time.perf_counter() - started:.1f}s")
 
 
 if __name__ == "__main__":
@@ -3,41 +3,44 @@
 from __future__ import annotations
 
 import argparse
-import xml.etree.ElementTree as ET
+import hashlib
+import json
+import time
 from collections import Counter
 from pathlib import Path
-from elasticsearch import Elasticsearch
-from sentence_transformers import SentenceTransformer
-import re
-
-# Normalization and translit functions
-def normalize_text(text: str) -> str:
-    text = text.lower().replace('ё', 'е').strip()
-    text = re.sub(r'[^\w\s]', '', text)
-    text = re.sub(r'\s+', ' ', text)
-    return text
-
-LAT_TO_RU = {
-    'a': 'ф', 'b': 'и', 'c': 'с', 'd': 'в', 'e': 'у', 'f': 'а', 'g': 'п', 'h': 'р', 'i': 'ш', 'j': 'о',
-    'k': 'л', 'l': 'д', 'm': 'ь', 'n': 'т', 'o': 'щ', 'p': 'з', 'q': 'й', 'r': 'к', 's': 'ы', 't': 'е',
-    'u': 'г', 'v': 'м', 'w': 'ц', 'x': 'ч', 'y': 'н', 'z': 'я'
-}
-RU_TO_LAT = {v: k for k, v in LAT_TO_RU.items()}
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
 
-def generate_translit_variants(text: str) -> list:
-    lat_variant = ''.join(RU_TO_LAT.get(c, c) for c in text if c.isalpha() or c.isdigit() or c == ' ')
-    ru_variant = ''.join(LAT_TO_RU.get(c, c) for c in text if c.isalpha() or c.isdigit() or c == ' ')
-    variants = set([text, lat_variant, ru_variant])
-    return list(variants)
+from bulk_indexer import (
+    DEFAULT_CHUNK_BYTES,
+    DEFAULT_CHUNK_DOCS,
+    DEFAULT_ENCODE_BATCH,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_WORKERS,
+    BulkIndexer,
+    embed_documents,
+)
+from catalog_reader import iter_products
+from clients import ALIAS, EMBEDDING_CACHE_DIR, MODEL_NAME, embedding_dims, get_encoder, get_es
+from translit import normalized_variants
 
-# Elasticsearch setup
-es = Elasticsearch("http://localhost:9200")
-model = SentenceTransformer('paraphrase-MiniLM-L6-v2')
+# Параметры индексации по умолчанию; load_and_index() и delta_index() накладывают поверх них options
+DEFAULT_OPTIONS = {
+    "encode_batch": DEFAULT_ENCODE_BATCH,
+    "chunk_docs": DEFAULT_CHUNK_DOCS,
+    "chunk_bytes": DEFAULT_CHUNK_BYTES,
+    "workers": DEFAULT_WORKERS,
+    "max_retries": DEFAULT_MAX_RETRIES,
+    "embedding_cache": EMBEDDING_CACHE_DIR,
+    "vector_store": "",
+}
 
-def create_index():
-    if es.indices.exists(index="products"):
-        es.indices.delete(index="products")
+def create_index(vector_index_type: str = "hnsw") -> str:
+    """Создаёт новый физический индекс products_v<время>; живой индекс за алиасом не трогается.
 
+    vector_index_type="int8_hnsw" — ES хранит граф kNN по int8-квантованным векторам
+    (в 4 раза меньше памяти под vector) и пересчитывает кандидатов по float.
+    """
+    index_name = f"{ALIAS}_v{time.strftime('%Y%m%d%H%M%S')}"
     settings = {
         "settings": {
             "number_of_shards": 1,
@@ -64,71 +67,237 @@ def create_index():
                 "category": {"type": "keyword"},
                 "brand": {"type": "keyword"},
                 "weight": {"type": "keyword"},        # текстовая форма "10л"
-                "weight_num": {"type": "float"},      # числовая форма 10.0 для фильтров
-                "vector": {"type": "dense_vector", "dims": 384, "index": True, "similarity": "cosine"}
+                "weight_num": {"type": "float"},      # числовая форма 10.0 без учёта единицы
+                "quantity_dim": {"type": "keyword"},  # mass / volume / count (quantity.py)
+                "quantity_base": {"type": "float"},   # вес в г, мл или шт: 10л -> 10000.0
+                "content_hash": {"type": "keyword", "index": False, "doc_values": False},  # для --delta
+                "vector": {"type": "dense_vector", "dims": embedding_dims(), "index": True, "similarity": "cosine",
+                           "index_options": {"type": vector_index_type}}
             }
         }
     }
 
-    es.indices.create(index="products", body=settings)
-    print("Created Elasticsearch index 'products'.")
+    get_es().indices.create(index=index_name, body=settings)
+    print(f"Created Elasticsearch index '{index_name}'.")
+    return index_name
 
-def parse_weight(weight_str: str) -> float | None:
-    """Выделяет число из строки веса, возвращает float или None."""
-    if not weight_str:
-        return None
-    match = re.search(r'[\d\.]+', weight_str)
-    return float(match.group()) if match else None
+def alias_targets() -> List[str]:
+    """Физические индексы, на которые сейчас указывает алиас."""
+    es = get_es()
+    if not es.indices.exists_alias(name=ALIAS):
+        return []
+    return list(es.indices.get_alias(name=ALIAS).keys())
 
-def load_and_index(xml_path: str):
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-    bulk_data = []
+def generations() -> List[str]:
+    """Физические индексы products_v<время> от старых к новым."""
+    return sorted(get_es().indices.get(index=f"{ALIAS}_v*").keys())
 
-    for product in root.findall('.//product'):
-        name = product.findtext('name', '').strip()
-        if not name:
-            continue
+def prune_generations(keep: int, previous: Sequence[str] = ()) -> None:
+    """Удаляет индексы не за алиасом, кроме keep — для отката.
+
+    Первыми остаются индексы, только что снятые с алиаса (previous), затем самые
+    новые: после --rollback откатанный более новый индекс уходит раньше рабочего.
+    """
+    live = set(alias_targets())
+    stale = [index for index in reversed(generations()) if index not in live]
+    stale.sort(key=lambda index: index not in previous)  # стабильная: previous вперёд, дальше от новых к старым
+    for index in stale[max(0, keep):]:
+        get_es().indices.delete(index=index)
+        print(f"Deleted old generation '{index}'.")
+
+def swap_alias(new_index: str, keep_generations: int = 1) -> None:
+    """Атомарно переводит алиас на new_index; поиск не видит пустого индекса ни в какой момент.
 
-        description = product.findtext('description', '').strip()
-        price = float(product.findtext('price', '0.0'))
-        category = product.findtext('category', '')
-        brand = product.findtext('brand', '')
-        weight = product.findtext('weight', '')
+    keep_generations прежних индексов остаются для отката (--rollback), более старые удаляются.
+    """
+    es = get_es()
+    previous = alias_targets()
+    actions = [{"remove": {"index": index, "alias": ALIAS}} for index in previous]
+    if not previous and es.indices.exists(index=ALIAS):
+        # Наследие старых запусков: обычный индекс с именем алиаса удаляется в той же операции
+        actions.append({"remove_index": {"index": ALIAS}})
+    actions.append({"add": {"index": new_index, "alias": ALIAS}})
+    es.indices.update_aliases(actions=actions)
+    print(f"Alias '{ALIAS}' -> '{new_index}' (was {previous or 'none'}).")
+    prune_generations(keep_generations, previous)
 
-        norm_name = normalize_text(name)
-        name_variants = generate_translit_variants(norm_name)
-        embedding_text = f"{norm_name} {description}"
-        vector = model.encode(embedding_text).tolist()
-        weight_num = parse_weight(weight)
+def rollback() -> None:
+    """Возвращает алиас на самый новый индекс старше текущего."""
+    live = alias_targets()
+    older = [index for index in generations() if live and index < min(live)]
+    if not older:
+        raise SystemExit(f"No previous generation of '{ALIAS}' to roll back to")
+    get_es().indices.update_aliases(actions=[{"remove": {"index": index, "alias": ALIAS}} for index in live]
+                                    + [{"add": {"index": older[-1], "alias": ALIAS}}])
+    print(f"Alias '{ALIAS}' rolled back to '{older[-1]}' (was {live}); the newer index is kept.")
 
+def full_reindex(xml_path: str, vector_index_type: str, keep_generations: int, **options) -> None:
+    """Новый индекс, загрузка и переключение алиаса; при любой ошибке новый индекс удаляется."""
+    new_index = create_index(vector_index_type)
+    try:
+        vector_writer = load_and_index(xml_path, new_index, **options)
+    except BaseException:
+        get_es().indices.delete(index=new_index, ignore_unavailable=True)
+        print(f"Reindex failed, deleted '{new_index}'; alias is left untouched.")
+        raise
+    swap_alias(new_index, keep_generations)
+    if vector_writer is not None:
+        store = vector_writer.publish()
+        print(f"Vector store {store.path} now points to {vector_writer.version_path.name}.")
+
+def content_hash(doc: dict, embedding_text: str) -> str:
+    """Хеш всего, из чего строится документ; модель входит в хеш, чтобы смена модели переиндексировала всё."""
+    payload = json.dumps([MODEL_NAME, embedding_text, doc], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def product_docs(xml_path: str) -> Iterator[Tuple[str, dict, str]]:
+    """(id товара, документ без вектора, текст для эмбеддинга) для каждого товара каталога."""
+    for product in iter_products(xml_path):
+        if not product.name:
+            continue
+
+        norm_name = product.norm_name
+        name_variants = normalized_variants(norm_name)  # те же варианты, что у запроса в evaluate.prepare_query
         doc = {
-            "name": name,
+            "name": product.name,
             "name_variants": name_variants,
-            "description": description,
-            "price": price,
-            "category": category,
-            "brand": brand,
-            "weight": weight,
-            "weight_num": weight_num,
-            "vector": vector
+            "description": product.description,
+            "price": product.price,
+            "category": product.category,
+            "brand": product.brand,
+            "weight": product.weight,
+            "weight_num": product.weight_num,
+            "quantity_dim": product.quantity.dimension if product.quantity else None,
+            "quantity_base": product.quantity.amount if product.quantity else None,
         }
+        embedding_text = f"{norm_name} {product.description}"
+        doc["content_hash"] = content_hash(doc, embedding_text)
+        yield product.id or doc["content_hash"], doc, embedding_text
+
+def refresh_interval(es, index: str) -> Optional[str]:
+    """Текущий index.refresh_interval; None — не задан явно (действует значение ES по умолчанию)."""
+    settings = es.indices.get_settings(index=index, name="index.refresh_interval")
+    for entry in settings.values():  # index может быть алиасом — ключ ответа будет физическим индексом
+        return entry.get("settings", {}).get("index", {}).get("refresh_interval")
+    return None
 
-        bulk_data.append({"index": {"_index": "products"}})
-        bulk_data.append(doc)
+def run_indexer(index: str, docs: Iterable[Tuple[str, Optional[dict]]], options: dict) -> Dict[str, float]:
+    """Прогоняет поток через BulkIndexer с выключенным на время загрузки refresh."""
+    es = get_es()
+    indexer = BulkIndexer(es, index, chunk_docs=options["chunk_docs"], chunk_bytes=options["chunk_bytes"],
+                          workers=options["workers"], max_retries=options["max_retries"])
+    # Без refresh во время загрузки сегменты не пересоздаются на каждый чанк; после — прежнее значение
+    previous_interval = refresh_interval(es, index)
+    es.indices.put_settings(index=index, settings={"index": {"refresh_interval": "-1"}})
+    try:
+        stats = indexer.run(docs)
+    finally:
+        # None сбрасывает настройку к значению ES по умолчанию
+        es.indices.put_settings(index=index, settings={"index": {"refresh_interval": previous_interval}})
+        es.indices.refresh(index=index)
+    print(f"Bulk: {stats['docs']} ok, {stats['failed']} failed in {stats['seconds']:.1f}s, "
+          f"{stats['docs_per_s']:,.0f} docs/s, {stats['mb_per_s']:.2f} MB/s.")
+    return stats
 
-    if bulk_data:
-        es.bulk(operations=bulk_data)
-    print(f"Indexed {len(bulk_data)//2} products.")
+def embed_with_cache(items: Iterable[Tuple[str, dict, str]], options: dict) -> Iterator[Tuple[str, dict]]:
+    """embed_documents через дисковый кеш эмбеддингов: неизменившиеся тексты не кодируются повторно."""
+    encoder = get_encoder(options["embedding_cache"])
+    try:
+        yield from embed_documents(items, encoder, batch_size=options["encode_batch"])
+    finally:
+        encoder.flush()
+        s = encoder.stats()
+        print(f"Embedding cache: {s['hits_disk']} hits, {s['misses']} encoded "
+              f"(hit ratio {s['hit_ratio']:.1%}, {s['disk_entries']} cached vectors).")
+
+def write_vector_store(docs: Iterable[Tuple[str, dict]], writer, batch_size: int = 1024) -> Iterator[Tuple[str, dict]]:
+    """Пропускает документы дальше и попутно пишет их векторы в int8-хранилище (vector_store.py), не публикуя его."""
+    from bulk_indexer import batched
+    for batch in batched(docs, batch_size):
+        writer.add([doc_id for doc_id, _ in batch], [doc["vector"] for _, doc in batch])
+        yield from batch
+    store = writer.close(publish=False)
+    memory = store.memory_bytes()
+    print(f"Vector store: {len(store)} vectors written to {store.path} "
+          f"(int8 {memory['int8'] / 1024 / 1024:.2f} MB, float32 {memory['float32'] / 1024 / 1024:.2f} MB).")
+
+def load_and_index(xml_path: str, index: str, **options):
+    """Полная загрузка каталога в index (новый физический индекс до переключения алиаса).
+
+    Возвращает записанный, но не опубликованный VectorStoreWriter (или None без
+    --vector-store): хранилище должно смениться вместе с алиасом, а не раньше.
+    """
+    options = {**DEFAULT_OPTIONS, **options}
+    docs = embed_with_cache(product_docs(xml_path), options)
+    writer = None
+    if options["vector_store"]:
+        from vector_store import VectorStoreWriter
+        writer = VectorStoreWriter(options["vector_store"])
+        docs = write_vector_store(docs, writer)
+    try:
+        stats = run_indexer(index, docs, options)
+        if stats["failed"]:
+            raise SystemExit(f"{stats['failed']} documents failed, alias is left untouched")
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    return writer
+
+def existing_hashes(index: str) -> Dict[str, str]:
+    """{_id: content_hash} для всех документов индекса."""
+    from elasticsearch import helpers
+    hits = helpers.scan(get_es(), index=index, query={"query": {"match_all": {}}}, _source=["content_hash"])
+    return {hit["_id"]: hit["_source"].get("content_hash", "") for hit in hits}
+
+def check_vector_dims(index: str) -> None:
+    """Падает, если маппинг vector индекса построен для модели другой размерности (сменили EMBEDDING_MODEL)."""
+    for name, mapping in get_es().indices.get_mapping(index=index).items():
+        dims = mapping["mappings"]["properties"]["vector"].get("dims")
+        if dims != embedding_dims():
+            raise ValueError(f"Index {name} stores {dims}-dim vectors, but {MODEL_NAME} produces "
+                             f"{embedding_dims()}; run a full reindex instead of --delta")
+
+def delta_index(xml_path: str, **options) -> None:
+    """Переэмбеддит и upsert-ит только изменившиеся товары, удаляет исчезнувшие."""
+    options = {**DEFAULT_OPTIONS, **options}
+    check_vector_dims(ALIAS)
+    if options["vector_store"]:
+        print("Vector store is only written on a full load; rebuild it with tools/vector_store.py build.")
+    previous = existing_hashes(ALIAS)
+    seen: Set[str] = set()
+    counts: Counter = Counter()
+
+    def changed() -> Iterator[Tuple[str, dict, str]]:
+        for doc_id, doc, embedding_text in product_docs(xml_path):
+            seen.add(doc_id)
+            if previous.get(doc_id) == doc["content_hash"]:
+                counts["unchanged"] += 1
+                continue
+            counts["new" if doc_id not in previous else "changed"] += 1
+            yield doc_id, doc, embedding_text
+
+    def actions() -> Iterator[Tuple[str, Optional[dict]]]:
+        yield from embed_with_cache(changed(), options)
+        # Удаления — после полного прохода по каталогу, когда seen заполнен
+        for doc_id in previous.keys() - seen:
+            counts["deleted"] += 1
+            yield doc_id, None
+
+    run_indexer(ALIAS, actions(), options)
+    print(f"Delta: {counts['new']} new, {counts['changed']} changed, "
+          f"{counts['deleted']} deleted, {counts['unchanged']} unchanged.")
 
 def summarize_catalog(path: Path) -> None:
-    tree = ET.parse(path)
-    root = tree.getroot()
-    products = root.findall("product")
-    categories = Counter(prod.findtext("category", default="unknown") for prod in products)
-    brands = Counter(prod.findtext("brand", default="unknown") for prod in products)
+    total = 0
+    categories: Counter = Counter()
+    brands: Counter = Counter()
+    for product in iter_products(path):
+        total += 1
+        categories[product.category or "unknown"] += 1
+        brands[product.brand or "unknown"] += 1
 
-    print(f"Loaded {len(products)} products from {path}")
+    print(f"Loaded {total} products from {path}")
     print("Top categories:")
     for category, count in categories.most_common(10):
         print(f"  • {category}: {count}")
@@ -141,6 +310,19 @@ def main() -> None:
     parser = argparse.ArgumentParser(description="Inspect and optionally index catalog_products.xml to Elasticsearch")
     parser.add_argument("catalog", nargs="?", default="data/catalog_products.xml", help="Path to the XML catalog")
     parser.add_argument("--index", action="store_true", help="Index the catalog to Elasticsearch")
+    parser.add_argument("--encode-batch", type=int, default=DEFAULT_ENCODE_BATCH, help="Texts per model.encode call")
+    parser.add_argument("--chunk-docs", type=int, default=DEFAULT_CHUNK_DOCS, help="Max documents per bulk request")
+    parser.add_argument("--chunk-mb", type=float, default=DEFAULT_CHUNK_BYTES / 1024 / 1024, help="Max bulk request size, MB")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Parallel bulk requests")
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES, help="Retries for items rejected with 429 and bulk requests failing with 429/503/timeouts")
+    parser.add_argument("--delta", action="store_true", help="Only re-embed and upsert changed products, delete removed ones")
+    parser.add_argument("--keep-generations", type=int, default=1,
+                        help="Old indexes kept after the alias swap for --rollback (0 deletes them)")
+    parser.add_argument("--rollback", action="store_true", help="Point the alias back to the previous kept generation")
+    parser.add_argument("--embedding-cache", default=EMBEDDING_CACHE_DIR, help="Embedding cache directory ('' disables it)")
+    parser.add_argument("--vector-store", default="", help="Also write an int8 memory-mapped vector store here (full load only)")
+    parser.add_argument("--vector-index", choices=["hnsw", "int8_hnsw"], default="hnsw",
+                        help="dense_vector index type of the new ES index (int8_hnsw: quantized kNN graph)")
     args = parser.parse_args()
 
     path = Path(args.catalog)
@@ -149,9 +331,25 @@ def main() -> None:
 
     summarize_catalog(path)
 
+    if args.rollback:
+        rollback()
+        return
     if args.index:
-        create_index()
-        load_and_index(args.catalog)
+        options = {
+            "encode_batch": args.encode_batch,
+            "chunk_docs": args.chunk_docs,
+            "chunk_bytes": int(args.chunk_mb * 1024 * 1024),
+            "workers": args.workers,
+            "max_retries": args.max_retries,
+            "embedding_cache": args.embedding_cache,
+            "vector_store": args.vector_store,
+        }
+        if args.delta and alias_targets():
+            delta_index(args.catalog, **options)
+        else:
+            if args.delta:
+                print(f"Alias '{ALIAS}' does not exist yet, running a full reindex.")
+            full_reindex(args.catalog, args.vector_index, args.keep_generations, **options)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
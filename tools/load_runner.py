@@ -0,0 +1,142 @@
+"""Конкурентный прогон запросов через любую функцию поиска.
+
+Запросы уходят в ограниченный пул потоков. При qps > 0 нагрузка open-loop:
+i-й запрос планируется на момент start + i / qps независимо от того, успели
+ли ответить предыдущие, а время "total" считается от запланированного
+момента, чтобы очередь при перегрузке попадала в перцентили, а не терялась
+(coordinated omission). Функция поиска может дописывать свои стадии
+(normalize, encode, es, rerank) в переданный словарь наносекунд.
+"""
+from __future__ import annotations
+
+import math
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+DEFAULT_WORKERS = 8
+
+StageTimings = Dict[str, int]  # стадия -> наносекунды (time.perf_counter_ns)
+# search(*request, timings): request — кортеж, начинающийся с (запрос, сайт), например workload.Request
+SearchFn = Callable[..., Any]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Перцентиль методом ближайшего ранга: наименьшее значение, не меньше которого pct% выборки."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class LatencyRecorder:
+    """Потокобезопасный сборщик длительностей по стадиям."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, List[int]] = {}
+
+    def add(self, timings: StageTimings) -> None:
+        with self._lock:
+            for stage, ns in timings.items():
+                self._samples.setdefault(stage, []).append(ns)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """{стадия: count, mean/p50/p95/p99/max в мс}."""
+        with self._lock:
+            samples = {stage: [ns / 1e6 for ns in values] for stage, values in self._samples.items()}
+        return {
+            stage: {
+                "count": len(values),
+                "mean_ms": round(sum(values) / len(values), 3),
+                "p50_ms": round(percentile(values, 50), 3),
+                "p95_ms": round(percentile(values, 95), 3),
+                "p99_ms": round(percentile(values, 99), 3),
+                "max_ms": round(max(values), 3),
+            }
+            for stage, values in samples.items()
+        }
+
+
+def run_load(
+    requests: Iterable[Tuple],
+    search: SearchFn,
+    workers: int = DEFAULT_WORKERS,
+    qps: float = 0.0,
+    keep_results: bool = True,
+    recorder: Optional[LatencyRecorder] = None,
+) -> Tuple[List[Tuple[Any, StageTimings]], Dict[str, Any]]:
+    """Прогоняет запросы (запрос, сайт, ...) через search; возвращает [(ответ, тайминги)] в порядке запросов и отчёт.
+
+    qps <= 0 — closed-loop: workers потоков выбирают запросы так быстро, как отвечает backend.
+    """
+    recorder = recorder or LatencyRecorder()
+    errors: List[str] = []
+
+    def one(request: Tuple, scheduled_ns: int) -> Tuple[Any, StageTimings]:
+        timings: StageTimings = {}
+        started_ns = time.perf_counter_ns()
+        try:
+            result = search(*request, timings)
+        except Exception as exc:  # один упавший запрос не должен останавливать прогон
+            errors.append(f"{request[0]!r}: {exc}")
+            result = None
+        finished_ns = time.perf_counter_ns()
+        timings["service"] = finished_ns - started_ns
+        timings["total"] = finished_ns - min(scheduled_ns, started_ns)
+        recorder.add(timings)
+        return result, timings
+
+    futures: List[Future] = []
+    in_flight: Set[Future] = set()
+    results: List[Tuple[Any, StageTimings]] = []
+    start_ns = time.perf_counter_ns()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i, request in enumerate(requests):
+            if qps > 0:
+                scheduled_ns = start_ns + int(i * 1e9 / qps)
+                delay = (scheduled_ns - time.perf_counter_ns()) / 1e9
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                # closed-loop: следующий запрос уходит, только когда освободился поток
+                if len(in_flight) >= workers:
+                    _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                scheduled_ns = time.perf_counter_ns()
+            future = pool.submit(one, request, scheduled_ns)
+            futures.append(future)
+            if qps <= 0:
+                in_flight.add(future)
+            if not keep_results and len(futures) >= 4 * workers:
+                futures = [f for f in futures if not f.done()]
+        for future in futures:
+            outcome = future.result()
+            if keep_results:
+                results.append(outcome)
+    elapsed = (time.perf_counter_ns() - start_ns) / 1e9
+
+    latency = recorder.summary()
+    completed = latency.get("total", {}).get("count", 0)
+    report = {
+        "requests": completed,
+        "errors": len(errors),
+        "workers": workers,
+        "target_qps": qps,
+        "seconds": round(elapsed, 3),
+        "throughput_qps": round(completed / elapsed, 2) if elapsed else 0.0,
+        "latency": latency,
+    }
+    for error in errors[:10]:
+        print(f"  search error: {error}")
+    return results, report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    target = f"target {report['target_qps']:g} qps, " if report["target_qps"] else ""
+    print(f"{report['requests']} requests, {report['errors']} errors in {report['seconds']:.2f}s "
+          f"({target}{report['throughput_qps']:.1f} qps achieved, {report['workers']} workers)")
+    for stage, s in report["latency"].items():
+        print(f"  {stage:<9} p50 {s['p50_ms']:8.2f} ms | p95 {s['p95_ms']:8.2f} ms | "
+              f"p99 {s['p99_ms']:8.2f} ms | max {s['max_ms']:8.2f} ms")
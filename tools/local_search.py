@@ -0,0 +1,339 @@
+"""In-process hybrid search over the catalog, no Elasticsearch required.
+
+Повторяет запрос search_es() на NumPy:
+- bool_prefix multi_match по name^3, name_variants^2, description и второй
+  multi_match по вариантам транслита в name_variants; BM25-вес каждого вхождения
+  (idf и нормировка длины поля) посчитан заранее;
+- must-фильтр по весу в базовых единицах (quantity_base >= N того же измерения,
+  как range в ES, даёт +1 к score): кандидаты берутся из NumericIndex до
+  текстового скоринга; в категории, где таких размеров нет, — ближайшие по размеру;
+- kNN (k=20) по непрерывной float32-матрице нормированных эмбеддингов или по
+  int8-хранилищу vector_store.py (num_candidates=100 с точным пересчётом),
+  score = (1 + cos) / 2, складывается с текстовым, как в гибридном запросе ES;
+- startswith-rerank из evaluate.rerank;
+- категории запроса из prefix_purity (PreparedQuery.categories), как terms-фильтр
+  в bool и knn ES: кандидаты вне них отсекаются до текстового скоринга, kNN
+  считается только по строкам правдоподобных категорий.
+
+Словарь каждого поля отсортирован, поэтому префикс запроса — это непрерывный
+диапазон термов и непрерывный срез postings; опечатки (fuzziness AUTO) ищутся
+векторизованным DP по общему словарю. Скоринг кандидатов — np.maximum.at
+и векторные операции над массивами, без цикла по товарам. Ранжирование близко к
+ES, но не совпадает побайтно: ES-анализаторы edge_ngram и точный BM25 ES не
+воспроизводятся.
+"""
+from __future__ import annotations
+
+import time
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from catalog_reader import iter_products
+from clients import EMBEDDING_CACHE_DIR, get_encoder
+from evaluate import PreparedQuery, prepare_query, query_encoder, rerank
+from load_runner import StageTimings
+from normalize import normalize_text
+from prefix_index import _MAX_CHAR
+from quantity import NumericIndex, Quantity
+from translit import normalized_variants
+from vector_store import DEFAULT_NUM_CANDIDATES, VectorStore, normalize_rows
+
+KNN_K = 20
+RESULT_SIZE = 10
+BM25_K1 = 1.2
+BM25_B = 0.75
+NEAREST_SIZES = 5  # товаров на категорию, если запрошенного размера нет
+
+
+def _popcount_swar(x: np.ndarray) -> np.ndarray:
+    """Число единичных битов uint64 (SWAR) для NumPy < 2, где нет np.bitwise_count."""
+    x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+popcount = getattr(np, "bitwise_count", _popcount_swar)
+
+
+def auto_fuzziness(term: str) -> int:
+    """fuzziness: AUTO из Elasticsearch: 0 правок до 2 символов, 1 до 5, дальше 2."""
+    if len(term) <= 2:
+        return 0
+    return 1 if len(term) <= 5 else 2
+
+
+class Vocabulary:
+    """Отсортированный словарь всех полей и векторизованный поиск термов с опечатками.
+
+    Префиксное расстояние Левенштейна считается DP сразу по всем кандидатам:
+    одна строка DP — несколько операций над матрицей (кандидаты x позиции), а
+    вставки сворачиваются через np.minimum.accumulate. Кандидатов заранее
+    отсекает битовая маска символов: каждый символ терма, которого нет в начале
+    токена, стоит хотя бы одну правку.
+    """
+
+    MAX_GRAM = 20  # max_gram edge_ngram_filter: префиксы длиннее в ES не индексируются
+    CACHE_SIZE = 50000
+
+    def __init__(self, tokens: Iterable[str]):
+        self.tokens = sorted(set(tokens))
+        self.ids = {token: i for i, token in enumerate(self.tokens)}
+        codes = np.zeros((len(self.tokens), self.MAX_GRAM), dtype=np.int32)
+        for i, token in enumerate(self.tokens):
+            head = [ord(c) for c in token[:self.MAX_GRAM]]
+            codes[i, :len(head)] = head
+        self.codes = codes
+        self.lengths = np.fromiter((len(t) for t in self.tokens), dtype=np.int32, count=len(self.tokens))
+        bits = np.left_shift(np.uint64(1), (codes % 64).astype(np.uint64))
+        self.masks = np.bitwise_or.accumulate(np.where(codes > 0, bits, np.uint64(0)), axis=1)
+        self._cache: Dict[Tuple[str, int], Tuple[Dict[int, int], Dict[int, int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def prefix_range(self, prefix: str) -> Tuple[int, int]:
+        return bisect_left(self.tokens, prefix), bisect_left(self.tokens, prefix + _MAX_CHAR)
+
+    def fuzzy(self, term: str, max_edits: int) -> Tuple[Dict[int, int], Dict[int, int]]:
+        """({id: правок до начала токена}, {id: правок до всего токена}) для токенов в пределах max_edits."""
+        key = (term, max_edits)
+        cached = self._cache.get(key)
+        if cached is None:
+            if len(self._cache) >= self.CACHE_SIZE:
+                self._cache.clear()
+            cached = self._cache[key] = self._fuzzy(term, max_edits)
+        return cached
+
+    def _fuzzy(self, term: str, max_edits: int) -> Tuple[Dict[int, int], Dict[int, int]]:
+        width = min(self.MAX_GRAM, len(term) + max_edits)
+        term_codes = [ord(c) for c in term]
+        term_mask = np.uint64(0)
+        for code in term_codes:
+            term_mask |= np.uint64(1) << np.uint64(code % 64)
+        missing = popcount(term_mask & ~self.masks[:, width - 1])
+        candidates = np.flatnonzero(missing <= max_edits)
+        if not len(candidates):
+            return {}, {}
+
+        block = self.codes[candidates, :width]
+        cols = np.arange(width + 1, dtype=np.int32)
+        row = np.broadcast_to(cols, (len(candidates), width + 1)).copy()
+        for i, code in enumerate(term_codes, 1):
+            step = np.empty_like(row)
+            step[:, 0] = i
+            np.minimum(row[:, :-1] + (block != code), row[:, 1:] + 1, out=step[:, 1:])
+            row = np.minimum.accumulate(step - cols, axis=1) + cols  # вставки
+        lengths = self.lengths[candidates]
+        prefix_edits = np.where(cols[None, :] <= lengths[:, None], row, max_edits + 1).min(axis=1)
+        full_edits = np.where(lengths <= width, row[np.arange(len(candidates)), np.minimum(lengths, width)],
+                              max_edits + 1)
+        ok_prefix, ok_full = prefix_edits <= max_edits, full_edits <= max_edits
+        return (dict(zip(candidates[ok_prefix].tolist(), prefix_edits[ok_prefix].tolist())),
+                dict(zip(candidates[ok_full].tolist(), full_edits[ok_full].tolist())))
+
+
+class FieldIndex:
+    """Инвертированный индекс одного текстового поля в CSR-виде: postings отсортированы по id терма.
+
+    edge_ngram=True — поле проиндексировано edge_ngram_analyzer (name, name_variants):
+    любой терм запроса совпадает с началом слова, а не только последний.
+    """
+
+    def __init__(self, vocab: Vocabulary, docs_tokens: List[List[str]], edge_ngram: bool = False):
+        self.vocab = vocab
+        self.edge_ngram = edge_ngram
+        pairs = sorted({(vocab.ids[token], doc) for doc, tokens in enumerate(docs_tokens) for token in tokens})
+        term_of = np.fromiter((t for t, _ in pairs), dtype=np.int32, count=len(pairs))
+        self.docs = np.fromiter((d for _, d in pairs), dtype=np.int32, count=len(pairs))
+        self.indptr = np.searchsorted(term_of, np.arange(len(vocab) + 1)).astype(np.int64)
+
+        # BM25 для tf = 1 (термы в названиях почти не повторяются)
+        lengths = np.fromiter((len(tokens) for tokens in docs_tokens), dtype=np.float32, count=len(docs_tokens))
+        avg_length = float(lengths.mean()) if len(lengths) and lengths.mean() > 0 else 1.0
+        df = np.diff(self.indptr).astype(np.float32)
+        idf = np.log1p((len(docs_tokens) - df + 0.5) / (df + 0.5))
+        norm = (BM25_K1 + 1) / (1 + BM25_K1 * (1 - BM25_B + BM25_B * lengths / avg_length))
+        self.weights = (idf[term_of] * norm[self.docs]).astype(np.float32)
+
+    def score_term(self, term: str, prefix: bool, out: np.ndarray) -> None:
+        """Добавляет в out лучший вклад терма для каждого документа (OR по найденным термам словаря)."""
+        best = np.zeros_like(out)
+        if prefix:
+            lo, hi = self.vocab.prefix_range(term)
+        else:
+            lo = self.vocab.ids.get(term, -1)
+            hi = lo + 1 if lo >= 0 else lo
+        if hi > lo:
+            start, end = self.indptr[lo], self.indptr[hi]
+            np.maximum.at(best, self.docs[start:end], self.weights[start:end])
+
+        max_edits = auto_fuzziness(term)
+        if max_edits:
+            prefix_edits, full_edits = self.vocab.fuzzy(term, max_edits)
+            for token_id, edits in (prefix_edits if prefix else full_edits).items():
+                start, end = self.indptr[token_id], self.indptr[token_id + 1]
+                if not edits or start == end:
+                    continue
+                # Как у fuzzy-запросов ES: чем больше правок, тем меньше вес
+                penalty = 1.0 - edits / max(len(term), 1)
+                np.maximum.at(best, self.docs[start:end], self.weights[start:end] * penalty)
+        out += best
+
+    def score_bool_prefix(self, terms: List[str], out: np.ndarray) -> None:
+        """bool_prefix: все термы — fuzzy term-запросы, последний — ещё и префиксный."""
+        for i, term in enumerate(terms):
+            self.score_term(term, prefix=self.edge_ngram or i == len(terms) - 1, out=out)
+
+
+class LocalSearchEngine:
+    """Каталог в памяти + тот же гибридный запрос, что search_es(); search() совместим с ним по сигнатуре."""
+
+    def __init__(self, catalog_path: Union[str, Path], encoder=None, encode_batch: int = 256,
+                 vector_store: Optional[Union[str, Path]] = None):
+        names, variants, descriptions, sources, ids, quantities, texts = [], [], [], [], [], [], []
+        for product in iter_products(catalog_path):
+            if not product.name:
+                continue
+            norm_name = product.norm_name
+            ids.append(product.id)
+            names.append(norm_name)
+            variants.append(normalized_variants(norm_name))
+            descriptions.append(normalize_text(product.description))
+            quantities.append((product.category, product.quantity))
+            sources.append({"name": product.name, "category": product.category,
+                            "price": product.price, "weight": product.weight})
+            texts.append(f"{norm_name} {product.description}")  # тот же текст, что в load_catalog.product_docs
+
+        self.ids = ids
+        self.sources = sources
+        self.numeric = NumericIndex(quantities)
+        by_category: Dict[str, List[int]] = {}
+        for doc, source in enumerate(sources):
+            by_category.setdefault(source["category"], []).append(doc)
+        self.category_docs = {category: np.array(docs, dtype=np.int64) for category, docs in by_category.items()}
+        name_tokens = [name.split() for name in names]
+        variant_tokens = [[t for v in vs for t in normalize_text(v).split()] for vs in variants]
+        description_tokens = [d.split() for d in descriptions]
+        # Один словарь на все поля: опечатки в терме ищутся один раз на запрос
+        self.vocab = Vocabulary(t for docs in (name_tokens, variant_tokens, description_tokens)
+                                for tokens in docs for t in tokens)
+        self.name = FieldIndex(self.vocab, name_tokens, edge_ngram=True)
+        self.name_variants = FieldIndex(self.vocab, variant_tokens, edge_ngram=True)
+        self.description = FieldIndex(self.vocab, description_tokens)
+
+        self.encoder = encoder  # None — общий query_encoder() с LRU запросов
+        self.store: Optional[VectorStore] = None
+        self.vectors: Optional[np.ndarray] = None
+        if vector_store:
+            # Векторы не кодируются и не копируются: kNN читает memmap хранилища
+            self.store = VectorStore(vector_store)
+            missing = [doc_id for doc_id in ids if doc_id not in self.store.row_of]
+            if missing:
+                raise ValueError(f"{len(missing)} products are missing from {vector_store}, rebuild it")
+            self.row_of_doc = np.array([self.store.row_of[doc_id] for doc_id in ids], dtype=np.int64)
+            self.doc_of_row = np.full(len(self.store), -1, dtype=np.int64)
+            self.doc_of_row[self.row_of_doc] = np.arange(len(ids))
+        else:
+            encoder = encoder or get_encoder(EMBEDDING_CACHE_DIR)
+            vectors = encoder.encode(texts, batch_size=encode_batch, show_progress_bar=False)
+            self.vectors = np.ascontiguousarray(normalize_rows(vectors))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def numeric_candidates(self, quantity: Quantity) -> np.ndarray:
+        """Маска товаров, прошедших фильтр по весу; в категориях без таких размеров — ближайшие."""
+        allowed = np.zeros(len(self.ids), dtype=bool)
+        allowed[self.numeric.at_least(quantity.dimension, quantity.amount, k=NEAREST_SIZES)] = True
+        return allowed
+
+    def category_docs_of(self, categories: Iterable[str]) -> np.ndarray:
+        """Номера товаров этих категорий по возрастанию."""
+        parts = [self.category_docs[c] for c in categories if c in self.category_docs]
+        return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+    def lexical_scores(self, prepared: PreparedQuery, category_docs: Optional[np.ndarray] = None) -> np.ndarray:
+        """Score bool-части запроса; 0 — документ не прошёл should, must или фильтр категорий."""
+        n = len(self.ids)
+        allowed = self.numeric_candidates(prepared.quantity) if prepared.quantity else None
+        if category_docs is not None:
+            in_categories = np.zeros(n, dtype=bool)
+            in_categories[category_docs] = True
+            allowed = in_categories if allowed is None else allowed & in_categories
+        if allowed is not None and not allowed.any():
+            return np.zeros(n, dtype=np.float32)  # must/фильтр не проходит никто — текст не считаем
+        terms = prepared.norm_query.split()
+        # bool_prefix multi_match считается как most_fields: сумма полей с бустами
+        main = np.zeros(n, dtype=np.float32)
+        for field, boost in ((self.name, 3.0), (self.name_variants, 2.0), (self.description, 1.0)):
+            field_scores = np.zeros(n, dtype=np.float32)
+            field.score_bool_prefix(terms, out=field_scores)
+            main += boost * field_scores
+
+        translit = np.zeros(n, dtype=np.float32)
+        for term in dict.fromkeys(prepared.variants.split()):
+            self.name_variants.score_term(term, prefix=self.name_variants.edge_ngram, out=translit)
+
+        scores = main + translit
+        matched = scores > 0
+        if allowed is not None:
+            matched &= allowed
+        if prepared.quantity:
+            scores = scores + 1.0  # range в must даёт постоянный score 1
+        return np.where(matched, scores, 0.0).astype(np.float32)
+
+    def knn(self, query_vector: np.ndarray, docs: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(номера товаров, cos) KNN_K ближайших; docs — искать только среди этих товаров."""
+        if self.store is not None:
+            rows = None if docs is None else np.sort(self.row_of_doc[docs])
+            rows, similarity = self.store.search(query_vector, KNN_K, DEFAULT_NUM_CANDIDATES, rows=rows)
+            found = self.doc_of_row[rows]
+            keep = found >= 0  # строки хранилища, которых уже нет в каталоге
+            return found[keep], similarity[keep]
+        query = normalize_rows(query_vector)
+        similarity = self.vectors @ query if docs is None else self.vectors[docs] @ query
+        k = min(KNN_K, len(similarity))
+        if not k:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = np.argpartition(-similarity, k - 1)[:k]
+        return (top if docs is None else docs[top]), similarity[top]
+
+    def top_hits(self, prepared: PreparedQuery, query_vector: np.ndarray) -> Tuple[List[dict], int]:
+        """(RESULT_SIZE лучших hits до rerank, число kNN-соседей) — часть search() после кодирования."""
+        category_docs = self.category_docs_of(prepared.categories) if prepared.categories else None
+        scores = self.lexical_scores(prepared, category_docs)
+        knn, similarity = self.knn(np.asarray(query_vector, dtype=np.float32), category_docs)
+        scores[knn] += (1.0 + similarity) / 2  # knn не фильтруется must-частью, как в ES (фильтр категорий — да)
+
+        candidates = np.flatnonzero(scores > 0)
+        top = candidates[np.argsort(-scores[candidates], kind="stable")[:RESULT_SIZE]]
+        hits = [{"_id": self.ids[i], "_score": float(scores[i]), "_source": dict(self.sources[i])} for i in top]
+        return hits, len(knn)
+
+    def search(self, original_query: str, timings: Optional[StageTimings] = None,
+               prepared: Optional[PreparedQuery] = None) -> Tuple[List[dict], int, dict]:
+        """(hits в формате ES, latency_ms, описание запроса) — как search_es(), prepared — тоже."""
+        timings = {} if timings is None else timings
+        t0 = time.perf_counter_ns()
+        if prepared is None:
+            prepared = prepare_query(original_query)
+            timings["normalize"] = time.perf_counter_ns() - t0
+        t1 = time.perf_counter_ns()
+        query_vector = np.asarray((self.encoder or query_encoder()).encode(prepared.norm_query), dtype=np.float32)
+        t2 = time.perf_counter_ns()
+        hits, k = self.top_hits(prepared, query_vector)
+        t3 = time.perf_counter_ns()
+        reranked = rerank(hits, prepared.norm_query)
+        timings["encode"] = t2 - t1
+        timings["score"] = t3 - t2
+        timings["rerank"] = time.perf_counter_ns() - t3
+        return reranked, (t3 - t2) // 1_000_000, self.describe(prepared, k)
+
+    @staticmethod
+    def describe(prepared: PreparedQuery, k: int) -> dict:
+        return {"backend": "local", "query": prepared._asdict(), "k": k}
+
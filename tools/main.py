@@ -1,48 +1,33 @@
-import xml.etree.ElementTree as ET
 import csv
-import re
 import json
 import difflib
-from typing import List
-
-def normalize_text(text: str) -> str:
-    """Универсальная нормализация: lower, strip, remove punct (keep unicode letters/digits), squeeze spaces."""
-    text = text.lower().strip()
-    text = re.sub(r'[^\w\s]', '', text)  # Удаляем пунктуацию, оставляем буквы (вкл. кириллицу), цифры, _
-    text = re.sub(r'\s+', ' ', text)  # Сжимаем пробелы
-    return text
-
-# Маппинг для wrong keyboard (latin keys to ru chars)
-LAT_TO_RU_KEYMAP = {
-    'a': 'ф', 'b': 'и', 'c': 'с', 'd': 'в', 'e': 'у', 'f': 'а', 'g': 'п', 'h': 'р', 'i': 'ш', 'j': 'о',
-    'k': 'л', 'l': 'д', 'm': 'ь', 'n': 'т', 'o': 'щ', 'p': 'з', 'q': 'й', 'r': 'к', 's': 'ы', 't': 'е',
-    'u': 'г', 'v': 'м', 'w': 'ц', 'x': 'ч', 'y': 'н', 'z': 'я', ';': 'ж', "'": 'э', ',': 'б', '.': 'ю',
-    '/': '.', '[': 'х', ']': 'ъ', # Добавил распространённые
-}
-
-def lat_to_ru_keymap(text: str) -> str:
-    """Translit latin to ru via keyboard map."""
-    return ''.join(LAT_TO_RU_KEYMAP.get(c, c) for c in text)
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+from catalog_reader import iter_products
+from normalize import normalize_names, normalize_query
+from prefix_index import PrefixIndex, max_edits_for
+from translit import lat_to_ru_keymap, normalized_variants
+
+MAX_CACHED_INDEXES = 2  # каталогов в памяти процесса обычно один-два
+
+# id списка -> (сам список, версия, индекс); ссылка на список держит его id за записью
+_INDEXES: "OrderedDict[int, Tuple[List[str], Hashable, PrefixIndex]]" = OrderedDict()
 
 def load_product_names(xml_path: str) -> List[str]:
-    """Парсинг XML и извлечение уникальных имён продуктов (оригинальные, но нормализуем для поиска)."""
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
+    """Потоковый разбор XML и извлечение уникальных имён продуктов (оригинальные, но нормализуем для поиска)."""
     names = set()
-    for product in root.findall('.//product'):
-        name_elem = product.find('name')
-        if name_elem is not None and name_elem.text:
-            original = name_elem.text.strip()
-            if original:
-                names.add(original)  # Храним оригинальные для вывода
+    for product in iter_products(xml_path):
+        if product.name:
+            names.add(product.name)  # Храним оригинальные для вывода
     return sorted(list(names))  # Отсортированные оригинальные
 
-def prefix_search(product_names: List[str], prefix: str) -> List[str]:
-    """Префиксный поиск с variants: fuzzy, no-space, translit."""
+def prefix_search_linear(product_names: List[str], prefix: str) -> List[str]:
+    """Линейный префиксный поиск с variants: fuzzy, no-space, translit (difflib по всему каталогу)."""
     if not prefix:
         return []
     
-    norm_prefix = normalize_text(prefix)
+    norm_prefix = normalize_query(prefix)
     norm_prefix_ns = norm_prefix.replace(' ', '')  # Без пробелов
     is_ascii = all(ord(c) < 128 for c in norm_prefix)  # Проверяем на ASCII (возможный wrong keyboard)
     translit_prefix = lat_to_ru_keymap(norm_prefix) if is_ascii else ''
@@ -51,8 +36,7 @@ def prefix_search(product_names: List[str], prefix: str) -> List[str]:
     results = set()  # Избегаем дубликатов
     threshold = 0.8  # Fuzzy threshold
     
-    for original_name in product_names:
-        norm_name = normalize_text(original_name)
+    for original_name, norm_name in zip(product_names, normalize_names(product_names)):
         norm_name_ns = norm_name.replace(' ', '')
         
         prefix_len = len(norm_prefix)
@@ -85,16 +69,116 @@ def prefix_search(product_names: List[str], prefix: str) -> List[str]:
     
     return sorted(list(results))  # Отсортированные оригинальные имена
 
+def token_suffixes(text: str) -> List[str]:
+    """Хвосты строки, начинающиеся с каждого токена: 'a b c' -> ['a b c', 'b c', 'c']."""
+    tokens = text.split(' ')
+    return [' '.join(tokens[i:]) for i in range(len(tokens))]
+
+def product_variants(norm_name: str) -> List[str]:
+    """Варианты имени для индекса — те же, что name_variants в ES (translit.normalized_variants)."""
+    return normalized_variants(norm_name)
+
+def query_keys(prefix: str) -> List[str]:
+    """Ключи запроса для точного поиска: [норм., без пробелов, раскладка, раскладка без пробелов].
+
+    Раскладка переводится до нормализации, чтобы ';' -> 'ж' и '[' -> 'х' не терялись.
+    Порядок фиксирован: сессия сравнивает ключи соседних нажатий попарно.
+    """
+    norm_prefix = normalize_query(prefix)
+    layout_prefix = normalize_query(lat_to_ru_keymap(prefix.lower()))
+    return [norm_prefix, norm_prefix.replace(' ', ''), layout_prefix, layout_prefix.replace(' ', '')]
+
+def build_prefix_index(product_names: List[str], version: Hashable = 0) -> PrefixIndex:
+    """Строит префиксный индекс: нормализованное имя, вариант без пробелов и варианты из product_variants.
+
+    Каждый вариант индексируется со всех границ токенов, как edge_ngram в ES, так что
+    префикс находит и начало имени, и любое слово внутри него.
+    id ключа — позиция имени в product_names; version уходит в normalize_names.
+    """
+    entries = []
+    for idx, norm_name in enumerate(normalize_names(product_names, version)):
+        for key in product_variants(norm_name):
+            for suffix in token_suffixes(key):
+                entries.append((suffix, idx))
+                entries.append((suffix.replace(' ', ''), idx))
+    return PrefixIndex(entries)
+
+def cached_prefix_index(product_names: List[str], version: Hashable = 0) -> PrefixIndex:
+    """build_prefix_index один раз на (список, version): для вызовов prefix_search без index.
+
+    Попадание проверяется за O(1) — тот же объект и та же version, содержимое
+    не сравнивается. Список, изменённый на месте, индексируется заново только
+    с новой version.
+    """
+    key = id(product_names)
+    cached = _INDEXES.get(key)
+    if cached is not None and cached[0] is product_names and cached[1] == version:
+        _INDEXES.move_to_end(key)
+        return cached[2]
+    index = build_prefix_index(product_names, version)
+    _INDEXES[key] = (product_names, version, index)
+    while len(_INDEXES) > MAX_CACHED_INDEXES:
+        _INDEXES.popitem(last=False)
+    return index
+
+def fuzzy_prefix_ids(norm_prefix: str, index: PrefixIndex, candidates: Optional[Iterable[int]] = None) -> Dict[int, int]:
+    """{id: расстояние} для fuzzy-префикса по нормализованному имени и варианту без пробелов.
+
+    Если передан candidates, проверяются только они (сужение уже найденного набора).
+    """
+    distances: Dict[int, int] = {}
+    for variant in {norm_prefix, norm_prefix.replace(' ', '')}:
+        max_edits = max_edits_for(variant)
+        if candidates is None:
+            found = index.fuzzy_lookup(variant, max_edits)
+        else:
+            found = {i: index.distance(i, variant, max_edits) for i in candidates}
+        for doc_id, distance in found.items():
+            if distance <= max_edits:
+                distances[doc_id] = min(distance, distances.get(doc_id, distance))
+    return distances
+
+def rank_fuzzy(product_names: List[str], distances: Dict[int, int]) -> List[str]:
+    """Имена по возрастанию расстояния, затем по алфавиту."""
+    return [product_names[i] for i in sorted(distances, key=lambda i: (distances[i], product_names[i]))]
+
+def fuzzy_prefix_search(product_names: List[str], prefix: str, index: PrefixIndex) -> List[str]:
+    """Fuzzy-префиксный поиск с фиксированным бюджетом правок (см. max_edits_for).
+
+    Результаты упорядочены по расстоянию, затем по имени.
+    """
+    return rank_fuzzy(product_names, fuzzy_prefix_ids(normalize_query(prefix), index))
+
+def prefix_search(product_names: List[str], prefix: str, index: Optional[PrefixIndex] = None,
+                  version: Hashable = 0) -> List[str]:
+    """Префиксный поиск по индексу; fuzzy-поиск по тому же индексу, только если точных совпадений нет.
+
+    Без index берётся индекс из cached_prefix_index — строится один раз на
+    (список имён, version); после изменения списка на месте передайте новую version.
+    """
+    if not prefix:
+        return []
+    if index is None:
+        index = cached_prefix_index(product_names, version)
+
+    ids = set()
+    for key in set(query_keys(prefix)):
+        ids |= index.lookup(key)
+    if not ids:
+        return fuzzy_prefix_search(product_names, prefix, index)
+    return sorted(product_names[i] for i in ids)  # Отсортированные оригинальные имена
+
 if __name__ == '__main__':
     xml_path = 'data/catalog_products.xml'
     csv_path = 'data/prefix_queries.csv'
     
     product_names = load_product_names(xml_path)
     print(f"Loaded {len(product_names)} unique product names.")
+    index = build_prefix_index(product_names)
     
     with open(csv_path, 'r', encoding='utf-8') as f:
         reader = csv.DictReader(f)
         for row in reader:
             prefix = row['query']  # Изменено на 'query'
-            results = prefix_search(product_names, prefix)
+            results = prefix_search(product_names, prefix, index)
             print(f"Prefix '{prefix}': {results[:5]}...")  # Топ-5 для примера
\ No newline at end of file
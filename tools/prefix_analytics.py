@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""Офлайн-аналитика нулевых выдач и вайтлиста по выгрузкам data/PREFIX_*.
+
+Файлы читаются в колонки (словарь имя -> numpy-массив), группировки по сайту и
+причине — np.unique(return_inverse) + np.bincount, без построчных циклов.
+
+Каждая пара бэклога (original_term -> expanded_term) прогоняется через
+локальный префиксный движок main.py: уникальные термины ищутся один раз, пары
+получают результат по индексам. Точный префиксный поиск без fuzzy — бюджет
+опечаток маскировал бы как раз те промахи, которые нужно найти. Классы:
+- over_rewrite — исходный запрос сам находит товары, а переписывание уводит
+  туда, где их нет, или не продолжает исходный текст;
+- translit_miss — исходный текст не находит ничего, но находит его раскладочный
+  или транслитерированный вариант (или вариант названия товара в индексе);
+- assortment_gap — ничего не находит ни исходный текст, ни его варианты:
+  товара нет в ассортименте, переписыванием это не исправить.
+
+Таблицы по сайтам повторяют docs/PREFIX_SEARCH_SORT_ANALYSIS_20251027.md
+(поведение префиксов, переписывания, бэклог нулевых выдач, качество вайтлиста)
+и пишутся в один Markdown-отчёт.
+
+python tools/prefix_analytics.py --output reports/prefix_analytics.md --pairs-output reports/prefix_backlog_classes.csv
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from main import build_prefix_index, load_product_names, query_keys, token_suffixes
+from normalize import normalize_names, normalize_text
+from prefix_index import PrefixIndex
+from translit import normalized_variants
+
+DATA_DIR = "data"
+STAMP = "20251027"
+DEFAULT_OUTPUT = "reports/prefix_analytics.md"
+
+ASSORTMENT_GAP, TRANSLIT_MISS, OVER_REWRITE = "assortment_gap", "translit_miss", "over_rewrite"
+CLASSES = (ASSORTMENT_GAP, TRANSLIT_MISS, OVER_REWRITE)
+
+Columns = Dict[str, np.ndarray]
+
+
+def read_columns(path: Path, numeric: Sequence[str] = ()) -> Columns:
+    """CSV -> {колонка: массив}; колонки из numeric — int64 (пустые значения — 0), остальные — строки."""
+    with path.open(newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        rows = list(reader)
+    columns: Columns = {}
+    for i, name in enumerate(header):
+        values = [row[i] if i < len(row) else "" for row in rows]
+        if name in numeric:
+            columns[name] = np.fromiter((int(v or 0) for v in values), dtype=np.int64, count=len(values))
+        else:
+            columns[name] = np.asarray(values, dtype=object)
+    return columns
+
+
+def group_sum(keys: np.ndarray, values: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    """(уникальные ключи, сумма values по ключу); без values — число строк."""
+    if not len(keys):
+        return np.empty(0, dtype=object), np.empty(0)
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, np.bincount(inverse, weights=values, minlength=len(unique))
+
+
+def crosstab(rows: np.ndarray, cols: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(строки, столбцы, матрица числа пар) — pivot по двум колонкам."""
+    row_keys, row_idx = np.unique(rows, return_inverse=True)
+    col_keys, col_idx = np.unique(cols, return_inverse=True)
+    table = np.zeros((len(row_keys), len(col_keys)), dtype=np.int64)
+    np.add.at(table, (row_idx, col_idx), 1)
+    return row_keys, col_keys, table
+
+
+class PrefixReplay:
+    """Точный префиксный поиск по каталогу для пакета терминов: каждый уникальный термин — один раз."""
+
+    def __init__(self, product_names: List[str]):
+        self.engine = build_prefix_index(product_names)
+        # Только нормализованные названия, без раскладочных и брендовых вариантов товара
+        entries = []
+        for idx, norm_name in enumerate(normalize_names(product_names)):
+            for suffix in token_suffixes(norm_name):
+                entries.append((suffix, idx))
+                entries.append((suffix.replace(" ", ""), idx))
+        self.plain = PrefixIndex(entries)
+
+    @staticmethod
+    def _count(index: PrefixIndex, keys: Iterable[str]) -> int:
+        ids = set()
+        for key in set(keys):
+            ids |= index.lookup(key)
+        return len(ids)
+
+    def direct(self, term: str) -> int:
+        norm = normalize_text(term)
+        return self._count(self.plain, (norm, norm.replace(" ", "")))
+
+    def translit(self, term: str) -> int:
+        """Товары, найденные раскладкой/транслитом запроса или вариантами названий в индексе движка."""
+        variants = normalized_variants(term.lower())[1:]
+        found = self._count(self.plain, [k for v in variants for k in (v, v.replace(" ", ""))])
+        return max(found, self._count(self.engine, query_keys(term)))
+
+    def counts(self, terms: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(прямые совпадения, совпадения вариантов) для каждого элемента terms."""
+        unique, inverse = np.unique(terms, return_inverse=True)
+        direct = np.fromiter((self.direct(t) for t in unique), dtype=np.int64, count=len(unique))
+        translit = np.fromiter((self.translit(t) for t in unique), dtype=np.int64, count=len(unique))
+        return direct[inverse], translit[inverse]
+
+
+def classify_pairs(replay: PrefixReplay, original: np.ndarray, expanded: np.ndarray) -> Tuple[np.ndarray, Columns]:
+    """Класс каждой пары и колонки совпадений, по которым он выбран."""
+    orig_direct, orig_variants = replay.counts(original)
+    exp_direct, _ = replay.counts(expanded)
+    norm_orig = np.asarray([normalize_text(t) for t in original], dtype=object)
+    norm_exp = np.asarray([normalize_text(t) for t in expanded], dtype=object)
+    continues = np.fromiter((e.startswith(o) for o, e in zip(norm_orig, norm_exp)), dtype=bool, count=len(original))
+
+    over = (orig_direct > 0) & ((exp_direct == 0) | ~continues)
+    translit = (orig_direct == 0) & (orig_variants > 0)
+    labels = np.select([over, translit], [OVER_REWRITE, TRANSLIT_MISS], default=ASSORTMENT_GAP).astype(object)
+    return labels, {"original_matches": orig_direct, "variant_matches": orig_variants, "expanded_matches": exp_direct}
+
+
+def _human(n: float) -> str:
+    """Три значащие цифры с k/M, как в таблицах отчёта: 28.8 M, 308 k, 955."""
+    for scale, suffix in ((1e6, " M"), (1e3, " k")):
+        if n >= scale:
+            value = n / scale
+            return f"{value:.{max(0, 2 - int(np.log10(value)))}f}{suffix}"
+    return f"{int(n)}"
+
+
+def _share(part: float, whole: float) -> str:
+    return f"{_human(part)} ({part / whole:.1%})".replace("%", " %") if whole else _human(part)
+
+
+def _table(header: Sequence[str], align: Sequence[str], rows: Iterable[Sequence[object]]) -> List[str]:
+    lines = ["| " + " | ".join(header) + " |", "| " + " | ".join(align) + " |"]
+    lines.extend("| " + " | ".join(str(cell) for cell in row) + " |" for row in rows)
+    return lines
+
+
+def behaviour_table(stats: dict) -> List[str]:
+    """Observed Prefix Behaviour: расширения префиксов и короткие запросы с долями нулевых выдач."""
+    rows = []
+    for site, data in stats.items():
+        a = {k: int(v) for k, v in data["aggregate"].items()}
+        blind = a["uniq_original"] == 0  # originalSearchTerm не пишется — считать нечего
+        rows.append([
+            site,
+            _human(a["total"]),
+            "instrumentation gap (0 recorded)" if blind else _share(a["expanded_from_prefix"], a["total"]),
+            "–" if blind else _share(a["zero_prefix_expanded"], a["expanded_from_prefix"]),
+            _share(a["single_words_2_5"], a["total"]),
+            "–" if blind else _share(a["zero_short_single"], a["single_words_2_5"]),
+        ])
+    return _table(["site", "total queries", "prefix expansions", "expansions → zero", "short 2–5 char singles", "short → zero"],
+                  ["---"] + ["---:"] * 5, rows)
+
+
+def rewrite_table(summary: dict) -> List[str]:
+    """Cross-Site Highlights: доли переписываний, расширений, коротких и нулевых выдач."""
+    rows = [[site, _human(s["total"])] + [f"{s[key]:.1%}".replace("%", " %") for key in
+                                          ("rewrite_pct", "prefix_expansion_pct", "short_single_pct", "zero_pct", "zero_prefix_pct")]
+            for site, s in summary.items()]
+    return _table(["site", "total", "rewritten", "prefix expanded", "short singles", "zero", "zero after expansion"],
+                  ["---"] + ["---:"] * 6, rows)
+
+
+def backlog_table(sites: Sequence[str], backlog: Columns, labels: np.ndarray) -> List[str]:
+    """Zero-Hit Backlog: пары, статус вайтлиста, нулевые выдачи и классы по сайтам."""
+    site_col = backlog["site_id"]
+    _, status_keys, by_status = crosstab(site_col, backlog["whitelist_status"]) if len(site_col) else ([], [], None)
+    site_keys, class_keys, by_class = crosstab(site_col, labels) if len(site_col) else ([], [], None)
+    zero_sites, zero_hits = group_sum(site_col, backlog["zero_hits"])
+    zero_by_site = dict(zip(zero_sites, zero_hits))
+    row_of = {site: i for i, site in enumerate(site_keys)}
+
+    rows = []
+    for site in sites:
+        if site not in row_of:
+            rows.append([site, 0, "–", "–", 0] + ["–"] * len(CLASSES) + ["no data"])
+            continue
+        i = row_of[site]
+        status = dict(zip(status_keys, by_status[i]))
+        classes = dict(zip(class_keys, by_class[i]))
+        mask = site_col == site
+        top = int(np.argmax(np.where(mask, backlog["zero_hits"], -1)))
+        rows.append([site, int(by_status[i].sum()), status.get("missing", 0), status.get("present", 0),
+                     int(zero_by_site[site])] + [classes.get(c, 0) for c in CLASSES] +
+                    [f"`{backlog['original_term'][top]}` → «{backlog['expanded_term'][top]}» ({backlog['zero_hits'][top]})"])
+    return _table(["site", "pairs", "WL missing", "WL present", "zero hits"] + list(CLASSES) + ["top offender"],
+                  ["---"] + ["---:"] * (4 + len(CLASSES)) + ["---"], rows)
+
+
+def whitelist_table(sites: Sequence[str], quality: dict, flagged: Columns, candidates: Columns, diff: Columns) -> List[str]:
+    """Whitelist Review: профиль исправлений, флаги, кандидаты и доля исправлений, совпавших с ожиданием."""
+    flag_sites, flag_counts = group_sum(flagged["site_id"])
+    flags = dict(zip(flag_sites, flag_counts.astype(int)))
+    cand_sites, cand_zero = group_sum(candidates["site_id"], candidates["zero_hits"])
+    cand = dict(zip(cand_sites, cand_zero.astype(int)))
+    cand_pairs = dict(zip(*group_sum(candidates["site_id"])))
+    fixed = diff["with_correction"] == diff["expected"]
+    diff_sites, diff_fixed = group_sum(diff["site_id"], fixed.astype(float))
+    diff_total = dict(zip(*group_sum(diff["site_id"])))
+    diff_ok = dict(zip(diff_sites, diff_fixed))
+
+    rows = []
+    for site in sites:
+        q = quality.get(site, {})
+        total = q.get("total", 0)
+        rows.append([
+            site, _human(total),
+            _share(q.get("query_subset_of_correction", 0), total),
+            _share(q.get("latin_query_cyr_corr", 0), total),
+            _share(q.get("cyr_query_latin_corr", 0), total),
+            _share(q.get("multiword_correction", 0), total),
+            flags.get(site, 0),
+            f"{int(cand_pairs.get(site, 0))} / {cand.get(site, 0)}",
+            f"{int(diff_ok[site])}/{int(diff_total[site])}" if site in diff_total else "–",
+        ])
+    return _table(["site", "WL entries", "query ⊂ correction", "latin → cyr", "cyr → latin", "multiword",
+                   "flagged", "candidates / zero hits", "debug diff fixed"],
+                  ["---"] + ["---:"] * 8, rows)
+
+
+def load_exports(data_dir: Path, stamp: str = STAMP) -> Dict[str, object]:
+    def json_file(name: str):
+        with (data_dir / name).open(encoding="utf-8") as f:
+            return json.load(f)
+
+    return {
+        "stats": json_file(f"PREFIX_SEARCH_STATS_{stamp}.json"),
+        "summary": json_file(f"PREFIX_SEARCH_SUMMARY_{stamp}.json"),
+        "quality": json_file(f"PREFIX_WL_QUALITY_REPORT_{stamp}.json"),
+        "backlog": read_columns(data_dir / f"PREFIX_ZERO_EXPANSION_BACKLOG_{stamp}.csv", numeric=("zero_hits",)),
+        "candidates": read_columns(data_dir / f"PREFIX_WL_CANDIDATES_{stamp}.csv", numeric=("zero_hits",)),
+        "flagged": read_columns(data_dir / f"PREFIX_WL_FLAGGED_TOP_{stamp}.csv"),
+        "diff": read_columns(data_dir / "PREFIX_DEBUG_DIFF_REPORT.csv"),
+    }
+
+
+def build_report(exports: Dict[str, object], labels: np.ndarray) -> str:
+    sites = list(exports["stats"])
+    lines = [f"# Prefix zero-hit and whitelist analytics ({STAMP})", "",
+             "Generated by `tools/prefix_analytics.py`; backlog pairs replayed through the local prefix index.", "",
+             "## Observed Prefix Behaviour", ""]
+    lines += behaviour_table(exports["stats"])
+    lines += ["", "## Rewrites per Site", ""]
+    lines += rewrite_table(exports["summary"])
+    lines += ["", "## Zero-Hit Backlog", ""]
+    lines += backlog_table(sites, exports["backlog"], labels)
+    lines += ["", "## Whitelist Review", ""]
+    lines += whitelist_table(sites, exports["quality"], exports["flagged"], exports["candidates"], exports["diff"])
+    return "\n".join(lines) + "\n"
+
+
+def write_pairs(path: Path, backlog: Columns, labels: np.ndarray, matches: Columns) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    names = ["site_id", "original_term", "expanded_term", "zero_hits", "whitelist_status"]
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(names + list(matches) + ["class"])
+        columns = [backlog[n] for n in names] + list(matches.values()) + [labels]
+        writer.writerows(zip(*columns))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Zero-hit and whitelist analytics over the PREFIX_* exports")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Directory with the PREFIX_* files")
+    parser.add_argument("--catalog", default="data/catalog_products.xml", help="Catalog the backlog pairs are replayed against")
+    parser.add_argument("--backlog", help="Zero-expansion backlog CSV (default: the one in --data-dir)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Markdown report with the per-site tables")
+    parser.add_argument("--pairs-output", help="CSV with every backlog pair, its match counts and class")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    exports = load_exports(Path(args.data_dir))
+    if args.backlog:
+        exports["backlog"] = read_columns(Path(args.backlog), numeric=("zero_hits",))
+    backlog = exports["backlog"]
+    replay = PrefixReplay(load_product_names(args.catalog))
+    loaded = time.perf_counter()
+    labels, matches = classify_pairs(replay, backlog["original_term"], backlog["expanded_term"])
+    replayed = time.perf_counter()
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(build_report(exports, labels), encoding="utf-8")
+    if args.pairs_output:
+        write_pairs(Path(args.pairs_output), backlog, labels, matches)
+
+    classes, counts = group_sum(labels)
+    print(f"Replayed {len(labels)} backlog pairs in {replayed - loaded:.2f}s (load {loaded - started:.2f}s): "
+          + ", ".join(f"{c} {int(n)}" for c, n in zip(classes, counts)))
+    print(f"Report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
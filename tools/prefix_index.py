@@ -0,0 +1,168 @@
+"""Префиксный индекс над нормализованными ключами товаров.
+
+Ключи хранятся в отсортированном массиве, поиск по префиксу — это два bisect
+по границам диапазона, так что запрос не трогает товары, которые не подходят.
+Отсортированный массив — это развёрнутый trie: соседние ключи делят общий
+префикс, поэтому fuzzy-поиск обходит его как Levenshtein-автомат, переиспользуя
+строки DP для общего префикса и перепрыгивая целые поддеревья через bisect.
+"""
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Set, Tuple
+
+# Символ, который сортируется после любого реального символа ключа
+_MAX_CHAR = '\U0010ffff'
+
+
+def max_edits_for(prefix: str) -> int:
+    """Бюджет опечаток по длине префикса: короткие префиксы ("ма") не переписываем."""
+    length = len(prefix)
+    if length <= 3:
+        return 0
+    if length <= 6:
+        return 1
+    return 2
+
+
+def _common_prefix_len(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def _next_row(row: List[int], prefix: str, c: str, depth: int, max_edits: int) -> List[int]:
+    """Строка DP для key[:depth] по строке для key[:depth - 1] и символу c = key[depth - 1].
+
+    Считаются только клетки полосы |j - depth| <= max_edits, остальные и все
+    значения больше бюджета хранятся как max_edits + 1.
+    """
+    m = len(prefix)
+    over = max_edits + 1
+    new_row = [over] * (m + 1)
+    if depth <= max_edits:
+        new_row[0] = depth
+    for j in range(max(1, depth - max_edits), min(m, depth + max_edits) + 1):
+        # min() из трёх переходов, развёрнутый руками: это самый горячий цикл
+        cost = row[j - 1] + (prefix[j - 1] != c)
+        if row[j] < cost:
+            cost = row[j] + 1
+        if new_row[j - 1] < cost:
+            cost = new_row[j - 1] + 1
+        new_row[j] = cost if cost < over else over
+    return new_row
+
+
+def prefix_distance(prefix: str, key: str, max_edits: int) -> int:
+    """Минимальное расстояние от prefix до начала key; max_edits + 1, если больше бюджета."""
+    row = [min(j, max_edits + 1) for j in range(len(prefix) + 1)]
+    best = row[-1]
+    for depth, c in enumerate(key[:len(prefix) + max_edits], 1):
+        if min(row) > max_edits:
+            break
+        row = _next_row(row, prefix, c, depth, max_edits)
+        best = min(best, row[-1])
+    return best
+
+
+class PrefixIndex:
+    """Отсортированный массив (ключ, id товара) с диапазонным поиском по префиксу."""
+
+    def __init__(self, entries: Iterable[Tuple[str, int]]):
+        pairs = sorted(set((key, doc_id) for key, doc_id in entries if key))
+        self.keys: List[str] = [key for key, _ in pairs]
+        self.ids: List[int] = [doc_id for _, doc_id in pairs]
+        self._keys_by_id: Dict[int, List[str]] | None = None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def range(self, prefix: str) -> Tuple[int, int]:
+        """Границы [lo, hi) ключей, начинающихся с prefix."""
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + _MAX_CHAR, lo)
+        return lo, hi
+
+    def keys_for(self, doc_id: int) -> List[str]:
+        """Все ключи товара doc_id (обратное отображение строится при первом вызове)."""
+        if self._keys_by_id is None:
+            keys_by_id: Dict[int, List[str]] = {}
+            for key, key_id in zip(self.keys, self.ids):
+                keys_by_id.setdefault(key_id, []).append(key)
+            self._keys_by_id = keys_by_id
+        return self._keys_by_id.get(doc_id, [])
+
+    def matches(self, doc_id: int, prefix: str) -> bool:
+        """Начинается ли какой-то ключ товара doc_id с prefix (без обхода всего индекса)."""
+        return any(key.startswith(prefix) for key in self.keys_for(doc_id))
+
+    def distance(self, doc_id: int, prefix: str, max_edits: int) -> int:
+        """То же расстояние, что fuzzy_lookup(), но только для одного товара."""
+        best = max_edits + 1
+        for key in self.keys_for(doc_id):
+            best = min(best, prefix_distance(prefix, key, max_edits))
+            if best == 0:
+                break
+        return best
+
+    def lookup(self, prefix: str) -> Set[int]:
+        """id товаров, у которых хотя бы один ключ начинается с prefix."""
+        if not prefix:
+            return set()
+        lo, hi = self.range(prefix)
+        return set(self.ids[lo:hi])
+
+    def fuzzy_lookup(self, prefix: str, max_edits: int) -> Dict[int, int]:
+        """id товаров, у которых ключ начинается в пределах max_edits правок от prefix.
+
+        Возвращает {id: минимальное расстояние}. Строка DP rows[d] — расстояния от
+        префиксов запроса до key[:d]; совпадение — rows[d][-1] <= max_edits для
+        какой-то глубины d. Если min(rows[d]) > max_edits, расстояние для ключей с
+        началом key[:d] уже не изменится, и всё поддерево обрабатывается одним шагом.
+        """
+        if not prefix:
+            return {}
+        if max_edits <= 0:
+            return dict.fromkeys(self.lookup(prefix), 0)
+
+        m = len(prefix)
+        max_depth = m + max_edits  # глубже rows[d][-1] >= d - m > max_edits
+        over = max_edits + 1  # все значения больше бюджета эквивалентны
+        rows: List[List[int]] = [[min(j, over) for j in range(m + 1)]]
+        best: List[int] = [min(m, over)]  # best[d] = min(rows[0..d][-1])
+        path = ''
+        results: Dict[int, int] = {}
+        keys = self.keys
+        i, n = 0, len(keys)
+
+        while i < n:
+            key = keys[i]
+            depth = min(_common_prefix_len(path, key), len(rows) - 1)
+            del rows[depth + 1:]
+            del best[depth + 1:]
+            limit = min(len(key), max_depth)
+            pruned = False
+
+            while depth < limit:
+                row = rows[depth]
+                if min(row) > max_edits:
+                    pruned = True
+                    break
+                depth += 1
+                new_row = _next_row(row, prefix, key[depth - 1], depth, max_edits)
+                rows.append(new_row)
+                best.append(min(best[-1], new_row[-1]))
+
+            path = key
+            distance = best[depth]
+            # Глубже key[:depth] расстояние уже не улучшится: всё поддерево получает best[depth]
+            end = bisect_left(keys, key[:depth] + _MAX_CHAR, i + 1) if pruned else i + 1
+            if distance <= max_edits:
+                for doc_id in self.ids[i:end]:
+                    if distance < results.get(doc_id, max_edits + 1):
+                        results[doc_id] = distance
+            i = end
+
+        return results
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""Офлайн-карта префикс -> топ дополнений по сайтам (prefixMap из PREFIX_SEARCH_SORT_ANALYSIS).
+
+Источники:
+- PREFIX_EXPANSIONS_20251027.json: пары orig -> search с частотами; каждый
+  префикс orig и search получает дополнение search с весом freq (максимум по
+  парам: 'моро' и 'морож' — один и тот же трафик на разных нажатиях);
+  дополнение, по которому prefix_search не находит в каталоге ни одного
+  товара, выбрасывается при сборке;
+- нулевые выдачи: zero_freq из expansions, zero_expansions и
+  ZERO_EXPANSION_BACKLOG суммируются по (сайт, дополнение); дополнение
+  выбрасывается, если доля нулевых выдач >= --max-zero-ratio;
+- каталог: первое слово и первые два слова нормализованных названий с весом
+  "сколько товаров так начинается" — общий для всех сайтов раздел.
+
+Карта пишется в prefix_table.py (mmap, открытая адресация). Цепочка на
+запросе: дополнения сайта, затем каталожные, и только если префикса нет ни
+там, ни там — поиск по префиксному индексу с fuzzy (main.prefix_search).
+Ответ — список Completion с типом: "query" — фраза для поиска из карты,
+"product" — название товара из индекса.
+
+python tools/prefix_map.py --output .cache/prefix_map.bin --queries data/prefix_queries.csv
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from main import build_prefix_index, load_product_names, prefix_search
+from normalize import normalize_names, normalize_query, normalize_text
+from prefix_index import PrefixIndex
+from prefix_table import Items, PrefixTable, write_table
+
+DEFAULT_EXPANSIONS = "data/PREFIX_EXPANSIONS_20251027.json"
+DEFAULT_ZERO_BACKLOG = "data/PREFIX_ZERO_EXPANSION_BACKLOG_20251027.csv"
+DEFAULT_OUTPUT = ".cache/prefix_map.bin"
+DEFAULT_MAX_PREFIX = 12
+DEFAULT_TOP_K = 10
+DEFAULT_MAX_ZERO_RATIO = 0.5
+CATALOG_SITE = ""  # раздел дополнений из каталога, общий для всех сайтов
+
+
+class Completion(NamedTuple):
+    text: str
+    kind: str  # "query" — поисковая фраза из карты, "product" — название товара из каталога
+
+
+def table_key(site: str, prefix: str) -> str:
+    return f"{site}\t{prefix}"
+
+
+def prefixes(text: str, max_prefix: int) -> Iterable[str]:
+    for i in range(1, min(len(text), max_prefix) + 1):
+        if not text[i - 1].isspace():  # "мороженое " не отдельный префикс
+            yield text[:i]
+
+
+def _int(value) -> int:
+    return int(value or 0)
+
+
+def zero_hit_ratios(expansions: dict, backlog_path: Optional[str]) -> Dict[Tuple[str, str], float]:
+    """{(сайт, дополнение): доля нулевых выдач}; дополнения без трафика, но с нулями — 1.0."""
+    traffic: Counter = Counter()
+    zeros: Counter = Counter()
+    for site, rows in expansions.get("expansions", {}).items():
+        for row in rows:
+            target = normalize_text(row["search"])
+            traffic[site, target] += _int(row["freq"])
+            zeros[site, target] += _int(row["zero_freq"])
+    for site, rows in expansions.get("zero_expansions", {}).items():
+        for row in rows:
+            zeros[site, normalize_text(row["search"])] += _int(row["zero_freq"])
+    if backlog_path and Path(backlog_path).exists():
+        with Path(backlog_path).open(newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                zeros[row["site_id"], normalize_text(row["expanded_term"])] += _int(row["zero_hits"])
+    return {key: (zeros[key] / traffic[key] if traffic[key] else 1.0) for key in zeros if zeros[key]}
+
+
+def _top(weights: Dict[str, float], top_k: int) -> Items:
+    return sorted(weights.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+
+
+def build_entries(
+    product_names: List[str],
+    expansions_path: str = DEFAULT_EXPANSIONS,
+    backlog_path: Optional[str] = DEFAULT_ZERO_BACKLOG,
+    max_prefix: int = DEFAULT_MAX_PREFIX,
+    top_k: int = DEFAULT_TOP_K,
+    max_zero_ratio: float = DEFAULT_MAX_ZERO_RATIO,
+    index: Optional[PrefixIndex] = None,
+) -> Tuple[Dict[str, Items], Counter]:
+    """(ключ таблицы -> топ дополнений, счётчики сборки)."""
+    with Path(expansions_path).open(encoding="utf-8") as f:
+        expansions = json.load(f)
+    zero_ratio = zero_hit_ratios(expansions, backlog_path)
+    index = index if index is not None else build_prefix_index(product_names)
+    resolves: Dict[str, bool] = {}  # дополнение -> находит ли prefix_search товары
+    counts: Counter = Counter()
+    weights: Dict[str, Dict[str, float]] = defaultdict(dict)
+
+    for site, rows in expansions.get("expansions", {}).items():
+        for row in rows:
+            orig, target = normalize_text(row["orig"]), normalize_text(row["search"])
+            freq = _int(row["freq"])
+            if not target or freq <= 0:
+                continue
+            if zero_ratio.get((site, target), 0.0) >= max_zero_ratio:
+                counts["dropped_zero_hit"] += 1
+                continue
+            if target not in resolves:
+                resolves[target] = bool(prefix_search(product_names, target, index))
+            if not resolves[target]:  # логи помнят товары, которых в этом каталоге нет
+                counts["dropped_unresolved"] += 1
+                continue
+            counts["log_pairs"] += 1
+            for prefix in set(prefixes(orig, max_prefix)) | set(prefixes(target, max_prefix)):
+                completions = weights[table_key(site, prefix)]
+                completions[target] = max(completions.get(target, 0.0), float(freq))
+
+    # Каталог: фразы, с которых начинаются названия, с весом "сколько товаров"
+    phrases: Counter = Counter()
+    for norm_name in normalize_names(product_names):
+        tokens = norm_name.split()
+        phrases.update({" ".join(tokens[:n]) for n in (1, 2) if len(tokens) >= n})
+    for phrase, products in phrases.items():
+        for prefix in prefixes(phrase, max_prefix):
+            weights[table_key(CATALOG_SITE, prefix)][phrase] = float(products)
+    counts["catalog_phrases"] = len(phrases)
+
+    entries = {key: _top(completions, top_k) for key, completions in weights.items()}
+    counts["keys"] = len(entries)
+    return entries, counts
+
+
+class PrefixCompleter:
+    """Дополнения по карте за два O(1)-обращения; fuzzy-поиск по индексу только при промахе."""
+
+    def __init__(self, table: PrefixTable, product_names: List[str], index: Optional[PrefixIndex] = None):
+        self.table = table
+        self.product_names = product_names
+        self.index = index if index is not None else build_prefix_index(product_names)
+        self.stats: Counter = Counter()
+
+    def complete(self, site: str, query: str, limit: int = DEFAULT_TOP_K) -> Tuple[List[Completion], str]:
+        """(дополнения, источник): 'map' — фразы из карты, 'index' — товары из префиксного/fuzzy-поиска."""
+        prefix = normalize_query(query)
+        if not prefix:
+            return [], "empty"
+        site_items = self.table.get(table_key(site, prefix)) or []
+        catalog_items = self.table.get(table_key(CATALOG_SITE, prefix)) or []
+        if site_items or catalog_items:
+            self.stats["map"] += 1
+            merged = dict.fromkeys(text for text, _ in site_items + catalog_items)
+            return [Completion(text, "query") for text in list(merged)[:limit]], "map"
+        self.stats["index"] += 1
+        return [Completion(name, "product") for name in prefix_search(self.product_names, query, self.index)[:limit]], "index"
+
+
+def replay(completer: PrefixCompleter, queries: List[Tuple[str, str]]) -> Dict[str, float]:
+    """Прогон запросов по нажатиям: доля ответов из карты и время map/index."""
+    elapsed: Dict[str, List[float]] = defaultdict(list)
+    for query, site in queries:
+        for i in range(1, len(query) + 1):
+            started = time.perf_counter()
+            _, source = completer.complete(site, query[:i])
+            elapsed[source].append((time.perf_counter() - started) * 1000)
+    total = sum(len(values) for values in elapsed.values())
+    report = {"keystrokes": total, "map_hit_ratio": len(elapsed["map"]) / total if total else 0.0}
+    for source, values in elapsed.items():
+        report[f"{source}_mean_ms"] = round(sum(values) / len(values), 4) if values else 0.0
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the per-site prefix completion map")
+    parser.add_argument("--catalog", default="data/catalog_products.xml", help="Path to the XML catalog")
+    parser.add_argument("--expansions", default=DEFAULT_EXPANSIONS, help="PREFIX_EXPANSIONS JSON")
+    parser.add_argument("--zero-backlog", default=DEFAULT_ZERO_BACKLOG, help="PREFIX_ZERO_EXPANSION_BACKLOG CSV")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Binary table to write")
+    parser.add_argument("--max-prefix", type=int, default=DEFAULT_MAX_PREFIX, help="Longest prefix stored, chars")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K, help="Completions kept per prefix")
+    parser.add_argument("--max-zero-ratio", type=float, default=DEFAULT_MAX_ZERO_RATIO,
+                        help="Drop completions whose zero-hit share is at least this")
+    parser.add_argument("--queries", help="Replay this query CSV keystroke by keystroke through the map")
+    parser.add_argument("--site", default="2056", help="Site id for --queries (the CSV has anonymized stores)")
+    args = parser.parse_args()
+
+    product_names = load_product_names(args.catalog)
+    started = time.perf_counter()
+    index = build_prefix_index(product_names)
+    entries, counts = build_entries(product_names, args.expansions, args.zero_backlog,
+                                    args.max_prefix, args.top_k, args.max_zero_ratio, index)
+    size = write_table(args.output, entries)
+    print(f"Wrote {counts['keys']} prefixes to {args.output} ({size / 1024:.1f} KB) in {time.perf_counter() - started:.2f}s: "
+          f"{counts['log_pairs']} log pairs, {counts['dropped_zero_hit']} dropped as zero-hit, "
+          f"{counts['dropped_unresolved']} not found in the catalog, {counts['catalog_phrases']} catalog phrases.")
+
+    if args.queries:
+        with Path(args.queries).open(newline="", encoding="utf-8") as f:
+            queries = [(row["query"], args.site) for row in csv.DictReader(f)]
+        report = replay(PrefixCompleter(PrefixTable(args.output), product_names, index), queries)
+        print(f"Keystrokes: {report['keystrokes']}, served from map {report['map_hit_ratio']:.1%} "
+              f"(map {report.get('map_mean_ms', 0.0):.4f} ms, index/fuzzy {report.get('index_mean_ms', 0.0):.4f} ms mean)")
+
+
+if __name__ == "__main__":
+    main()
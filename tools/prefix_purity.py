@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""Чистота префиксов каталога: распределение категорий и доминирующие бренды.
+
+Офлайн для каждого префикса (до --max-prefix символов) со всех границ токенов
+названия и ключевых слов с их раскладочными/брендовыми вариантами (как
+name_variants в ES) считается, сколько товаров каждой категории и бренда он
+находит.
+purity — доля самой частой категории. Таблица пишется в формат prefix_table.py
+(mmap, O(1)): "c\\t<префикс>" -> [(категория, товаров)], "b\\t<префикс>" ->
+[(бренд, товаров)] топ-TOP_BRANDS, "meta" -> max_prefix и число товаров.
+
+На запросе plausible_categories() берёт префикс нормализованного запроса (до
+max_prefix, при промахе — без хвостовых слов) и оставляет категории с долей не
+меньше MIN_SHARE: "молоко" не уходит в косметику из-за одного "молочка для
+тела". Если префикса в таблице нет (опечатка, совпадение только по вектору или
+описанию) или отсекать нечего — ограничения нет. Ограничение ставится
+фильтром до скоринга: terms по category в bool и в knn у ES, маска кандидатов
+у local_search.
+
+Таблица подключается на процесс (activate), а не через evaluate: так её видит
+prepare_query из любого модуля, включая процессы пула batch_search.
+
+python tools/prefix_purity.py data/catalog_products.xml --output .cache/prefix_purity.bin --queries data/prefix_queries.csv
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from catalog_reader import iter_products
+from main import token_suffixes
+from normalize import normalize_query, normalize_text
+from prefix_map import prefixes
+from prefix_table import Items, PrefixTable, write_table
+from translit import normalized_variants
+
+DEFAULT_OUTPUT = ".cache/prefix_purity.bin"
+DEFAULT_MAX_PREFIX = 10
+MIN_PREFIX = 2  # по одной букве категорию не угадать
+MIN_SHARE = 0.05  # категории с меньшей долей товаров префикса отсекаются
+TOP_BRANDS = 5
+META_KEY = "meta"
+
+
+class PrefixStats(NamedTuple):
+    categories: Items  # (категория, товаров) по убыванию
+    brands: Items  # топ брендов (бренд, товаров)
+    docs: int
+    purity: float  # доля самой частой категории
+
+
+def product_texts(name: str, keywords: str) -> List[str]:
+    """Нормализованные тексты, по которым префикс запроса находит товар.
+
+    Варианты строятся и для ключевых слов, не только для названия: лишняя
+    категория в таблице стоит одного фильтра, пропущенная — потерянной выдачи
+    ("санпел" должен видеть и воду с keywords sanpellegrino).
+    """
+    texts = [v for text in (name, keywords) for v in normalized_variants(normalize_text(text))]
+    return [text for text in dict.fromkeys(texts) if text]
+
+
+def product_prefixes(texts: List[str], max_prefix: int) -> set:
+    return {p for text in texts for suffix in token_suffixes(text) for p in prefixes(suffix, max_prefix)}
+
+
+def build_entries(catalog: Union[str, Path], max_prefix: int = DEFAULT_MAX_PREFIX,
+                  top_brands: int = TOP_BRANDS) -> Tuple[Dict[str, Items], Counter]:
+    """(ключ таблицы -> пары, счётчики сборки); одинаковые товары разбираются один раз."""
+    groups: Counter = Counter()
+    for product in iter_products(catalog):
+        if product.name:
+            groups[product.name, product.keywords, product.category, product.brand] += 1  # category как в индексе
+
+    categories: Dict[str, Counter] = defaultdict(Counter)
+    brands: Dict[str, Counter] = defaultdict(Counter)
+    for (name, keywords, category, brand), count in groups.items():
+        for prefix in product_prefixes(product_texts(name, keywords), max_prefix):
+            categories[prefix][category] += count
+            if brand:
+                brands[prefix][brand] += count
+
+    entries: Dict[str, Items] = {}
+    for prefix, counts in categories.items():
+        entries[f"c\t{prefix}"] = [(c, float(n)) for c, n in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))]
+        if brands[prefix]:
+            entries[f"b\t{prefix}"] = [(b, float(n)) for b, n in
+                                       sorted(brands[prefix].items(), key=lambda kv: (-kv[1], kv[0]))[:top_brands]]
+    docs = sum(groups.values())
+    entries[META_KEY] = [("max_prefix", float(max_prefix)), ("docs", float(docs))]
+    return entries, Counter(products=docs, groups=len(groups), prefixes=len(categories))
+
+
+class PurityTable:
+    """Таблица чистоты префиксов поверх PrefixTable."""
+
+    def __init__(self, path: Union[str, Path], min_share: float = MIN_SHARE):
+        self.table = PrefixTable(path)
+        meta = dict(self.table.get(META_KEY) or [])
+        if "max_prefix" not in meta:
+            raise ValueError(f"{path} is not a prefix purity table")
+        self.max_prefix = int(meta["max_prefix"])
+        self.docs = int(meta["docs"])
+        self.min_share = min_share
+
+    def lookup(self, norm_query: str) -> Tuple[str, Items]:
+        """Префикс запроса, который есть в таблице, и его категории.
+
+        Сначала запрос целиком (обрезанный до max_prefix), затем без хвостовых
+        слов: "маска для волос ker" -> "маска для"; отрезать середину слова
+        нельзя — "мас" говорит о запросе меньше, чем отсутствие ограничения.
+        """
+        candidates = [norm_query[:self.max_prefix].rstrip()]
+        candidates += [norm_query[:i] for i in range(len(candidates[0]) - 1, 0, -1) if norm_query[i] == " "]
+        for prefix in candidates:
+            if len(prefix) < MIN_PREFIX:
+                break
+            categories = self.table.get(f"c\t{prefix}")
+            if categories:
+                return prefix, categories
+        return "", []
+
+    def stats(self, norm_query: str) -> Optional[PrefixStats]:
+        prefix, categories = self.lookup(norm_query)
+        if not categories:
+            return None
+        docs = int(sum(n for _, n in categories))
+        return PrefixStats(categories, self.table.get(f"b\t{prefix}") or [], docs, categories[0][1] / docs)
+
+    def plausible_categories(self, norm_query: str) -> Optional[Tuple[str, ...]]:
+        """Категории, которыми стоит ограничить поиск, или None — ограничивать нечем."""
+        stats = self.stats(norm_query)
+        if stats is None:
+            return None
+        kept = tuple(c for c, n in stats.categories if n / stats.docs >= self.min_share)
+        return kept if len(kept) < len(stats.categories) or len(kept) == 1 else None
+
+
+_active: Optional[PurityTable] = None
+
+
+def activate(path: Optional[Union[str, Path]], min_share: float = MIN_SHARE) -> Optional[PurityTable]:
+    """Подключает таблицу для plausible_categories() в этом процессе; пустой path — отключает."""
+    global _active
+    _active = PurityTable(path, min_share) if path else None
+    return _active
+
+
+def plausible_categories(norm_query: str) -> Optional[Tuple[str, ...]]:
+    """Категории запроса по подключённой таблице; без таблицы — None."""
+    return _active.plausible_categories(norm_query) if _active is not None else None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build per-prefix category purity and dominant brand statistics")
+    parser.add_argument("catalog", nargs="?", default="data/catalog_products.xml", help="Catalog (XML, NDJSON or shards)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Binary table to write")
+    parser.add_argument("--max-prefix", type=int, default=DEFAULT_MAX_PREFIX, help="Longest prefix stored, chars")
+    parser.add_argument("--top-brands", type=int, default=TOP_BRANDS, help="Brands kept per prefix")
+    parser.add_argument("--min-share", type=float, default=MIN_SHARE, help="Category share kept at query time (for --queries)")
+    parser.add_argument("--queries", help="Show purity and the category restriction for this query CSV")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    entries, counts = build_entries(args.catalog, args.max_prefix, args.top_brands)
+    size = write_table(args.output, entries)
+    print(f"Wrote {counts['prefixes']} prefixes for {counts['products']} products ({counts['groups']} distinct) "
+          f"to {args.output} ({size / 1024:.1f} KB) in {time.perf_counter() - started:.2f}s")
+
+    if args.queries:
+        table = PurityTable(args.output, args.min_share)
+        with Path(args.queries).open(newline="", encoding="utf-8") as f:
+            queries = [row["query"] for row in csv.DictReader(f)]
+        restricted = 0
+        pruned = 0.0
+        for query in queries:
+            norm = normalize_query(query)
+            stats = table.stats(norm)
+            allowed = table.plausible_categories(norm)
+            if stats is None:
+                print(f"  {query!r:<28} no prefix stats")
+                continue
+            if allowed is not None:
+                restricted += 1
+                pruned += 1 - sum(n for c, n in stats.categories if c in allowed) / stats.docs
+            brands = ", ".join(b for b, _ in stats.brands[:3])
+            print(f"  {query!r:<28} purity {stats.purity:.2f} | {len(stats.categories)} categories -> "
+                  f"{len(allowed) if allowed else 'all'} | {stats.categories[0][0]} | {brands}")
+        print(f"Restricted {restricted}/{len(queries)} queries; "
+              f"mean share of prefix matches pruned: {pruned / max(1, restricted):.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Компактная таблица ключ -> список (строка, вес) в одном бинарном файле.
+
+Формат рассчитан на memory map и поиск за O(1) без загрузки таблицы в память:
+- заголовок: magic, число слотов (степень двойки), число ключей;
+- слоты открытой адресации (линейное пробирование): 64-битный хеш ключа
+  (text_key из text_hash) и смещение записи, 0 — пустой слот;
+- записи: ключ в UTF-8 (для проверки коллизий хеша) и до 65535 пар
+  (строка, float32-вес) в порядке убывания веса.
+
+Файл пишется целиком во временный и подменяется через os.replace, поэтому
+процессы, уже открывшие старую таблицу, дочитывают её без ошибок.
+"""
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from text_hash import text_key
+
+MAGIC = b"PFXTBL01"
+_HEADER = struct.Struct("<8sII")
+_SLOT = struct.Struct("<QQ")
+_U16 = struct.Struct("<H")
+_ITEM = struct.Struct("<Hf")  # длина строки + вес; сама строка идёт следом
+
+Items = List[Tuple[str, float]]
+
+
+def _slot_count(keys: int) -> int:
+    """Степень двойки с заполнением не больше половины: пробы остаются короткими."""
+    slots = 8
+    while slots < 2 * keys:
+        slots *= 2
+    return slots
+
+
+def _encode_record(key: str, items: Sequence[Tuple[str, float]]) -> bytes:
+    raw_key = key.encode("utf-8")
+    parts = [_U16.pack(len(raw_key)), raw_key, _U16.pack(len(items))]
+    for text, weight in items:
+        raw = text.encode("utf-8")
+        parts.append(_ITEM.pack(len(raw), weight))
+        parts.append(raw)
+    return b"".join(parts)
+
+
+def write_table(path: Union[str, Path], entries: Dict[str, Sequence[Tuple[str, float]]]) -> int:
+    """Пишет entries в path атомарно; возвращает размер файла в байтах."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    n_slots = _slot_count(len(entries))
+    mask = n_slots - 1
+    slots = [(0, 0)] * n_slots
+    records: List[bytes] = []
+    offset = _HEADER.size + n_slots * _SLOT.size
+    for key in sorted(entries):  # один и тот же вход — побайтно один и тот же файл
+        h = text_key(key) or 1  # 0 зарезервирован под пустой слот
+        i = h & mask
+        while slots[i][1]:
+            i = (i + 1) & mask
+        record = _encode_record(key, entries[key])
+        slots[i] = (h, offset)
+        records.append(record)
+        offset += len(record)
+
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        f.write(_HEADER.pack(MAGIC, n_slots, len(entries)))
+        f.write(b"".join(_SLOT.pack(h, off) for h, off in slots))
+        f.writelines(records)
+    os.replace(tmp, path)
+    return offset
+
+
+class PrefixTable:
+    """Таблица, открытая через mmap; get() — хеш, несколько проб и разбор одной записи."""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        with self.path.open("rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.n_slots, self.n_keys = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a prefix table")
+        self._mask = self.n_slots - 1
+
+    def __len__(self) -> int:
+        return self.n_keys
+
+    def __contains__(self, key: str) -> bool:
+        return self._find(key) is not None
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def _find(self, key: str) -> Optional[int]:
+        """Смещение первой пары записи key или None."""
+        h = text_key(key) or 1
+        raw_key = key.encode("utf-8")
+        i = h & self._mask
+        while True:
+            slot_hash, offset = _SLOT.unpack_from(self._mm, _HEADER.size + i * _SLOT.size)
+            if not offset:
+                return None
+            if slot_hash == h:
+                (key_len,) = _U16.unpack_from(self._mm, offset)
+                start = offset + _U16.size
+                if self._mm[start:start + key_len] == raw_key:
+                    return start + key_len
+            i = (i + 1) & self._mask
+
+    def _read_items(self, offset: int) -> Items:
+        (count,) = _U16.unpack_from(self._mm, offset)
+        offset += _U16.size
+        items: Items = []
+        for _ in range(count):
+            length, weight = _ITEM.unpack_from(self._mm, offset)
+            offset += _ITEM.size
+            items.append((self._mm[offset:offset + length].decode("utf-8"), weight))
+            offset += length
+        return items
+
+    def get(self, key: str) -> Optional[Items]:
+        offset = self._find(key)
+        return None if offset is None else self._read_items(offset)
+
+    def items(self) -> Iterator[Tuple[str, Items]]:
+        """Все (ключ, пары) в порядке слотов — для офлайн-отчётов."""
+        for i in range(self.n_slots):
+            _, offset = _SLOT.unpack_from(self._mm, _HEADER.size + i * _SLOT.size)
+            if offset:
+                (key_len,) = _U16.unpack_from(self._mm, offset)
+                start = offset + _U16.size
+                key = self._mm[start:start + key_len].decode("utf-8")
+                yield key, self._read_items(start + key_len)
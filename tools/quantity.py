@@ -0,0 +1,120 @@
+"""Числовые атрибуты товаров в базовых единицах и отсортированный индекс по ним.
+
+parse_weight() берёт из "500г" и "5кг" только число, поэтому 500 > 5, а
+"5kg" и "10l" латиницей запрос не распознаёт вовсе. Здесь количество
+приводится к измерению и базовой единице: масса — граммы, объём — миллилитры,
+штуки — штуки. У товара единица берётся из атрибута unit, который пишет
+generate_catalog.py, у запроса — из суффикса числа (кириллица или латиница).
+
+NumericIndex хранит для каждой пары (категория, измерение) отсортированный
+массив количеств: диапазон — два searchsorted, ближайшие размеры — окно вокруг
+точки вставки. Так кандидаты отсекаются до текстового скоринга.
+"""
+from __future__ import annotations
+
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+MASS, VOLUME, COUNT = "mass", "volume", "count"
+
+# единица -> (измерение, множитель до базовой единицы)
+UNITS: Dict[str, Tuple[str, float]] = {
+    "mg": (MASS, 0.001), "мг": (MASS, 0.001),
+    "g": (MASS, 1.0), "gr": (MASS, 1.0), "г": (MASS, 1.0), "гр": (MASS, 1.0),
+    "kg": (MASS, 1000.0), "кг": (MASS, 1000.0),
+    "ml": (VOLUME, 1.0), "мл": (VOLUME, 1.0),
+    "l": (VOLUME, 1000.0), "л": (VOLUME, 1000.0),
+    "pcs": (COUNT, 1.0), "шт": (COUNT, 1.0),
+    "caps": (COUNT, 1.0), "tabs": (COUNT, 1.0), "sachets": (COUNT, 1.0), "packs": (COUNT, 1.0),
+}
+
+# Длинные единицы раньше коротких: "кг" не должен разобраться как "к" + "г"
+_QUERY_UNITS = sorted((u for u in UNITS if u not in ("caps", "tabs", "sachets", "packs")), key=len, reverse=True)
+_QUANTITY_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*(" + "|".join(_QUERY_UNITS) + r")(?!\w)")
+
+
+class Quantity(NamedTuple):
+    dimension: str
+    amount: float  # в базовой единице измерения: г, мл, шт
+
+
+def to_base(value: Optional[float], unit: str) -> Optional[Quantity]:
+    """Количество value в единице unit -> Quantity; None, если единица неизвестна."""
+    if value is None:
+        return None
+    known = UNITS.get(unit.strip().lower())
+    if known is None:
+        return None
+    dimension, factor = known
+    return Quantity(dimension, round(value * factor, 6))
+
+
+def parse_query_quantity(query: str) -> Optional[Quantity]:
+    """Первое "число + единица" в запросе: '10л', '500 г', '5kg', '1,5l'."""
+    match = _QUANTITY_RE.search(query.lower())
+    if not match:
+        return None
+    return to_base(float(match.group(1).replace(",", ".")), match.group(2))
+
+
+class NumericIndex:
+    """Отсортированные количества по (категория, измерение) с номерами документов."""
+
+    def __init__(self, quantities: Iterable[Tuple[str, Optional[Quantity]]]):
+        """quantities — (категория, количество) в порядке номеров документов."""
+        groups: Dict[Tuple[str, str], List[Tuple[float, int]]] = defaultdict(list)
+        for doc, (category, quantity) in enumerate(quantities):
+            if quantity is not None:
+                groups[category, quantity.dimension].append((quantity.amount, doc))
+        self.amounts: Dict[Tuple[str, str], np.ndarray] = {}
+        self.docs: Dict[Tuple[str, str], np.ndarray] = {}
+        for key, pairs in groups.items():
+            pairs.sort()
+            self.amounts[key] = np.asarray([a for a, _ in pairs], dtype=np.float64)
+            self.docs[key] = np.asarray([d for _, d in pairs], dtype=np.int64)
+
+    def _keys(self, dimension: str, categories: Optional[Iterable[str]]) -> List[Tuple[str, str]]:
+        if categories is None:
+            return [key for key in self.amounts if key[1] == dimension]
+        return [(category, dimension) for category in categories if (category, dimension) in self.amounts]
+
+    def range(self, dimension: str, low: float = -np.inf, high: float = np.inf,
+              categories: Optional[Iterable[str]] = None) -> np.ndarray:
+        """Документы с low <= количество <= high."""
+        found = []
+        for key in self._keys(dimension, categories):
+            amounts = self.amounts[key]
+            start = np.searchsorted(amounts, low, side="left")
+            end = np.searchsorted(amounts, high, side="right")
+            found.append(self.docs[key][start:end])
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    def _nearest(self, key: Tuple[str, str], amount: float, k: int) -> np.ndarray:
+        amounts = self.amounts[key]
+        pos = int(np.searchsorted(amounts, amount))
+        window = np.arange(max(0, pos - k), min(len(amounts), pos + k))
+        # Близость по отношению размеров: 5кг к 10кг так же близко, как 500г к 1кг
+        distance = np.abs(np.log(np.maximum(amounts[window], 1e-9) / max(amount, 1e-9)))
+        return self.docs[key][window[np.argsort(distance, kind="stable")[:k]]]
+
+    def nearest(self, dimension: str, amount: float, k: int = 5,
+                categories: Optional[Iterable[str]] = None) -> np.ndarray:
+        """До k документов каждой категории с количеством, ближайшим к amount (по отношению размеров)."""
+        found = [self._nearest(key, amount, k) for key in self._keys(dimension, categories)]
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    def at_least(self, dimension: str, amount: float, k: int = 5,
+                 categories: Optional[Iterable[str]] = None) -> np.ndarray:
+        """Документы с количеством >= amount; в категориях, где таких нет, — k ближайших по размеру.
+
+        "молоко 5л" при максимуме 1.5л в категории даёт самые крупные упаковки
+        молока, а не пустую выдачу.
+        """
+        found = []
+        for key in self._keys(dimension, categories):
+            start = int(np.searchsorted(self.amounts[key], amount, side="left"))
+            found.append(self.docs[key][start:] if start < len(self.amounts[key]) else self._nearest(key, amount, k))
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
@@ -0,0 +1,261 @@
+"""Структурный лог поисковых запросов и метрики в формате Prometheus.
+
+Задание требует логировать исходный запрос, применённую нормализацию и итоговый
+поиск; в SORT-анализе у сайта 221 пустой originalSearchTerm, и по нему нельзя
+восстановить ничего. Здесь каждая запись — JSON-строка:
+- ts, site, backend, original (как пришёл, даже пустой), normalized, variants,
+  numeric_filter, categories (фильтр prefix_purity), rewritten (нормализация
+  изменила запрос);
+- body_hash — blake2b тела запроса к ES без query_vector (одинаковые запросы
+  дают одинаковый хеш, вектор определяется текстом);
+- timings_ms по стадиям, hits, zero_hit, top_ids.
+
+Запись не блокирует поиск: в потоке запроса только решение сэмплирования и
+put_nowait в ограниченную очередь (при переполнении запись отбрасывается и
+считается в query_log_dropped_total). Фоновый поток собирает записи, пишет их
+буферизованно и ротирует файл по размеру: path, path.1, ... path.N.
+Нулевые выдачи пишутся всегда, независимо от доли сэмплирования.
+
+MetricsRegistry — счётчики и гистограммы с метками, render() отдаёт текстовый
+формат Prometheus (GET /metrics в search_service.py, metrics.prom у evaluate.py).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+DEFAULT_LOG_PATH = "reports/logs/queries.ndjson"
+DEFAULT_SAMPLE_RATE = 1.0
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_BACKUPS = 5
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_FLUSH_INTERVAL = 1.0
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class MetricsRegistry:
+    """Потокобезопасные счётчики и гистограммы; имена и help задаются при первом обращении."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}  # имя -> (тип, help)
+        self._counters: Dict[str, Dict[Labels, float]] = defaultdict(lambda: defaultdict(float))
+        self._histograms: Dict[str, Dict[Labels, List[float]]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+
+    def inc(self, name: str, help_text: str = "", value: float = 1.0, **labels: str) -> None:
+        with self._lock:
+            self._help.setdefault(name, ("counter", help_text))
+            self._counters[name][_labels(labels)] += value
+
+    def observe(self, name: str, value: float, help_text: str = "",
+                buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels: str) -> None:
+        """Наблюдение в гистограмму: счётчики по бакетам (не накопленные), затем sum и count."""
+        with self._lock:
+            self._help.setdefault(name, ("histogram", help_text))
+            bounds = self._buckets.setdefault(name, buckets)
+            series = self._histograms.setdefault(name, {})
+            row = series.setdefault(_labels(labels), [0.0] * (len(bounds) + 3))
+            row[bisect_left(bounds, value)] += 1  # последний бакет — +Inf
+            row[-2] += value
+            row[-1] += 1
+
+    def value(self, name: str, **labels: str) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_labels(labels), 0.0)
+
+    def render(self) -> str:
+        """Текстовый формат экспозиции Prometheus 0.0.4."""
+        lines: List[str] = []
+        with self._lock:
+            for name, (kind, help_text) in sorted(self._help.items()):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for labels, value in sorted(self._counters[name].items()):
+                        lines.append(f"{name}{_format_labels(labels)} {value:g}")
+                    continue
+                bounds = self._buckets[name]
+                for labels, row in sorted(self._histograms[name].items()):
+                    cumulative = 0.0
+                    for bound, count in zip(list(bounds) + [float("inf")], row):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f"{name}_bucket{_format_labels(labels, [('le', le)])} {cumulative:g}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {row[-2]:.6f}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {row[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+
+def record_search_metrics(metrics: MetricsRegistry, original_query: str, site: str, zero_hit: bool,
+                          timings: Dict[str, int], backend: str = "es") -> None:
+    """Счётчики запросов, нулевых выдач, пустых запросов и гистограмма стадий."""
+    metrics.inc("search_requests_total", "Search requests", backend=backend, site=site)
+    if zero_hit:
+        metrics.inc("search_zero_hits_total", "Searches that returned no hits", backend=backend, site=site)
+    if not original_query.strip():
+        metrics.inc("search_empty_queries_total", "Searches with an empty original query", site=site)
+    for stage, ns in timings.items():
+        metrics.observe("search_stage_seconds", ns / 1e9, "Search latency by stage", stage=stage)
+
+
+def body_hash(body: Optional[dict]) -> str:
+    """Хеш тела запроса без query_vector."""
+    if not body:
+        return ""
+    if "knn" in body:
+        body = {**body, "knn": {k: v for k, v in body["knn"].items() if k != "query_vector"}}
+    payload = json.dumps(body, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class QueryLogger:
+    """Сэмплированный неблокирующий NDJSON-лог с фоновым писателем и ротацией по размеру."""
+
+    def __init__(
+        self,
+        path: Union[str, Path] = DEFAULT_LOG_PATH,
+        sample_rate: float = DEFAULT_SAMPLE_RATE,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        backups: int = DEFAULT_BACKUPS,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        metrics: Optional[MetricsRegistry] = None,
+        seed: Optional[int] = None,
+    ):
+        self.path = Path(path)
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self._rng = random.Random(seed)
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open("a", encoding="utf-8", buffering=1024 * 1024)
+        self._size = self._file.tell()
+        self._thread = threading.Thread(target=self._run, name="query-log", daemon=True)
+        self._thread.start()
+
+    def log_search(
+        self,
+        original_query: str,
+        site: str,
+        hits: List[dict],
+        es_body: Optional[dict],
+        timings: Optional[Dict[str, int]] = None,
+        backend: str = "es",
+        prepared=None,
+    ) -> None:
+        """Вызывается из потока запроса: метрики, сэмплирование и постановка в очередь.
+
+        prepared — evaluate.PreparedQuery, с которым шёл поиск: в лог попадает именно он, а не
+        пересчёт в фоновом потоке (таблица prefix_purity или кеши могли смениться).
+        """
+        zero_hit = not hits
+        stages = dict(timings or {})
+        record_search_metrics(self.metrics, original_query, site, zero_hit, stages, backend)
+
+        if not zero_hit and self._rng.random() >= self.sample_rate:
+            return
+        if prepared is None:  # пустой запрос или попадание в кеш результатов: готовим здесь же
+            from evaluate import prepare_query
+            prepared = prepare_query(original_query)
+        item = (time.time(), original_query, site, backend, zero_hit, len(hits),
+                [h.get("_id") for h in hits[:3]], es_body, stages, prepared)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.metrics.inc("query_log_dropped_total", "Query log records dropped on a full queue")
+
+    @staticmethod
+    def build_record(item: tuple) -> dict:
+        """Полная запись из элемента очереди; считается в фоновом потоке."""
+        ts, original_query, site, backend, zero_hit, hit_count, top_ids, es_body, stages, prepared = item
+        return {
+            "ts": round(ts, 3),
+            "site": site,
+            "backend": backend,
+            "original": original_query,
+            "normalized": prepared.norm_query,
+            "rewritten": prepared.norm_query != " ".join(original_query.lower().split()),
+            "variants": prepared.variants,
+            "numeric_filter": prepared.numeric_filter,
+            "categories": prepared.categories,
+            "body_hash": body_hash(es_body),
+            "timings_ms": {stage: round(ns / 1e6, 3) for stage, ns in stages.items()},
+            "hits": hit_count,
+            "zero_hit": zero_hit,
+            "top_ids": top_ids,
+        }
+
+    def _rotate(self) -> None:
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            older = self.path.with_name(f"{self.path.name}.{i}")
+            if older.exists():
+                os.replace(older, self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.backups > 0:
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+        self._file = self.path.open("a", encoding="utf-8", buffering=1024 * 1024)
+        self._size = 0
+
+    def _write(self, item: tuple) -> None:
+        try:
+            line = json.dumps(self.build_record(item), ensure_ascii=False) + "\n"
+        except Exception:  # битая запись не должна останавливать писателя
+            self.metrics.inc("query_log_errors_total", "Query log records that failed to serialize")
+            return
+        size = len(line.encode("utf-8"))
+        if self._size and self._size + size > self.max_bytes:
+            self._rotate()
+        self._file.write(line)
+        self._size += size
+        self.metrics.inc("query_log_written_total", "Query log records written")
+
+    def _run(self) -> None:
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                self._write(item)
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self._file.flush()
+                last_flush = time.monotonic()
+        self._file.flush()
+        self._file.close()
+
+    def close(self) -> None:
+        """Дописывает очередь и закрывает файл."""
+        self._queue.put(None)
+        self._thread.join()
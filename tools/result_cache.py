@@ -0,0 +1,178 @@
+"""Кеш результатов горячих запросов перед search_es.
+
+Трафик сильно перекошен (PREFIX_SEARCH_STATS_20251027.json: на сайте 2056
+'моро', 'моло', 'энер' — десятки тысяч запросов в неделю), поэтому готовый
+ответ по ключу (нормализованный запрос, числовой фильтр) отдаётся без
+обращения к Elasticsearch и модели.
+
+- Размер ограничен: LRU-вытеснение с TinyLFU-допуском — новый ключ вытесняет
+  самый старый только если встречался не реже его (частоты в Counter с
+  периодическим делением пополам).
+- У записи есть TTL.
+- Кеш целиком сбрасывается, когда меняется версия каталога (цель алиаса и
+  счётчик записей в индекс): после swap_alias или --delta старых ответов нет.
+  Ответ, который считался, пока кеш сбрасывали, не кладётся: он по старому
+  каталогу.
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple, Union
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_TTL = 300.0
+DEFAULT_VERSION_CHECK_INTERVAL = 5.0
+DEFAULT_EXPANSIONS = "data/PREFIX_EXPANSIONS_20251027.json"
+
+
+class _Entry(NamedTuple):
+    value: Any
+    expires: float
+    cost_ms: float  # сколько стоило посчитать ответ; столько экономит каждый hit
+
+
+class ResultCache:
+    """Ограниченный кеш с TTL, TinyLFU-допуском и сбросом по версии каталога."""
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl: float = DEFAULT_TTL,
+        version: Optional[Callable[[], Hashable]] = None,
+        version_check_interval: float = DEFAULT_VERSION_CHECK_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = version
+        self.version_check_interval = version_check_interval
+        self.clock = clock
+        self._lock = threading.RLock()  # get/put вызываются из потоков load_runner
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._freq: Counter = Counter()
+        self._freq_samples = 0
+        self._epoch = 0  # растёт при каждом clear(); put() со старой эпохой не пишет
+        self._current_version: Hashable = version() if version else None
+        self._version_checked = clock()
+        self.hits = self.misses = self.expired = self.rejected = self.stale = self.invalidations = 0
+        self.saved_ms = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _check_version(self) -> None:
+        """Раз в version_check_interval сверяет версию каталога; запрос к ES идёт вне блокировки.
+
+        Интервал занимается под блокировкой, поэтому версию запрашивает один
+        поток, остальные не ждут его и работают со старыми записями.
+        """
+        if self.version is None:
+            return
+        with self._lock:
+            now = self.clock()
+            if now - self._version_checked < self.version_check_interval:
+                return
+            self._version_checked = now
+        version = self.version()
+        with self._lock:
+            if version != self._current_version:
+                self._current_version = version
+                self.clear()
+                self.invalidations += 1
+
+    def _touch(self, key: Hashable) -> None:
+        self._freq[key] += 1
+        self._freq_samples += 1
+        if self._freq_samples >= 10 * self.max_entries:
+            # Старение: прошлая популярность постепенно забывается
+            self._freq = Counter({k: c // 2 for k, c in self._freq.items() if c > 1})
+            self._freq_samples //= 2
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._epoch += 1
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        self._check_version()
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key: Hashable) -> Optional[Any]:
+        self._touch(key)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires <= self.clock():
+            del self._entries[key]
+            self.expired += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.saved_ms += entry.cost_ms
+        return entry.value
+
+    def put(self, key: Hashable, value: Any, cost_ms: float = 0.0, epoch: Optional[int] = None) -> bool:
+        """Кладёт ответ; False, если TinyLFU не допустил ключ в заполненный кеш.
+
+        epoch — значение self._epoch до начала вычисления: если кеш с тех пор
+        сбросили (новая версия каталога), ответ устарел и не кладётся.
+        """
+        with self._lock:
+            if epoch is not None and epoch != self._epoch:
+                self.stale += 1
+                return False
+            return self._put(key, value, cost_ms)
+
+    def _put(self, key: Hashable, value: Any, cost_ms: float) -> bool:
+        if key not in self._entries and len(self._entries) >= self.max_entries:
+            victim = next(iter(self._entries))
+            if self._freq[key] < self._freq[victim]:
+                self.rejected += 1
+                return False
+            del self._entries[victim]
+        self._entries[key] = _Entry(value, self.clock() + self.ttl, cost_ms)
+        self._entries.move_to_end(key)
+        return True
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Tuple[Any, bool]:
+        """(ответ, был ли он из кеша); промах считается через compute() и запоминается."""
+        value = self.get(key)
+        if value is not None:
+            return value, True
+        epoch = self._epoch
+        started = time.perf_counter()
+        value = compute()
+        self.put(key, value, cost_ms=(time.perf_counter() - started) * 1000, epoch=epoch)
+        return value, False
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "rejected": self.rejected,
+            "stale": self.stale,
+            "invalidations": self.invalidations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "latency_saved_ms": round(self.saved_ms, 1),
+        }
+
+
+def prewarm_queries(path: Union[str, Path] = DEFAULT_EXPANSIONS, top_n: int = 20) -> List[Tuple[str, str]]:
+    """(запрос, сайт) для top_n самых частых исходных запросов каждого сайта из PREFIX_EXPANSIONS."""
+    with Path(path).open(encoding="utf-8") as f:
+        expansions: Dict[str, List[dict]] = json.load(f)["expansions"]
+    pairs: List[Tuple[str, str]] = []
+    for site, rows in expansions.items():
+        top = sorted(rows, key=lambda r: -int(r.get("freq") or 0))[:top_n]
+        pairs.extend((row["orig"], site) for row in top)
+    return pairs
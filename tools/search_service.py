@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""Long-running async HTTP search service on top of the evaluate.py hybrid query.
+
+GET /search?q=...&site=...&size=10 — тот же запрос, что search_es(): нормализация
+и варианты транслита, bool_prefix + kNN в Elasticsearch, startswith-rerank.
+site — только метка для лога и метрик по сайтам: каталог общий, выдача от него
+не зависит.
+
+- Один AsyncElasticsearch на процесс с пулом keep-alive соединений.
+- Одна загруженная модель; параллельные запросы на кодирование собираются
+  EncodeBatcher в один model.encode (один forward pass на батч), пока
+  предыдущий батч считается в отдельном потоке.
+- GET /livez — процесс жив; GET /readyz — модель загружена и алиас есть в ES.
+- GET /metrics — счётчики и гистограммы стадий процесса в формате Prometheus;
+  --query-log пишет сэмплированный NDJSON-лог запросов (query_log.py), при
+  --processes N у каждого процесса свой файл с pid в имени.
+- --processes N запускает N процессов на одном порту (SO_REUSEPORT), чтобы
+  занять все ядра CPU-контейнера.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from clients import ALIAS, MODEL_NAME, make_async_es
+from evaluate import PreparedQuery, build_es_query, prepare_query, query_encoder, rerank
+import prefix_purity
+from query_log import MetricsRegistry, QueryLogger, record_search_metrics
+
+DEFAULT_PORT = 8080
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_WAIT_MS = 2.0
+DEFAULT_ES_CONNECTIONS = 32
+MAX_SIZE = 50
+
+
+class EncodeBatcher:
+    """Собирает одиночные encode() от конкурентных запросов в батчи для одного вызова модели."""
+
+    def __init__(self, encoder, max_batch: int = DEFAULT_MAX_BATCH, max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+        self.encoder = encoder
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: asyncio.Queue[Tuple[str, asyncio.Future]] = asyncio.Queue()
+        # Один поток: следующий батч копится, пока модель считает текущий
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="encode")
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = False
+        self.batches = self.texts = self.max_seen = 0
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливает цикл батчей; ждущие в очереди и в текущем батче получают CancelledError."""
+        self._stopped = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            future.cancel()
+        self._executor.shutdown(wait=False)
+
+    async def encode(self, text: str) -> List[float]:
+        if self._stopped:
+            raise RuntimeError("encode batcher is stopped")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[str, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        try:
+            while len(batch) < self.max_batch:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.CancelledError:  # stop() посреди сборки: уже вынутые из очереди не должны зависнуть
+            for _, future in batch:
+                future.cancel()
+            raise
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                vectors = await loop.run_in_executor(self._executor, self.encoder.encode, texts)
+            except asyncio.CancelledError:
+                for _, future in batch:
+                    future.cancel()
+                raise
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            by_text = {text: vector.tolist() for text, vector in zip(texts, vectors)}
+            for text, future in batch:
+                if not future.done():  # клиент мог отключиться
+                    future.set_result(by_text[text])
+            self.batches += 1
+            self.texts += len(batch)
+            self.max_seen = max(self.max_seen, len(batch))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_seen,
+            "queued": self._queue.qsize(),
+        }
+
+
+class ServiceState:
+    """Изменяемое состояние процесса; aiohttp не даёт менять ключи приложения после старта."""
+
+    def __init__(self, max_batch: int, max_wait_ms: float, es_connections: int,
+                 query_log: Optional[QueryLogger] = None):
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.es_connections = es_connections
+        self.started = time.monotonic()
+        self.ready = False
+        self.requests = 0
+        self.es = None
+        self.batcher: Optional[EncodeBatcher] = None
+        self.loader: Optional[asyncio.Task] = None
+        self.query_log = query_log
+        self.metrics = query_log.metrics if query_log is not None else MetricsRegistry()
+
+    def record(self, query: str, site: str, hits: List[dict], body: Optional[dict], timings: Dict[str, int],
+               prepared: Optional[PreparedQuery] = None) -> None:
+        if self.query_log is not None:
+            self.query_log.log_search(query, site, hits, body, timings, prepared=prepared)
+        else:
+            record_search_metrics(self.metrics, query, site, not hits, timings)
+
+
+def _ms(ns: int) -> float:
+    return round(ns / 1e6, 3)
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False)
+
+
+async def search(request: web.Request) -> web.Response:
+    query = request.query.get("q", "")
+    site = request.query.get("site", "")
+    state: ServiceState = request.app["state"]
+    if not query.strip():
+        state.record(query, site, [], None, {})  # пустой originalSearchTerm тоже попадает в лог
+        raise web.HTTPBadRequest(text="missing q")
+    if not state.ready:
+        raise web.HTTPServiceUnavailable(text="model is still loading")
+    try:
+        size = min(int(request.query.get("size", "10")), MAX_SIZE)
+    except ValueError:
+        raise web.HTTPBadRequest(text="size must be an integer")
+
+    t0 = time.perf_counter_ns()
+    prepared = prepare_query(query)
+    t1 = time.perf_counter_ns()
+    query_vector = await state.batcher.encode(prepared.norm_query)
+    t2 = time.perf_counter_ns()
+    body = build_es_query(prepared, query_vector, size)
+    res = await state.es.search(index=ALIAS, body=body)
+    t3 = time.perf_counter_ns()
+    hits = rerank(res["hits"]["hits"], prepared.norm_query)[:size]
+    t4 = time.perf_counter_ns()
+
+    state.requests += 1
+    state.record(query, site, hits, body, {"normalize": t1 - t0, "encode": t2 - t1, "es": t3 - t2, "rerank": t4 - t3},
+                 prepared)
+    return web.json_response({
+        "query": query,
+        "results": [{"id": hit["_id"], "score": round(hit["_score"], 4), **hit["_source"]} for hit in hits],
+        "timings_ms": {"normalize": _ms(t1 - t0), "encode": _ms(t2 - t1), "es": _ms(t3 - t2),
+                       "rerank": _ms(t4 - t3), "total": _ms(t4 - t0)},
+    }, dumps=_dumps)
+
+
+async def livez(request: web.Request) -> web.Response:
+    return web.json_response({"status": "ok"})
+
+
+async def readyz(request: web.Request) -> web.Response:
+    state: ServiceState = request.app["state"]
+    checks = {"model": state.ready, "index": False}
+    try:
+        checks["index"] = bool(await state.es.indices.exists_alias(name=ALIAS))
+    except Exception:
+        pass
+    status = 200 if all(checks.values()) else 503
+    return web.json_response({"ready": status == 200, "checks": checks}, status=status)
+
+
+async def stats(request: web.Request) -> web.Response:
+    state: ServiceState = request.app["state"]
+    return web.json_response({
+        "model": MODEL_NAME,
+        "requests": state.requests,
+        "uptime_s": round(time.monotonic() - state.started, 1),
+        "encode_batches": state.batcher.stats() if state.batcher else {},
+        "embedding_cache": query_encoder().stats() if state.ready else {},
+    })
+
+
+async def metrics(request: web.Request) -> web.Response:
+    state: ServiceState = request.app["state"]
+    return web.Response(text=state.metrics.render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Prometheus-Format": "0.0.4"})
+
+
+async def _load_model(state: ServiceState) -> None:
+    # Загрузка torch и модели занимает секунды: /livez уже отвечает, /readyz ждёт
+    encoder = await asyncio.get_running_loop().run_in_executor(None, query_encoder)
+    state.batcher = EncodeBatcher(encoder, state.max_batch, state.max_wait_ms)
+    state.batcher.start()
+    state.ready = True
+
+
+async def on_startup(app: web.Application) -> None:
+    state: ServiceState = app["state"]
+    state.es = make_async_es(state.es_connections)
+    state.loader = asyncio.create_task(_load_model(state))
+
+
+async def on_cleanup(app: web.Application) -> None:
+    state: ServiceState = app["state"]
+    state.loader.cancel()
+    if state.batcher:
+        await state.batcher.stop()
+        query_encoder().flush()
+    await state.es.close()
+    if state.query_log is not None:
+        state.query_log.close()
+
+
+def create_app(max_batch: int = DEFAULT_MAX_BATCH, max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+               es_connections: int = DEFAULT_ES_CONNECTIONS, query_log: Optional[QueryLogger] = None) -> web.Application:
+    app = web.Application()
+    app["state"] = ServiceState(max_batch, max_wait_ms, es_connections, query_log)
+    app.add_routes([
+        web.get("/search", search),
+        web.get("/livez", livez),
+        web.get("/readyz", readyz),
+        web.get("/stats", stats),
+        web.get("/metrics", metrics),
+    ])
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def serve(args: argparse.Namespace) -> None:
+    prefix_purity.activate(args.purity_table)
+    query_log = None
+    if args.query_log:
+        path = args.query_log if args.processes == 1 else f"{args.query_log}.{os.getpid()}"
+        query_log = QueryLogger(path, sample_rate=args.log_sample)
+    app = create_app(args.max_batch, args.max_wait_ms, args.es_connections, query_log)
+    web.run_app(app, host=args.host, port=args.port, reuse_port=args.processes > 1, access_log=None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve hybrid prefix search over HTTP")
+    parser.add_argument("--host", default="0.0.0.0", help="Bind address")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Bind port")
+    parser.add_argument("--processes", type=int, default=1, help="Server processes sharing the port (SO_REUSEPORT)")
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH, help="Max queries per model.encode call")
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS, help="How long a batch waits to fill up")
+    parser.add_argument("--es-connections", type=int, default=DEFAULT_ES_CONNECTIONS, help="Keep-alive connections to ES per process")
+    parser.add_argument("--query-log", default="", help="Write a sampled NDJSON query log to this path")
+    parser.add_argument("--log-sample", type=float, default=1.0, help="Share of non-zero-hit queries written to --query-log")
+    parser.add_argument("--purity-table", default="", help="Restrict retrieval to plausible categories (prefix_purity.py table)")
+    args = parser.parse_args()
+
+    workers = [multiprocessing.Process(target=serve, args=(args,), daemon=True) for _ in range(args.processes - 1)]
+    for worker in workers:
+        worker.start()
+    serve(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Инкрементальный префиксный поиск по нажатиям клавиш.
+
+Мобильный трафик печатает "м" -> "ма" -> "мас" -> "масло сл", и каждый шаг
+раньше заново проходил по всему каталогу. Сессия помнит цепочку префиксов и их
+кандидатов: если новый запрос продолжает предыдущий, точные совпадения только
+сужаются (ключ, начинающийся с "мас", начинается и с "ма"), поэтому достаточно
+отфильтровать предыдущий набор. Если точных совпадений не было, их нет и у
+продолжения; fuzzy-набор сужается только от fuzzy-набора прошлого нажатия с теми
+же бюджетами правок (расстояние до более длинного префикса не меньше). После
+точного нажатия fuzzy ищется по всему индексу: его набор не подмножество точного.
+Backspace снимает префиксы со стека и отдаёт уже посчитанный результат.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import time
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Tuple
+
+from main import build_prefix_index, fuzzy_prefix_ids, load_product_names, prefix_search, query_keys, rank_fuzzy
+from prefix_index import PrefixIndex, max_edits_for
+
+
+class _Step(NamedTuple):
+    """Один префикс в стеке сессии."""
+    keys: List[str]  # ключи запроса из query_keys()
+    ids: List[int]  # кандидаты: точные совпадения или fuzzy-попадания
+    exact: bool
+    budgets: Tuple[int, int]  # бюджеты правок для запроса и варианта без пробелов
+    results: List[str]
+
+
+def _extends(keys: List[str], previous: List[str]) -> bool:
+    """Продолжает ли каждый ключ запроса соответствующий ключ предыдущего нажатия."""
+    return all(key.startswith(prev) for key, prev in zip(keys, previous))
+
+
+class SearchSession:
+    """Состояние одной сессии ввода: стек префиксов с их кандидатами."""
+
+    def __init__(self, product_names: List[str], index: PrefixIndex, stats: Counter | None = None):
+        self.product_names = product_names
+        self.index = index
+        self.stats = stats if stats is not None else Counter()
+        self._stack: List[_Step] = []
+
+    def search(self, query: str) -> List[str]:
+        """Тот же результат, что prefix_search(), но с переиспользованием прошлого нажатия."""
+        keys = query_keys(query)
+        norm_query, norm_query_ns = keys[0], keys[1]
+        if not norm_query:
+            self.reset()
+            return []
+
+        # Backspace / правка: снимаем префиксы, которые запрос больше не продолжает
+        while self._stack and not _extends(keys, self._stack[-1].keys):
+            self._stack.pop()
+
+        if self._stack and self._stack[-1].keys == keys:
+            self.stats["cached"] += 1
+            return self._stack[-1].results
+
+        budgets = (max_edits_for(norm_query), max_edits_for(norm_query_ns))
+        previous = self._stack[-1] if self._stack else None
+
+        if previous is not None and previous.exact:
+            # Продолжение точного префикса: фильтруем только выжившие кандидаты
+            distinct_keys = set(keys)
+            ids = [i for i in previous.ids if any(self.index.matches(i, key) for key in distinct_keys)]
+        elif previous is not None:
+            # Точных совпадений не было и у более короткого префикса, значит нет и сейчас
+            ids = []
+        else:
+            found = set()
+            for key in set(keys):
+                found |= self.index.lookup(key)
+            ids = sorted(found)
+
+        if ids:
+            self.stats["incremental" if previous is not None else "full"] += 1
+            entry = _Step(keys, ids, True, budgets, sorted(self.product_names[i] for i in ids))
+        else:
+            self.stats["fuzzy"] += 1
+            # Сужать можно только fuzzy-набор с теми же бюджетами; после точного шага — полный fuzzy
+            narrow = previous is not None and not previous.exact and previous.budgets == budgets
+            self.stats["incremental" if narrow else "full"] += 1
+            distances = fuzzy_prefix_ids(norm_query, self.index, previous.ids if narrow else None)
+            entry = _Step(keys, list(distances), False, budgets, rank_fuzzy(self.product_names, distances))
+
+        self._stack.append(entry)
+        return entry.results
+
+    def reset(self) -> None:
+        self._stack.clear()
+
+
+class SessionManager:
+    """Сессии по session_id с LRU-вытеснением и общей статистикой попаданий."""
+
+    def __init__(self, product_names: List[str], index: PrefixIndex, max_sessions: int = 10000):
+        self.product_names = product_names
+        self.index = index
+        self.max_sessions = max_sessions
+        self.stats: Counter = Counter()
+        self._sessions: OrderedDict[str, SearchSession] = OrderedDict()
+
+    def search(self, session_id: str, query: str) -> List[str]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = SearchSession(self.product_names, self.index, self.stats)
+            self._sessions[session_id] = session
+            if len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        return session.search(query)
+
+    def close(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+
+    def report(self) -> Dict[str, float]:
+        """Счётчики путей и доля нажатий, обслуженных без полного поиска (точного или fuzzy)."""
+        total = self.stats["incremental"] + self.stats["cached"] + self.stats["full"]
+        reused = self.stats["incremental"] + self.stats["cached"]
+        return {
+            "keystrokes": total,
+            "incremental": self.stats["incremental"],
+            "cached": self.stats["cached"],
+            "full": self.stats["full"],
+            "fuzzy": self.stats["fuzzy"],
+            "incremental_hit_ratio": reused / total if total else 0.0,
+            "active_sessions": len(self._sessions),
+        }
+
+
+def keystrokes(query: str) -> List[str]:
+    """Последовательность ввода запроса по одному символу."""
+    return [query[:i] for i in range(1, len(query) + 1)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay queries keystroke by keystroke through search sessions")
+    parser.add_argument("--catalog", default="data/catalog_products.xml", help="Path to the XML catalog")
+    parser.add_argument("--queries", default="data/prefix_queries.csv", help="CSV with queries")
+    args = parser.parse_args()
+
+    product_names = load_product_names(args.catalog)
+    index = build_prefix_index(product_names)
+    with Path(args.queries).open(newline="", encoding="utf-8") as src:
+        queries = [row["query"] for row in csv.DictReader(src)]
+
+    manager = SessionManager(product_names, index)
+    session_ms = scratch_ms = 0.0
+    for n, query in enumerate(queries):
+        for typed in keystrokes(query):
+            start = time.perf_counter()
+            incremental = manager.search(f"s{n}", typed)
+            session_ms += (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            scratch = prefix_search(product_names, typed, index)
+            scratch_ms += (time.perf_counter() - start) * 1000
+            if incremental != scratch:
+                print(f"Mismatch for '{typed}'")
+
+    report = manager.report()
+    print(f"Keystrokes: {report['keystrokes']}, incremental {report['incremental']}, "
+          f"cached {report['cached']}, full {report['full']} (fuzzy {report['fuzzy']})")
+    print(f"Incremental hit ratio: {report['incremental_hit_ratio']:.1%}")
+    print(f"Session total {session_ms:.1f} ms vs from scratch {scratch_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""Стабильный хеш текста без тяжёлых зависимостей.
+
+Общий для embedding_cache (ключ вектора) и prefix_table (слот префикса):
+prefix_table читают процессы, которым не нужны ни numpy, ни клиенты ES и модели.
+"""
+from __future__ import annotations
+
+import hashlib
+
+
+def text_key(text: str) -> int:
+    """Стабильный между процессами 64-битный хеш текста."""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
@@ -0,0 +1,133 @@
+"""Общие таблицы раскладки и транслитерации для индекса и запроса.
+
+Все преобразования — предкомпилированные таблицы str.maketrans, так что вариант
+строки строится одним вызовом str.translate, а не генератором по символам.
+Индекс (load_catalog.py, main.py, local_search.py) и запрос (evaluate.py) строят
+варианты одной функцией normalized_variants, поэтому они совпадают и по
+таблицам, и по нормализации.
+"""
+from __future__ import annotations
+
+import re
+from typing import Dict, List
+
+from normalize import normalize_text
+
+# Ошибка раскладки: латинские клавиши -> русские символы (включая пунктуационные клавиши)
+LAT_TO_RU_KEYMAP = {
+    'a': 'ф', 'b': 'и', 'c': 'с', 'd': 'в', 'e': 'у', 'f': 'а', 'g': 'п', 'h': 'р', 'i': 'ш', 'j': 'о',
+    'k': 'л', 'l': 'д', 'm': 'ь', 'n': 'т', 'o': 'щ', 'p': 'з', 'q': 'й', 'r': 'к', 's': 'ы', 't': 'е',
+    'u': 'г', 'v': 'м', 'w': 'ц', 'x': 'ч', 'y': 'н', 'z': 'я', ';': 'ж', "'": 'э', ',': 'б', '.': 'ю',
+    '/': '.', '[': 'х', ']': 'ъ', '`': 'ё',
+}
+RU_TO_LAT_KEYMAP = {v: k for k, v in LAT_TO_RU_KEYMAP.items() if v != k}
+
+# Фонетическая транслитерация (упрощённая, без диграфов на латинской стороне)
+RU_TO_LAT_PHONETIC = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+LAT_TO_RU_PHONETIC = {
+    'a': 'а', 'b': 'б', 'c': 'к', 'd': 'д', 'e': 'е', 'f': 'ф', 'g': 'г', 'h': 'х', 'i': 'и',
+    'j': 'дж', 'k': 'к', 'l': 'л', 'm': 'м', 'n': 'н', 'o': 'о', 'p': 'п', 'q': 'к', 'r': 'р',
+    's': 'с', 't': 'т', 'u': 'у', 'v': 'в', 'w': 'в', 'x': 'кс', 'y': 'и', 'z': 'з',
+}
+
+# Брендовые пары, которые побуквенно не выводятся. Правило отбора: строки сайта 5631
+# в PREFIX_EXPANSIONS_20251027.json (expansions и zero_expansions), где русское слово
+# orig в той же позиции search заменено латинским написанием того же бренда или
+# слова — не дополнением префикса ('амер' -> 'americano' не берём). Если у слова
+# несколько латинских написаний, берётся самое частое по freq/zero_freq:
+# 'чоко' -> 'choco' (4) против 'choko' (3). Слова вне пар в search не проверяются
+# ('семечки' -> 'n' — сдвиг слов, а не пара). tests/test_translit.py сверяет с файлом.
+TRANSLIT_PAIRS = {
+    'холс': 'halls',
+    'хохланд': 'hochland',
+    'вискас': 'whiskas',
+    'сникерс': 'snickers',
+    'эвервес': 'evervess',
+    'рич': 'rich',
+    'чаппи': 'chappi',
+    'рафаэлло': 'raffaello',
+    'чупа': 'chupa',
+    'бондюэль': 'bonduelle',
+    'флэш': 'flash',
+    'чоко': 'choco',
+    'шеба': 'sheba',
+    'шлиц': 'schlitz',
+    'киндер': 'kinder',
+    'макфа': 'makfa',
+    'гараж': 'garage',
+    'литл': 'little',
+    'энерджи': 'energy',
+    'драйв': 'drive',
+    'фреш': 'fresh',
+    'сендвич': 'sandwich',
+    'фрэш': 'fresh',
+    'чупс': 'chups',
+    'евервес': 'evervess',
+    'акбар': 'akbar',
+    'мелиса': 'melissa',
+    'аперитив': 'aperitive',
+}
+# Для латинского слова с несколькими русскими написаниями ('fresh': 'фреш', 'фрэш') — первое
+_PAIRS_BOTH_WAYS: Dict[str, str] = {**{lat: ru for ru, lat in reversed(TRANSLIT_PAIRS.items())}, **TRANSLIT_PAIRS}
+
+_LAT_TO_RU_TABLE = str.maketrans(LAT_TO_RU_KEYMAP)
+_RU_TO_LAT_TABLE = str.maketrans(RU_TO_LAT_KEYMAP)
+_RU_TO_LAT_PHONETIC_TABLE = str.maketrans(RU_TO_LAT_PHONETIC)
+_LAT_TO_RU_PHONETIC_TABLE = str.maketrans(LAT_TO_RU_PHONETIC)
+_WORD_RE = re.compile(r'\w+')
+
+
+def lat_to_ru_keymap(text: str) -> str:
+    """Translit latin to ru via keyboard map."""
+    return text.translate(_LAT_TO_RU_TABLE)
+
+
+def ru_to_lat_keymap(text: str) -> str:
+    """Translit ru to latin via keyboard map."""
+    return text.translate(_RU_TO_LAT_TABLE)
+
+
+def ru_to_lat_phonetic(text: str) -> str:
+    return text.translate(_RU_TO_LAT_PHONETIC_TABLE)
+
+
+def lat_to_ru_phonetic(text: str) -> str:
+    return text.translate(_LAT_TO_RU_PHONETIC_TABLE)
+
+
+def replace_translit_pairs(text: str) -> str:
+    """Заменяет целые слова по TRANSLIT_PAIRS в обе стороны: 'холс' <-> 'halls'."""
+    return _WORD_RE.sub(lambda m: _PAIRS_BOTH_WAYS.get(m.group(), m.group()), text)
+
+
+def generate_translit_variants(text: str) -> List[str]:
+    """Раскладочные, фонетические и брендовые варианты строки (включая её саму).
+
+    Для запроса передавайте текст до удаления пунктуации: клавиши ';', '[', ','
+    дают 'ж', 'х', 'б', и после normalize_text их уже не восстановить.
+    """
+    return list(dict.fromkeys([
+        text,
+        lat_to_ru_keymap(text),
+        ru_to_lat_keymap(text),
+        ru_to_lat_phonetic(text),
+        lat_to_ru_phonetic(text),
+        replace_translit_pairs(text),
+    ]))
+
+
+def normalized_variants(text: str) -> List[str]:
+    """generate_translit_variants, каждый вариант через normalize_text; без повторов и пустых.
+
+    Одна функция для индекса и запроса: раскладка даёт ',', '.', ';', фонетика —
+    ничего лишнего, но без повторной нормализации стороны расходились.
+    Запрос передаётся сырым (lower), название — уже нормализованным; ё -> е
+    заранее, иначе раскладка 'чёрный' у запроса и 'черный' у названия разная.
+    """
+    variants = generate_translit_variants(text.replace("ё", "е"))
+    return [v for v in dict.fromkeys(normalize_text(v) for v in variants) if v]
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""Квантованное int8-хранилище эмбеддингов товаров для kNN-части гибридного поиска.
+
+Хранилище — симлинк на каталог версии <имя>.v<время> (смена версии — одна
+замена симлинка), в каталоге:
+- codes.i8    — int8-коды векторов (N x dim), симметричная квантизация по строке:
+                v ≈ scale * code, |code| <= 127; в 4 раза меньше float32;
+- scales.f32  — масштаб каждой строки;
+- vectors.f32 — исходные нормированные float32-векторы, нужны только для
+                точного пересчёта кандидатов;
+- ids.json, meta.json — id товаров по строкам и параметры (модель, размерность).
+
+Все массивы открываются через memory map. Поиск идёт в два шага, как
+k/num_candidates в ES: приближённые скоры по int8-кодам блоками, затем
+num_candidates лучших пересчитываются точно по vectors.f32 — из float-файла
+читаются только эти строки, поэтому в памяти постоянно живут лишь коды.
+
+python tools/vector_store.py build data/catalog_products.xml --output .cache/vectors
+python tools/vector_store.py recall .cache/vectors --queries data/prefix_queries.csv --k 20
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from clients import EMBEDDING_CACHE_DIR, MODEL_NAME, embedding_dims
+
+DEFAULT_STORE_DIR = ".cache/vectors"
+DEFAULT_K = 20
+DEFAULT_NUM_CANDIDATES = 100  # как knn.num_candidates в evaluate.build_es_query
+SCAN_BLOCK = 2048  # строк int8 на один проход: float32-копия блока остаётся в кеше CPU
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(int8-коды, масштабы строк) для нормированных векторов."""
+    scales = np.max(np.abs(vectors), axis=1) / 127.0
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+class VectorStoreWriter:
+    """Потоковая запись хранилища в новый каталог <path>.v<время>; publish() переключает на него симлинк path."""
+
+    def __init__(self, path: Union[str, Path], dims: Optional[int] = None, model_name: str = MODEL_NAME):
+        self.path = Path(path)
+        self.dims = dims
+        self.model_name = model_name
+        self.version_path = self.path.with_name(f"{self.path.name}.v{time.time_ns()}")
+        self.version_path.mkdir(parents=True)
+        self._codes = (self.version_path / "codes.i8").open("wb")
+        self._scales = (self.version_path / "scales.f32").open("wb")
+        self._vectors = (self.version_path / "vectors.f32").open("wb")
+        self.ids: List[str] = []
+
+    def add(self, ids: Sequence[str], vectors) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dims is None:  # размерность — как у первого батча энкодера
+            self.dims = vectors.shape[-1]
+        vectors = normalize_rows(vectors.reshape(len(ids), self.dims))
+        codes, scales = quantize(vectors)
+        self._codes.write(codes.tobytes())
+        self._scales.write(scales.tobytes())
+        self._vectors.write(vectors.tobytes())
+        self.ids.extend(ids)
+
+    def close(self, publish: bool = True) -> "VectorStore":
+        """Дописывает ids/meta; без publish хранилище готово, но path на него ещё не указывает."""
+        for f in (self._codes, self._scales, self._vectors):
+            f.close()
+        (self.version_path / "ids.json").write_text(json.dumps(self.ids, ensure_ascii=False), encoding="utf-8")
+        meta = {"model": self.model_name, "dims": self.dims or embedding_dims(), "count": len(self.ids), "quantization": "int8"}
+        (self.version_path / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+        if publish:
+            return self.publish()
+        return VectorStore(self.version_path, self.model_name)
+
+    def publish(self) -> "VectorStore":
+        """Переключает симлинк path на записанный каталог одной os.replace: path существует всё время.
+
+        Предыдущая версия остаётся для читателей, открывших её до переключения,
+        более старые удаляются.
+        """
+        previous = os.readlink(self.path) if self.path.is_symlink() else None
+        if self.path.is_dir() and previous is None:
+            # Хранилище старого формата — обычный каталог: его симлинком не заменить
+            os.replace(self.path, self.path.with_name(self.path.name + ".v0"))
+            previous = self.path.name + ".v0"
+        link = self.path.with_name(self.path.name + ".link")
+        link.unlink(missing_ok=True)
+        os.symlink(self.version_path.name, link)
+        os.replace(link, self.path)
+        for stale in self.path.parent.glob(f"{self.path.name}.v*"):
+            if stale.name not in (previous, self.version_path.name):
+                shutil.rmtree(stale, ignore_errors=True)
+        return VectorStore(self.path, self.model_name)
+
+    def abort(self) -> None:
+        for f in (self._codes, self._scales, self._vectors):
+            f.close()
+        shutil.rmtree(self.version_path, ignore_errors=True)
+
+
+class VectorStore:
+    """Поиск ближайших по косинусу: int8-скан всех строк + точный пересчёт кандидатов."""
+
+    def __init__(self, path: Union[str, Path], model_name: Optional[str] = MODEL_NAME):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        if model_name and self.meta["model"] != model_name:
+            raise ValueError(f"Vector store {self.path} was built with {self.meta['model']}, not {model_name}")
+        self.dims = self.meta["dims"]
+        self.ids: List[str] = json.loads((self.path / "ids.json").read_text(encoding="utf-8"))
+        n = len(self.ids)
+        self.codes = self._map("codes.i8", np.int8, (n, self.dims))
+        self.scales = self._map("scales.f32", np.float32, (n,))
+        self.vectors = self._map("vectors.f32", np.float32, (n, self.dims))
+        self.row_of: Dict[str, int] = {doc_id: row for row, doc_id in enumerate(self.ids)}
+
+    def _map(self, name: str, dtype, shape: Tuple[int, ...]) -> np.ndarray:
+        if not shape[0]:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(self.path / name, dtype=dtype, mode="r", shape=shape)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """Сколько весит постоянно читаемая часть (коды + масштабы) против полного float32."""
+        return {"int8": self.codes.nbytes + self.scales.nbytes, "float32": self.vectors.nbytes}
+
+    def approximate_scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """cos(query, v) по int8-кодам для всех строк или только для rows (по возрастанию)."""
+        if rows is not None:
+            scores = np.empty(len(rows), dtype=np.float32)
+            for start in range(0, len(rows), SCAN_BLOCK):
+                block = rows[start:start + SCAN_BLOCK]
+                scores[start:start + len(block)] = (self.codes[block].astype(np.float32) @ query) * self.scales[block]
+            return scores
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SCAN_BLOCK):
+            block = self.codes[start:start + SCAN_BLOCK]
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+        return scores * self.scales
+
+    def search(
+        self,
+        query,
+        k: int = DEFAULT_K,
+        num_candidates: int = DEFAULT_NUM_CANDIDATES,
+        rescore: bool = True,
+        rows: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """(строки, cos) k ближайших по убыванию; rescore=False — без точного пересчёта.
+
+        rows — искать только среди этих строк (по возрастанию), как filter в knn ES:
+        фильтр до отбора кандидатов, а не после.
+        """
+        query = normalize_rows(query)
+        approx = self.approximate_scores(query, rows)
+        k = min(k, len(approx))
+        if not k:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = _top(approx, max(k, min(num_candidates, len(approx))))
+        candidates = top if rows is None else rows[top]
+        if rescore:
+            ordered = np.sort(candidates)  # последовательное чтение строк memmap
+            exact = self.vectors[ordered] @ query
+            order = np.argsort(-exact, kind="stable")[:k]
+            return ordered[order], exact[order]
+        order = np.argsort(-approx[top], kind="stable")[:k]
+        return candidates[order], approx[top][order]
+
+    def exact_search(self, query, k: int = DEFAULT_K) -> Tuple[np.ndarray, np.ndarray]:
+        """Точный перебор по float32 — эталон для recall@k."""
+        query = normalize_rows(query)
+        scores = np.asarray(self.vectors @ query, dtype=np.float32)
+        top = _top(scores, min(k, len(self)))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return top, scores[top]
+
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    if k >= len(scores):
+        return np.arange(len(scores))
+    return np.argpartition(-scores, k - 1)[:k]
+
+
+def build_store(
+    items: Iterable[Tuple[str, str]],
+    output: Union[str, Path] = DEFAULT_STORE_DIR,
+    encoder=None,
+    batch_size: int = 256,
+) -> VectorStore:
+    """Кодирует (id, текст эмбеддинга) батчами и пишет хранилище в output."""
+    from bulk_indexer import batched
+    if encoder is None:
+        from clients import get_encoder
+        encoder = get_encoder(EMBEDDING_CACHE_DIR)
+    writer = VectorStoreWriter(output)
+    try:
+        for batch in batched(items, batch_size):
+            vectors = encoder.encode([text for _, text in batch], batch_size=batch_size, show_progress_bar=False)
+            writer.add([doc_id for doc_id, _ in batch], vectors)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+def recall_at_k(
+    store: VectorStore,
+    queries: np.ndarray,
+    k: int = DEFAULT_K,
+    num_candidates: int = DEFAULT_NUM_CANDIDATES,
+) -> Dict[str, float]:
+    """recall@k int8-поиска без пересчёта и с пересчётом относительно точного float32-перебора.
+
+    Найденный сосед засчитывается, если его точный cos не ниже k-го точного: при
+    равных скорах любой из них — правильный ответ.
+    """
+    found = {"int8": 0, "int8_rescored": 0}
+    elapsed = {"exact": 0.0, "int8": 0.0, "int8_rescored": 0.0}
+    expected_total = 0
+    for query in queries:
+        t0 = time.perf_counter()
+        expected, expected_scores = store.exact_search(query, k)
+        t1 = time.perf_counter()
+        approx, _ = store.search(query, k, num_candidates, rescore=False)
+        t2 = time.perf_counter()
+        rescored, _ = store.search(query, k, num_candidates, rescore=True)
+        t3 = time.perf_counter()
+        threshold = expected_scores[-1] - 1e-6 if len(expected) else np.inf
+        expected_total += len(expected)
+        found["int8"] += int(np.count_nonzero(store.vectors[np.sort(approx)] @ query >= threshold))
+        found["int8_rescored"] += int(np.count_nonzero(store.vectors[np.sort(rescored)] @ query >= threshold))
+        elapsed["exact"] += t1 - t0
+        elapsed["int8"] += t2 - t1
+        elapsed["int8_rescored"] += t3 - t2
+    n = max(len(queries), 1)
+    memory = store.memory_bytes()
+    return {
+        "queries": len(queries),
+        "k": k,
+        "num_candidates": num_candidates,
+        "recall_int8": found["int8"] / expected_total if expected_total else 0.0,
+        "recall_int8_rescored": found["int8_rescored"] / expected_total if expected_total else 0.0,
+        "mean_ms_exact": round(elapsed["exact"] / n * 1000, 3),
+        "mean_ms_int8": round(elapsed["int8"] / n * 1000, 3),
+        "mean_ms_int8_rescored": round(elapsed["int8_rescored"] / n * 1000, 3),
+        "resident_mb_int8": round(memory["int8"] / 1024 / 1024, 2),
+        "resident_mb_float32": round(memory["float32"] / 1024 / 1024, 2),
+    }
+
+
+def catalog_texts(catalog: Union[str, Path]) -> Iterable[Tuple[str, str]]:
+    """(id, текст эмбеддинга) — тот же текст, что load_catalog.product_docs."""
+    from catalog_reader import iter_products
+    for product in iter_products(catalog):
+        if product.name:
+            yield product.id, f"{product.norm_name} {product.description}"
+
+
+def read_queries(path: Union[str, Path]) -> List[str]:
+    with Path(path).open(newline="", encoding="utf-8") as f:
+        return [row["query"] for row in csv.DictReader(f) if row.get("query")]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build or evaluate the int8 memory-mapped vector store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Encode the catalog into a vector store")
+    build.add_argument("catalog", nargs="?", default="data/catalog_products.xml", help="Path to the XML catalog")
+    build.add_argument("--output", default=DEFAULT_STORE_DIR, help="Store directory")
+    build.add_argument("--encode-batch", type=int, default=256, help="Texts per model.encode call")
+    recall = sub.add_parser("recall", help="Report recall@k of int8 search against exact float32 search")
+    recall.add_argument("store", nargs="?", default=DEFAULT_STORE_DIR, help="Store directory")
+    recall.add_argument("--queries", default="data/prefix_queries.csv", help="CSV with a 'query' column")
+    recall.add_argument("--k", type=int, default=DEFAULT_K, help="Neighbours per query")
+    recall.add_argument("--num-candidates", type=int, default=DEFAULT_NUM_CANDIDATES, help="int8 candidates rescored exactly")
+    recall.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        started = time.perf_counter()
+        store = build_store(catalog_texts(args.catalog), args.output, batch_size=args.encode_batch)
+        memory = store.memory_bytes()
+        print(f"Wrote {len(store)} vectors to {store.path} in {time.perf_counter() - started:.1f}s "
+              f"(int8 {memory['int8'] / 1024 / 1024:.2f} MB, float32 {memory['float32'] / 1024 / 1024:.2f} MB).")
+        return
+
+    from evaluate import query_encoder
+    from normalize import normalize_query
+    store = VectorStore(args.store)
+    texts = [normalize_query(q) for q in read_queries(args.queries)]
+    queries = normalize_rows(query_encoder().encode(texts, show_progress_bar=False))
+    report = recall_at_k(store, queries, args.k, args.num_candidates)
+    print(f"{report['queries']} queries, {len(store)} vectors, k={report['k']}, num_candidates={report['num_candidates']}")
+    print(f"  recall@{args.k}: int8 {report['recall_int8']:.4f}, int8 + rescore {report['recall_int8_rescored']:.4f}")
+    print(f"  mean latency: exact {report['mean_ms_exact']:.3f} ms, int8 {report['mean_ms_int8']:.3f} ms, "
+          f"int8 + rescore {report['mean_ms_int8_rescored']:.3f} ms")
+    print(f"  resident vectors: int8 {report['resident_mb_int8']:.2f} MB vs float32 {report['resident_mb_float32']:.2f} MB")
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""Seeded load generator that replays the production traffic shape.
+
+Запросы сэмплируются по сайтам и частотам из выгрузок 20251027:
+- доля сайта — total_queries из PREFIX_SHORT_STATS;
+- внутри сайта смесь видов: short (short_terms, доля short_ratio), zero
+  (zero_expansions и ZERO_EXPANSION_BACKLOG, доля overall_zero_ratio),
+  expansion и rewrite (top_expansions / expansions / top_rewrites) — по
+  суммарной частоте;
+- внутри вида — пропорционально freq, поэтому перекос 2056/6321 сохраняется.
+
+Часть запросов набирается посимвольно (сессии ввода), как на мобильном
+поиске. Одинаковый --seed даёт одинаковую нагрузку, её можно сохранить в NDJSON
+и прогнать через ES или локальный префиксный индекс с заданным QPS.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import random
+import threading
+import time
+from bisect import bisect
+from collections import Counter
+from itertools import accumulate
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+from load_runner import DEFAULT_WORKERS, StageTimings, print_report, run_load
+
+DEFAULT_SEARCH_STATS = "data/PREFIX_SEARCH_STATS_20251027.json"
+DEFAULT_EXPANSIONS = "data/PREFIX_EXPANSIONS_20251027.json"
+DEFAULT_SHORT_STATS = "data/PREFIX_SHORT_STATS_20251027.json"
+DEFAULT_ZERO_BACKLOG = "data/PREFIX_ZERO_EXPANSION_BACKLOG_20251027.csv"
+KINDS = ("short", "expansion", "rewrite", "zero")
+
+
+class Request(NamedTuple):
+    query: str
+    site: str
+    session: str
+    kind: str
+
+
+class _Weighted:
+    """Выбор по весам за O(log n) через накопленные суммы."""
+
+    def __init__(self, items: Dict[str, float]):
+        self.items = list(items)
+        self.cumulative = list(accumulate(items.values()))
+
+    @property
+    def total(self) -> float:
+        return self.cumulative[-1] if self.cumulative else 0.0
+
+    def pick(self, rng: random.Random) -> str:
+        return self.items[bisect(self.cumulative, rng.random() * self.total)]
+
+
+def _int(value) -> int:
+    return int(value or 0)
+
+
+def _add(pool: Dict[str, float], query: str, freq: int) -> None:
+    query = query.strip()
+    if query and freq > 0:
+        pool[query] = max(pool.get(query, 0), freq)
+
+
+def load_pools(
+    search_stats: str = DEFAULT_SEARCH_STATS,
+    expansions: str = DEFAULT_EXPANSIONS,
+    short_stats: str = DEFAULT_SHORT_STATS,
+    zero_backlog: str = DEFAULT_ZERO_BACKLOG,
+) -> Tuple[Dict[str, float], Dict[str, Dict[str, Dict[str, float]]], Dict[str, Dict[str, float]]]:
+    """(вес сайта, {сайт: {вид: {запрос: частота}}}, {сайт: доли short/zero})."""
+    with Path(search_stats).open(encoding="utf-8") as f:
+        stats = json.load(f)
+    with Path(expansions).open(encoding="utf-8") as f:
+        exported = json.load(f)
+    with Path(short_stats).open(encoding="utf-8") as f:
+        short = {str(row["site_id"]): row for row in json.load(f)}
+
+    sites = sorted(set(stats) | set(short))
+    pools: Dict[str, Dict[str, Dict[str, float]]] = {site: {kind: {} for kind in KINDS} for site in sites}
+    for site, site_stats in stats.items():
+        for row in site_stats.get("short_terms", []):
+            _add(pools[site]["short"], row["term"], _int(row["freq"]))
+        for row in site_stats.get("top_expansions", []):
+            _add(pools[site]["expansion"], row["original"], _int(row["freq"]))
+        for row in site_stats.get("top_rewrites", []):
+            _add(pools[site]["rewrite"], row["original"], _int(row["freq"]))
+    for site, rows in exported.get("expansions", {}).items():
+        for row in rows:
+            _add(pools.setdefault(site, {kind: {} for kind in KINDS})["expansion"], row["orig"], _int(row["freq"]))
+    for site, rows in exported.get("zero_expansions", {}).items():
+        for row in rows:
+            _add(pools.setdefault(site, {kind: {} for kind in KINDS})["zero"], row["orig"], _int(row["zero_freq"]))
+    if Path(zero_backlog).exists():
+        with Path(zero_backlog).open(newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                site = row["site_id"]
+                if site in pools:
+                    _add(pools[site]["zero"], row["original_term"], _int(row["zero_hits"]))
+
+    site_weights: Dict[str, float] = {}
+    ratios: Dict[str, Dict[str, float]] = {}
+    for site in pools:
+        row = short.get(site, {})
+        total = row.get("total_queries") or _int(stats.get(site, {}).get("aggregate", {}).get("total"))
+        if total and any(pools[site].values()):
+            site_weights[site] = float(total)
+            ratios[site] = {"short": row.get("short_ratio", 0.0), "zero": row.get("overall_zero_ratio", 0.0)}
+    return site_weights, pools, ratios
+
+
+def kind_weights(pools: Dict[str, Dict[str, float]], ratios: Dict[str, float]) -> Dict[str, float]:
+    """Доли видов на сайте: short и zero по статистике, остаток делят expansion/rewrite по суммарной частоте."""
+    weights = {kind: 0.0 for kind in KINDS}
+    if pools["short"]:
+        weights["short"] = ratios["short"]
+    if pools["zero"]:
+        weights["zero"] = ratios["zero"]
+    rest = max(0.0, 1.0 - weights["short"] - weights["zero"])
+    mass = {kind: sum(pools[kind].values()) for kind in ("expansion", "rewrite")}
+    if sum(mass.values()):
+        for kind, value in mass.items():
+            weights[kind] = rest * value / sum(mass.values())
+    elif pools["short"]:
+        weights["short"] += rest  # у сайта 221 только short_terms
+    return {kind: w for kind, w in weights.items() if w > 0 and pools[kind]}
+
+
+def typing_session(query: str, rng: random.Random, min_chars: int, keep: float) -> List[str]:
+    """Префиксы, которые уходят в поиск при наборе query; часть промежуточных съедает debounce."""
+    prefixes = [query[:i] for i in range(min(min_chars, len(query)), len(query))]
+    return [p for p in prefixes if p.strip() and rng.random() < keep] + [query]
+
+
+class Workload:
+    """Детерминированный по seed генератор запросов."""
+
+    def __init__(self, site_weights, pools, ratios, seed: int = 42,
+                 typing_ratio: float = 0.5, min_chars: int = 2, keystroke_keep: float = 0.7):
+        self.seed = seed
+        self.typing_ratio = typing_ratio
+        self.min_chars = min_chars
+        self.keystroke_keep = keystroke_keep
+        self.sites = _Weighted(site_weights)
+        self.kinds = {site: _Weighted(kind_weights(pools[site], ratios[site])) for site in site_weights}
+        self.queries = {site: {kind: _Weighted(pool) for kind, pool in pools[site].items() if pool}
+                        for site in site_weights}
+
+    def generate(self, total: int) -> Iterator[Request]:
+        """Ровно total запросов; последняя сессия ввода обрезается."""
+        rng = random.Random(self.seed)
+        emitted = session_no = 0
+        while emitted < total:
+            site = self.sites.pick(rng)
+            kind = self.kinds[site].pick(rng)
+            query = self.queries[site][kind].pick(rng)
+            session = f"{self.seed}-{session_no}"
+            session_no += 1
+            typed = (typing_session(query, rng, self.min_chars, self.keystroke_keep)
+                     if rng.random() < self.typing_ratio else [query])
+            for text in typed[:total - emitted]:
+                yield Request(text, site, session, kind)
+                emitted += 1
+
+
+def save(requests: List[Request], path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as f:
+        for request in requests:
+            f.write(json.dumps(request._asdict(), ensure_ascii=False) + "\n")
+
+
+def load(path: Path) -> List[Request]:
+    with path.open(encoding="utf-8") as f:
+        return [Request(**json.loads(line)) for line in f if line.strip()]
+
+
+def describe(requests: List[Request]) -> Dict[str, object]:
+    """Форма нагрузки: доли сайтов и видов, уникальность, доля топ-10 запросов."""
+    queries = Counter(r.query for r in requests)
+    top10 = sum(count for _, count in queries.most_common(10))
+    return {
+        "requests": len(requests),
+        "sessions": len({r.session for r in requests}),
+        "unique_queries": len(queries),
+        "top10_share": round(top10 / len(requests), 4) if requests else 0.0,
+        "sites": dict(Counter(r.site for r in requests).most_common()),
+        "kinds": dict(Counter(r.kind for r in requests).most_common()),
+    }
+
+
+def local_backend(catalog: str):
+    """search(query, site, session, kind, timings) по локальному префиксному индексу с сессиями ввода."""
+    from main import build_prefix_index, load_product_names
+    from search_session import SessionManager
+
+    product_names = load_product_names(catalog)
+    manager = SessionManager(product_names, build_prefix_index(product_names))
+    lock = threading.Lock()  # SessionManager не потокобезопасен
+
+    def search(query: str, site: str, session: str, kind: str, timings: StageTimings) -> List[str]:
+        with lock:
+            started = time.perf_counter_ns()
+            found = manager.search(session, query)
+            timings["local"] = time.perf_counter_ns() - started
+        return found
+
+    return search
+
+
+def es_backend(engine: str = "es", catalog: str = "data/catalog_products.xml"):
+    """search(query, site, session, kind, timings) через evaluate.cached_search: ES или тот же запрос в памяти."""
+    import evaluate
+    evaluate.search_backend = evaluate.make_backend(engine, catalog)
+
+    def search(query: str, site: str, session: str, kind: str, timings: StageTimings):
+        return evaluate.cached_search(query, site, timings)
+
+    return search
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate and replay a production-shaped prefix search workload")
+    parser.add_argument("--requests", type=int, default=10000, help="Number of search calls to generate")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed; the same seed gives the same workload")
+    parser.add_argument("--typing-ratio", type=float, default=0.5, help="Share of queries typed keystroke by keystroke")
+    parser.add_argument("--min-chars", type=int, default=2, help="First keystroke that triggers a search")
+    parser.add_argument("--keystroke-keep", type=float, default=0.7, help="Probability an intermediate keystroke is sent")
+    parser.add_argument("--output", help="Save the workload as NDJSON")
+    parser.add_argument("--input", help="Replay a saved NDJSON workload instead of generating one")
+    parser.add_argument("--backend", choices=["none", "local", "es", "hybrid-local"], default="none",
+                        help="local: prefix index sessions; es: Elasticsearch; hybrid-local: the ES query on NumPy")
+    parser.add_argument("--catalog", default="data/catalog_products.xml", help="Catalog for the local backend")
+    parser.add_argument("--qps", type=float, default=0.0, help="Target request rate; 0 runs closed-loop")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Concurrent searches")
+    parser.add_argument("--metrics", default="reports/logs/workload_metrics.json", help="Where to write the run report")
+    args = parser.parse_args()
+
+    if args.input:
+        requests = load(Path(args.input))
+    else:
+        workload = Workload(*load_pools(), seed=args.seed, typing_ratio=args.typing_ratio,
+                            min_chars=args.min_chars, keystroke_keep=args.keystroke_keep)
+        requests = list(workload.generate(args.requests))
+    if args.output:
+        save(requests, Path(args.output))
+        print(f"Workload saved to {args.output}")
+
+    shape = describe(requests)
+    print(f"{shape['requests']} requests in {shape['sessions']} sessions, {shape['unique_queries']} unique, "
+          f"top-10 queries {shape['top10_share']:.1%}")
+    print(f"  sites: {shape['sites']}")
+    print(f"  kinds: {shape['kinds']}")
+    if args.backend == "none":
+        return
+
+    if args.backend == "local":
+        search = local_backend(args.catalog)
+    else:
+        search = es_backend("es" if args.backend == "es" else "local", args.catalog)
+    _, report = run_load(requests, search, workers=args.workers, qps=args.qps, keep_results=False)
+    print_report(report)
+    metrics_path = Path(args.metrics)
+    metrics_path.parent.mkdir(parents=True, exist_ok=True)
+    with metrics_path.open("w", encoding="utf-8") as f:
+        json.dump({"backend": args.backend, "seed": args.seed, "workload": shape, "load": report},
+                  f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()